@@ -5,23 +5,44 @@ import logging
 import threading
 import requests
 from collections import Counter
-from flask import Flask, jsonify
+from flask import Flask, Response, request
 from flask_cors import CORS
+from fast_json import json_response, format_now
+from rate_limit import LoadShedder, expensive_budget
+from llm_prefetch import LLMPrefetcher, PENDING, READY
+from llm_cache import LLMCache
+from circuit_breaker import LLMUnavailable
+from llm_stream import VerdictParser
+from single_flight import SingleFlight
+from snapshot import SnapshotPublisher
+from conditional import ConditionalGet, SessionClock
+from history_query import paginated, query_history
+from event_stream import EventStream, session_backfill
+from ws_hub import WebSocketHub
+from batch_predict import BatchPredictor, BatchBusy, LABELS, parse_batch
+from state_store import StateStore, TimedLock
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
 API_URL = "https://hithu-ddo6.onrender.com/api/hit"
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY", "")
-OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
+OPENROUTER_URL = os.getenv("OPENROUTER_URL", "https://openrouter.ai/api/v1/chat/completions")
 POLL_INTERVAL = 5
 MAX_HISTORY_LEN = 500
 
 app = Flask(__name__)
 CORS(app)
+# Hạn mức request theo client và giới hạn đồng thời: trả 429 trước mọi khóa và model
+rate_limiter = LoadShedder(routes={"/api/predict_batch": expensive_budget()}).install(app)
 app.history = []
 app.session_ids = []
 app.session_details = []
-app.lock = threading.Lock()
+app.lock = TimedLock()  # Khóa của bên ghi, có đo thời gian chờ
+# Bản chụp trạng thái copy-on-write cho các endpoint đọc (không cần app.lock)
+app.state = StateStore()
+
+# Cache phản hồi OpenRouter theo nội dung yêu cầu (model + prompt + tham số)
+llm_cache = LLMCache()
 
 # ------------------------- PATTERN DATA -------------------------
 PATTERN_DATA = {
@@ -172,8 +193,8 @@ def ai_predict(session_details):
         - Xác suất thống kê từ dữ liệu lịch sử
 
         DỰ ĐOÁN:
-        Chỉ trả về một trong hai: "Tài" hoặc "Xỉu"
-        Kèm theo phân tích ngắn gọn (dưới 100 từ)
+        Dòng đầu tiên ghi đúng dạng "Dự đoán: Tài" hoặc "Dự đoán: Xỉu"
+        Sau đó là phân tích ngắn gọn (dưới 100 từ)
         """
 
         headers = {
@@ -193,14 +214,17 @@ def ai_predict(session_details):
             "temperature": 0.3
         }
 
-        response = requests.post(OPENROUTER_URL, headers=headers, json=data, timeout=15)
+        # Stream câu trả lời, đóng kết nối ngay khi đọc được dòng "Dự đoán: ..."
+        response = llm_cache.stream(OPENROUTER_URL, json=data, headers=headers, timeout=15,
+                                    parser_class=VerdictParser)
         
         if response.status_code == 200:
-            result = response.json()
-            ai_response = result["choices"][0]["message"]["content"].strip()
+            ai_response = response.text.strip()
             
             # Phân tích kết quả AI
-            if "Tài" in ai_response and "Xỉu" in ai_response:
+            if response.fields:
+                prediction = response.fields["prediction"]
+            elif "Tài" in ai_response and "Xỉu" in ai_response:
                 # Nếu có cả hai, xem cái nào được đề cập sau (thường là dự đoán cuối)
                 tai_index = ai_response.rfind("Tài")
                 xiu_index = ai_response.rfind("Xỉu")
@@ -219,15 +243,29 @@ def ai_predict(session_details):
                 error_msg += f" - {response.text[:100]}"
             return "Tài", f"[AI] {error_msg}"
 
+    except LLMUnavailable as e:
+        # Mạch ngắt đang mở: dùng ngay pattern cục bộ thay cho AI
+        prediction, reason = pattern_predict(session_details)
+        return prediction, f"[AI] Tạm ngắt ({e}), dùng {reason}"
     except Exception as e:
         logging.error(f"Lỗi AI prediction: {e}")
         return "Tài", f"[AI] Lỗi: {str(e)}"
 
+# Dự đoán AI cho phiên kế tiếp được gọi nền ngay khi poller nạp phiên mới
+# AI trả về thì dựng lại bản chụp của phiên để phản hồi có kết quả AI
+ai_prefetch = LLMPrefetcher(ai_predict, name="ai-prefetch", on_done=lambda sid, slot: republish_prediction(sid))
+
 # ------------------------- COMBINED PREDICTION -------------------------
-def combined_prediction(session_details):
-    """Kết hợp dự đoán từ pattern và AI"""
+def combined_prediction(session_details, ai_slot=None):
+    """Kết hợp dự đoán từ pattern và AI (AI lấy từ ô gọi nền, không chờ OpenRouter)"""
     pattern_pred, pattern_reason = pattern_predict(session_details)
-    ai_pred, ai_reason = ai_predict(session_details)
+    ai_pred, ai_reason = None, "[AI] Chưa cấu hình API key"
+    if OPENROUTER_API_KEY:
+        ai_status = ai_slot["status"] if ai_slot else PENDING
+        if ai_status == READY:
+            ai_pred, ai_reason = ai_slot["result"]
+        else:
+            ai_reason = f"[AI] {ai_status}"
     
     # Đếm số lần Tài/Xỉu gần đây
     recent_results = [s["result"] for s in session_details[:10]]
@@ -251,8 +289,8 @@ def combined_prediction(session_details):
     # Pattern vote
     votes[pattern_pred] += 1
     
-    # AI vote (chỉ tính nếu có API key)
-    if OPENROUTER_API_KEY:
+    # AI vote (chỉ tính khi đã có kết quả từ OpenRouter)
+    if ai_pred:
         votes[ai_pred] += 1
     
     # Trend vote
@@ -270,6 +308,87 @@ def combined_prediction(session_details):
     
     return final_prediction, combined_reason
 
+# Gộp các request đồng thời của cùng một phiên thành một lần tính dự đoán
+prediction_flight = SingleFlight()
+# Các lần công bố dự đoán nối tiếp nhau; không giữ app.lock khi model đang chạy
+publish_lock = threading.Lock()
+
+# Phản hồi /api/hitclub dựng sẵn một lần mỗi phiên
+prediction_snapshots = SnapshotPublisher()
+
+# ETag/Last-Modified cho các endpoint chỉ đổi khi có phiên mới (client đã có bản mới nhất nhận 304)
+conditional = ConditionalGet("taixiu_anhbaocx", SessionClock())
+
+# Luồng SSE /api/stream: mỗi phiên một sự kiện (kết quả + dự đoán phiên kế tiếp)
+session_events = EventStream(backfill=session_backfill(app.state))
+
+# Hub WebSocket (bật bằng WS_PORT, cần gói websockets): client đăng ký sự kiện phiên theo bàn/engine
+ws_hub = WebSocketHub(table=API_URL, engine="taixiu_anhbaocx")
+session_events.add_listener(ws_hub.publish)
+
+# ------------------------- BATCH PREDICTION -------------------------
+# /api/predict_batch: dự đoán cho chuỗi T/X (+ xúc xắc) do client gửi
+# Engine của batch là danh sách phiên riêng (mới nhất trước); batch không gọi AI
+def _batch_feed(details, result, dice):
+    details.insert(0, {"result": LABELS[result], "total": sum(dice) if dice else None})
+
+def _batch_predict(details, sequence):
+    prediction, reason = combined_prediction(details)
+    return prediction, None, reason
+
+batch_predictor = BatchPredictor(list, _batch_feed, _batch_predict)
+
+def publish_prediction():
+    """Tính dự đoán kết hợp cho phiên mới nhất và công bố bản chụp phản hồi"""
+    # Tính trên bản chụp trạng thái đã công bố: poller vẫn nạp phiên trong lúc model chạy tới hạn chót
+    with publish_lock:
+        state = app.state.current
+        current_sid = state.session_ids[-1]
+        current_result = state.history[-1]
+
+        # Ô AI của phiên hiện tại (đặt lịch ngay nếu poller chưa đặt, không chờ kết quả)
+        ai_slot = None
+        if OPENROUTER_API_KEY:
+            ai_slot = ai_prefetch.schedule(current_sid, list(state.session_details))
+
+        prediction, reason = combined_prediction(state.session_details, ai_slot)
+
+        response_data = {
+            "api": "taixiu_anhbaocx",
+            "current_session": current_sid,
+            "current_result": current_result,
+            "next_session": current_sid + 1,
+            "prediction": prediction,
+            "reason": reason
+        }
+
+        # Thêm thông tin AI nếu có API key ("pending" khi OpenRouter chưa trả về)
+        if ai_slot:
+            if ai_slot["status"] == READY:
+                ai_pred, ai_reason = ai_slot["result"]
+            else:
+                ai_pred, ai_reason = PENDING, f"[AI] {ai_slot['status']}"
+            response_data["ai_prediction"] = ai_pred
+            response_data["ai_reason"] = ai_reason
+            response_data["ai_status"] = ai_slot["status"]
+
+    snapshot = prediction_snapshots.publish(current_sid, response_data)
+    # Chỉ lần công bố đầu của phiên thành sự kiện SSE (dựng lại sau khi AI trả về thì bỏ qua)
+    session_events.publish(snapshot.sid, snapshot.compact())
+    return snapshot
+
+def republish_prediction(sid):
+    """Dựng lại bản chụp khi phiên `sid` vẫn là phiên mới nhất"""
+    if app.session_ids and app.session_ids[-1] == sid:
+        publish_prediction()
+
+# ------------------------- APP STATE -------------------------
+def publish_state():
+    """Công bố bản chụp trạng thái mới cho các endpoint đọc (gọi khi đang giữ app.lock)"""
+    app.state.publish(app.history, app.session_ids, app.session_details)
+    if app.session_ids:
+        conditional.clock.tick(app.session_ids[-1])
+
 # ------------------------- POLL API -------------------------
 def poll_api():
     while True:
@@ -301,6 +420,17 @@ def poll_api():
                         app.session_details.pop()
                     logging.info(f"✅ Phiên mới #{sid}: {result} ({total})")
 
+                    # Gọi AI nền cho phiên kế tiếp với bản chụp lịch sử
+                    if OPENROUTER_API_KEY:
+                        ai_prefetch.schedule(sid, list(app.session_details))
+
+                    # Công bố bản chụp trạng thái mới cho các endpoint đọc
+                    publish_state()
+
+            # Tính và công bố dự đoán của phiên mới ngay khi nạp, ngoài app.lock
+            if app.session_ids and app.session_ids[-1] == sid and prediction_snapshots.get(sid) is None:
+                prediction_flight.do(sid, publish_prediction)
+
         except Exception as e:
             logging.error(f"❌ Lỗi API: {e}")
         time.sleep(POLL_INTERVAL)
@@ -311,60 +441,105 @@ from datetime import datetime
 @app.route("/api/hitclub", methods=["GET"])
 def get_prediction():
     try:
-        with app.lock:
-            if not app.history or not app.session_ids or not app.session_details:
-                return jsonify({"error": "Chưa có dữ liệu"}), 500
-
-            current_sid = app.session_ids[-1]
-            current_result = app.history[-1]
-
-            # Sử dụng combined prediction
-            prediction, reason = combined_prediction(app.session_details)
-
-            # 👉 Thêm thời gian hiện tại
-            now_str = datetime.now().strftime("%d/%m/%Y %H:%M:%S")
-
-            response_data = {
-                "api": "taixiu_anhbaocx",
-                "current_time": now_str,
-                "current_session": current_sid,
-                "current_result": current_result,
-                "next_session": current_sid + 1,
-                "prediction": prediction,
-                "reason": reason
-            }
-
-            # Thêm thông tin AI nếu có API key
-            if OPENROUTER_API_KEY:
-                ai_pred, ai_reason = ai_predict(app.session_details)
-                response_data["ai_prediction"] = ai_pred
-                response_data["ai_reason"] = ai_reason
-
-            return jsonify(response_data)
+        # Đọc bản chụp trạng thái hiện tại, không cần app.lock
+        state = app.state.current
+        if not state.history or not state.session_ids or not state.session_details:
+            return json_response({"error": "Chưa có dữ liệu"}), 500
+
+        current_sid = state.session_ids[-1]
+
+        # Bản chụp của phiên hiện tại; chỉ tính khi poller chưa kịp công bố (gộp theo mã phiên)
+        snapshot = prediction_snapshots.get(current_sid)
+        if snapshot is None:
+            snapshot = prediction_flight.do(current_sid, publish_prediction)
+
+        # Client đã có bản chụp này (cùng phiên, cùng lần công bố) thì trả 304, không dựng lại body
+        etag = conditional.etag(snapshot.sid, snapshot.revision, request.query_string.decode())
+        headers = conditional.headers(etag, snapshot.published_at, snapshot.provisional)
+        if conditional.not_modified(request.headers, etag, snapshot.published_at):
+            return Response(status=304, headers=headers)
+
+        # 👉 Thêm thời gian hiện tại
+        now_str = format_now()
+        return Response(snapshot.body(request.args, now_str), mimetype="application/json", headers=headers)
     except Exception as e:
         logging.error(f"❌ Lỗi trong get_prediction: {e}")
-        return jsonify({"error": f"Lỗi máy chủ nội bộ: {str(e)}"}), 500
+        return json_response({"error": f"Lỗi máy chủ nội bộ: {str(e)}"}), 500
+
+@app.route("/api/stream", methods=["GET"])
+def stream_sessions():
+    """Server-Sent Events: một sự kiện mỗi phiên mới, nối lại bằng Last-Event-ID"""
+    # EventSource gửi Last-Event-ID khi tự nối lại; lần kết nối đầu có thể truyền qua ?last_event_id=
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    subscriber = session_events.subscribe(last_event_id)
+    return Response(session_events.iter_events(subscriber), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 @app.route("/api/history", methods=["GET"])
 def get_history():
-    with app.lock:
-        return jsonify({
-            "history": app.history,
-            "session_ids": app.session_ids,
-            "details": app.session_details,
-            "length": len(app.history)
+    state = app.state.current
+    etag = conditional.etag("history", state.version, request.query_string.decode())
+    headers = conditional.headers(etag, state.published_at)
+    if conditional.not_modified(request.headers, etag, state.published_at):
+        return Response(status=304, headers=headers)
+    # Có tham số phân trang/chọn trường thì trả theo trang; không có thì giữ định dạng cũ
+    if paginated(request.args):
+        try:
+            data = query_history(state.session_ids, state.session_details, request.args)
+        except ValueError as e:
+            return json_response({"error": str(e)}), 400
+        response = json_response(data)
+    else:
+        response = json_response({
+            "history": state.history,
+            "session_ids": state.session_ids,
+            "details": state.session_details,
+            "length": len(state.history)
         })
+    response.headers.update(headers)
+    return response
+
+@app.route("/api/predict_batch", methods=["POST"])
+def predict_batch():
+    """Dự đoán hàng loạt cho các chuỗi của client trên engine riêng, không đụng trạng thái live"""
+    try:
+        sequences = parse_batch(request.get_json(silent=True))
+    except ValueError as e:
+        return json_response({"error": str(e)}), 400
+    try:
+        data = batch_predictor.run(sequences)
+    except BatchBusy as e:
+        return json_response({"error": str(e)}), 503
+    data["api"] = "taixiu_anhbaocx"
+    return json_response(data)
 
 @app.route("/api/health", methods=["GET"])
 def health_check():
-    return jsonify({
+    return json_response({
         "status": "healthy",
         "timestamp": datetime.now().isoformat(),
-        "history_count": len(app.history),
-        "ai_configured": bool(OPENROUTER_API_KEY)
+        "history_count": len(app.state.current.history),
+        "ai_configured": bool(OPENROUTER_API_KEY),
+        "ai_prefetch": ai_prefetch.status(),
+        "llm_cache": llm_cache.status(),
+        "llm_breaker": llm_cache.guard.status(),
+        "prediction_flight": prediction_flight.status(),
+        "prediction_snapshot": prediction_snapshots.status(),
+        "app_state": app.state.status(),
+        "conditional_get": conditional.status(),
+        "event_stream": session_events.status(),
+        "ws_hub": ws_hub.status(),
+        "rate_limit": rate_limiter.status(),
+        "batch_predict": batch_predictor.status(),
+        "lock_wait": app.lock.status()
     })
 
-if __name__ == "__main__":
+def start_ingestion():
+    """Khởi động phần nạp dữ liệu (poller, hub WebSocket); khi chạy nhiều worker chỉ leader gọi"""
     threading.Thread(target=poll_api, daemon=True).start()
+    ws_hub.start()
+
+if __name__ == "__main__":
+    start_ingestion()
     port = int(os.getenv("PORT", 9099))
     app.run(host="0.0.0.0", port=port)
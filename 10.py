@@ -5,8 +5,12 @@ import logging
 import threading
 import requests
 from collections import Counter
-from flask import Flask, jsonify
+from flask import Flask, request
 from flask_cors import CORS
+from fast_json import json_response, format_now
+from rate_limit import LoadShedder
+from history_query import paginated, query_history
+from state_store import StateStore
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
@@ -16,11 +20,17 @@ MAX_HISTORY_LEN = 500
 
 app = Flask(__name__)
 CORS(app)
+# Hạn mức request theo client và giới hạn đồng thời: trả 429 trước mọi khóa và model
+rate_limiter = LoadShedder().install(app)
 app.history = []
 app.session_ids = []
 app.session_details = []
 app.lock = threading.Lock()
+# Bản chụp trạng thái copy-on-write cho các endpoint đọc (không cần app.lock)
+app.state = StateStore()
 app.prediction_data = {}  # Lưu trữ dữ liệu cho thuật toán dự đoán
+# du_doan ghi vào app.prediction_data: mỗi lúc một request tính, không chặn poller
+predict_lock = threading.Lock()
 
 # ------------------------- THUẬT TOÁN DỰ ĐOÁN MỚI -------------------------
 def do_ben(data):
@@ -210,6 +220,10 @@ def du_doan(data_kq, dem_sai, pattern_sai, xx, diem_lich_su, data):
 
     return cuoi, 72, "Không rõ mẫu → Theo tay gần nhất"
 
+def publish_state():
+    """Công bố bản chụp trạng thái mới cho các endpoint đọc (gọi khi đang giữ app.lock)"""
+    app.state.publish(app.history, app.session_ids, app.session_details)
+
 # ------------------------- POLL API -------------------------
 def poll_api():
     while True:
@@ -252,36 +266,38 @@ def poll_api():
                         app.session_details.pop()
                     logging.info(f"✅ Phiên mới #{sid}: {result} ({total}) - Xúc xắc: {xuc_xac_1},{xuc_xac_2},{xuc_xac_3}")
 
+                    # Công bố bản chụp trạng thái mới cho các endpoint đọc
+                    publish_state()
+
         except Exception as e:
             logging.error(f"❌ Lỗi API: {e}")
         time.sleep(POLL_INTERVAL)
 
 # ------------------------- ENDPOINT -------------------------
-from datetime import datetime  
-
 @app.route("/api/hitclub", methods=["GET"])
 def get_prediction():
     try:
-        with app.lock:
-            if not app.history or not app.session_ids or not app.session_details:
-                return jsonify({"error": "Chưa có dữ liệu"}), 500
-
-            current_session = app.session_details[0]
-            current_sid = current_session["sid"]
-            current_result = current_session["result"]
-            current_total = current_session["total"]
-            
-            # Lấy thông tin xúc xắc
-            xuc_xac_1 = current_session.get("xuc_xac_1", 0)
-            xuc_xac_2 = current_session.get("xuc_xac_2", 0)
-            xuc_xac_3 = current_session.get("xuc_xac_3", 0)
-            xx_string = f"{xuc_xac_1}-{xuc_xac_2}-{xuc_xac_3}"
-            
-            # Chuẩn bị dữ liệu cho thuật toán
-            data_kq = [s["result"] for s in app.session_details]
-            diem_lich_su = [s["total"] for s in app.session_details]
-            
-            # Gọi thuật toán dự đoán
+        state = app.state.current
+        if not state.history or not state.session_ids or not state.session_details:
+            return json_response({"error": "Chưa có dữ liệu"}), 500
+
+        current_session = state.session_details[0]
+        current_sid = current_session["sid"]
+        current_result = current_session["result"]
+        current_total = current_session["total"]
+        
+        # Lấy thông tin xúc xắc
+        xuc_xac_1 = current_session.get("xuc_xac_1", 0)
+        xuc_xac_2 = current_session.get("xuc_xac_2", 0)
+        xuc_xac_3 = current_session.get("xuc_xac_3", 0)
+        xx_string = f"{xuc_xac_1}-{xuc_xac_2}-{xuc_xac_3}"
+        
+        # Chuẩn bị dữ liệu cho thuật toán
+        data_kq = [s["result"] for s in state.session_details]
+        diem_lich_su = [s["total"] for s in state.session_details]
+        
+        # Gọi thuật toán dự đoán
+        with predict_lock:
             prediction, confidence, reason = du_doan(
                 data_kq, 
                 dem_sai=0, 
@@ -291,34 +307,40 @@ def get_prediction():
                 data=app.prediction_data
             )
 
-            # 👉 Thêm thời gian hiện tại
-            now_str = datetime.now().strftime("%d/%m/%Y %H:%M:%S")
-
-            return jsonify({
-                "api": "taixiu_anhbaocx",
-                "current_time": now_str,  # 🕒 Thời gian thực tế
-                "current_session": current_sid,
-                "current_result": current_result,
-                "current_total": current_total,
-                "xuc_xac": f"{xuc_xac_1},{xuc_xac_2},{xuc_xac_3}",
-                "next_session": current_sid + 1,
-                "prediction": prediction,
-                "confidence": confidence,
-                "reason": reason
-            })
+        # 👉 Thêm thời gian hiện tại
+        now_str = format_now()
+
+        return json_response({
+            "api": "taixiu_anhbaocx",
+            "current_time": now_str,  # 🕒 Thời gian thực tế
+            "current_session": current_sid,
+            "current_result": current_result,
+            "current_total": current_total,
+            "xuc_xac": f"{xuc_xac_1},{xuc_xac_2},{xuc_xac_3}",
+            "next_session": current_sid + 1,
+            "prediction": prediction,
+            "confidence": confidence,
+            "reason": reason
+        })
     except Exception as e:
         logging.error(f"❌ Lỗi trong get_prediction: {e}")
-        return jsonify({"error": f"Lỗi máy chủ nội bộ: {str(e)}"}), 500
+        return json_response({"error": f"Lỗi máy chủ nội bộ: {str(e)}"}), 500
 
 @app.route("/api/history", methods=["GET"])
 def get_history():
-    with app.lock:
-        return jsonify({
-            "history": app.history,
-            "session_ids": app.session_ids,
-            "details": app.session_details,
-            "length": len(app.history)
-        })
+    state = app.state.current
+    # Có tham số phân trang/chọn trường thì trả theo trang; không có thì giữ định dạng cũ
+    if paginated(request.args):
+        try:
+            return json_response(query_history(state.session_ids, state.session_details, request.args))
+        except ValueError as e:
+            return json_response({"error": str(e)}), 400
+    return json_response({
+        "history": state.history,
+        "session_ids": state.session_ids,
+        "details": state.session_details,
+        "length": len(state.history)
+    })
 
 if __name__ == "__main__":
     threading.Thread(target=poll_api, daemon=True).start()
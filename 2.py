@@ -4,31 +4,56 @@ import time
 import logging
 import threading
 import requests
-import random
 import math
 from collections import Counter
-from flask import Flask, jsonify
+from flask import Flask, Response, request
 from flask_cors import CORS
+from fast_json import StaticJSON, json_response, format_now
+from rate_limit import LoadShedder, expensive_budget
+from ensemble import EnsembleCombiner
+from parallel_eval import DeadlineEvaluator
+from llm_prefetch import LLMPrefetcher, READY
+from llm_cache import LLMCache
+from circuit_breaker import LLMUnavailable
+from single_flight import SingleFlight
+from snapshot import SnapshotPublisher
+from conditional import ConditionalGet, SessionClock
+from history_query import paginated, query_history
+from event_stream import EventStream, session_backfill
+from ws_hub import WebSocketHub
+from batch_predict import BatchPredictor, BatchBusy, engine_result, parse_batch
+from state_store import StateStore, TimedLock
+from session_rng import SessionRNG
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
 API_URL = "https://hithu-ddo6.onrender.com/api/hit"
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY", "")
-OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
+OPENROUTER_URL = os.getenv("OPENROUTER_URL", "https://openrouter.ai/api/v1/chat/completions")
 POLL_INTERVAL = 5
 MAX_HISTORY_LEN = 500
+MODEL_DEADLINE = float(os.getenv("MODEL_DEADLINE", "2.5"))  # giây
 
 app = Flask(__name__)
 CORS(app)
+# Hạn mức request theo client và giới hạn đồng thời: trả 429 trước mọi khóa và model
+rate_limiter = LoadShedder(routes={"/api/predict_batch": expensive_budget()}).install(app)
 app.history = []
 app.session_ids = []
 app.session_details = []
-app.lock = threading.Lock()
+app.lock = TimedLock()  # Khóa của bên ghi, có đo thời gian chờ
+# Bản chụp trạng thái copy-on-write cho các endpoint đọc (không cần app.lock)
+app.state = StateStore()
+
+# Cache phản hồi OpenRouter theo nội dung yêu cầu (model + prompt + tham số)
+llm_cache = LLMCache()
 
 # ------------------------- HÙNG AKIRA AI SYSTEM -------------------------
 class HungAkiraPredictionSystem:
-    def __init__(self):
+    def __init__(self, table="default"):
         self.history = []
+        # Nguồn ngẫu nhiên tất định theo (bàn, phiên) thay cho random toàn cục
+        self.rng = SessionRNG(table)
         self.pattern_database = {}
         self.session_stats = {
             'streaks': {'T': 0, 'X': 0, 'maxT': 0, 'maxX': 0},
@@ -42,6 +67,7 @@ class HungAkiraPredictionSystem:
             'stability': 0.5,
             'regime': 'normal'
         }
+        self.ensemble = EnsembleCombiner()
         self.init_pattern_database()
 
     def init_pattern_database(self):
@@ -56,6 +82,10 @@ class HungAkiraPredictionSystem:
             'X-T-T': {'prediction': 'X', 'confidence': 0.60, 'occurrences': 0}
         }
 
+    def set_session(self, sid):
+        """Gắn phiên hiện tại để mọi lựa chọn ngẫu nhiên tất định theo phiên"""
+        self.rng.set_session(sid)
+
     def add_result(self, result):
         if self.history:
             last_result = self.history[-1]
@@ -270,7 +300,7 @@ class HungAkiraPredictionSystem:
             reason = f"Biến động thấp ({volatility:.2f}), tiếp tục xu hướng"
         elif volatility > 0.7:
             # Nhiều biến động, khó dự đoán
-            prediction = 'T' if random.random() > 0.5 else 'X'
+            prediction = 'T' if self.rng.random('volatility_analysis') > 0.5 else 'X'
             confidence = 0.5
             reason = f"Biến động cao ({volatility:.2f}), dự đoán ngẫu nhiên"
         else:
@@ -287,38 +317,23 @@ class HungAkiraPredictionSystem:
 
     def get_combined_prediction(self):
         """Kết hợp tất cả các model"""
-        models = [
-            self.model_trend_analysis(),
-            self.model_pattern_recognition(),
-            self.model_mean_reversion(),
-            self.model_volatility_analysis()
-        ]
-        
-        # Lọc các model có dự đoán hợp lệ
-        valid_models = [m for m in models if m and m.get('prediction')]
-        
-        if not valid_models:
-            return None
-        
-        # Tính điểm tổng hợp
-        t_score = 0
-        x_score = 0
-        reasons = []
+        models = {
+            'trend_analysis': self.model_trend_analysis(),
+            'pattern_recognition': self.model_pattern_recognition(),
+            'mean_reversion': self.model_mean_reversion(),
+            'volatility_analysis': self.model_volatility_analysis()
+        }
         
-        for model in valid_models:
-            weight = model['confidence']
-            if model['prediction'] == 'T':
-                t_score += weight
-            else:
-                x_score += weight
-            reasons.append(model['reason'])
+        # Tính điểm tổng hợp bằng bộ kết hợp vector (chỉ model có dự đoán hợp lệ)
+        combined = self.ensemble.load(models).combine(
+            top_k=2, tie='X', reason_format=lambda name, model: model['reason']
+        )
         
-        total_score = t_score + x_score
-        if total_score == 0:
+        if combined['active_count'] == 0 or combined['total_score'] == 0:
             return None
         
-        final_prediction = 'T' if t_score > x_score else 'X'
-        final_confidence = max(t_score, x_score) / total_score
+        final_prediction = combined['prediction']
+        final_confidence = combined['confidence']
         
         # Điều chỉnh confidence theo market regime
         if self.market_state['regime'] == 'volatile':
@@ -329,13 +344,16 @@ class HungAkiraPredictionSystem:
         return {
             'prediction': final_prediction,
             'confidence': final_confidence,
-            'reason': ' | '.join(reasons[:2]),  # Chỉ lấy 2 lý do đầu
-            'models_count': len(valid_models),
+            'reason': ' | '.join(combined['reasons']),  # Chỉ 2 model đóng góp nhiều nhất
+            'models_count': combined['active_count'],
             'market_regime': self.market_state['regime']
         }
 
 # Khởi tạo hệ thống Hùng Akira
-akira_system = HungAkiraPredictionSystem()
+akira_system = HungAkiraPredictionSystem(table=API_URL)
+
+# Khóa riêng của engine cho poller, nhóm model và view công bố (luôn lấy sau app.lock)
+engine_lock = threading.RLock()
 
 # ------------------------- PATTERN DATA -------------------------
 PATTERN_DATA = {
@@ -481,7 +499,7 @@ def ai_predict(session_details):
             "top_p": 0.9
         }
 
-        response = requests.post(OPENROUTER_URL, headers=headers, json=data, timeout=10)
+        response = llm_cache.post(OPENROUTER_URL, json=data, headers=headers, timeout=10)
         
         if response.status_code == 200:
             result = response.json()
@@ -534,38 +552,66 @@ def ai_predict(session_details):
             error_msg = f"Lỗi API: {response.status_code}"
             return {"prediction": "Tài", "confidence": 0.5, "reason": f"[AI] {error_msg}"}
 
+    except LLMUnavailable as e:
+        # Mạch ngắt đang mở: bỏ phiếu AI ngay, các hệ thống cục bộ tự quyết định
+        logging.info(f"⏭️ Bỏ qua AI: {e}")
+        return None
     except Exception as e:
         logging.error(f"Lỗi AI prediction: {e}")
         return {"prediction": "Tài", "confidence": 0.5, "reason": f"[AI] Lỗi: {str(e)}"}
 
 # ------------------------- COMBINED PREDICTION -------------------------
-def get_all_predictions(session_details):
-    """Lấy tất cả dự đoán từ các hệ thống"""
-    predictions = []
-    
-    # 1. Pattern prediction
-    pattern_pred = pattern_predict(session_details)
-    predictions.append(pattern_pred)
-    
-    # 2. AI prediction (nếu có API key)
-    if OPENROUTER_API_KEY:
-        ai_pred = ai_predict(session_details)
-        predictions.append(ai_pred)
-    
-    # 3. Hùng Akira system prediction
-    if session_details:
-        # Cập nhật dữ liệu cho Hùng Akira system
-        recent_results = [s["result"][0] for s in session_details[:20]]  # 'T' hoặc 'X'
-        for result in recent_results:
-            akira_system.add_result(result)
-        
+# Nhãn của bộ kết hợp trong combined_prediction; mỗi lần gọi dựng bộ kết hợp riêng nên các luồng không chia sẻ mảng
+COMBINED_LABELS = ("Tài", "Xỉu")
+
+# Bộ đánh giá song song các nhóm model, giới hạn thời gian mỗi phiên
+model_evaluator = DeadlineEvaluator(deadline=MODEL_DEADLINE)
+
+# Dự đoán AI cho phiên kế tiếp được gọi nền ngay khi poller nạp phiên mới
+# AI trả về thì dựng lại bản chụp của phiên để dự đoán có thêm nhóm AI
+ai_prefetch = LLMPrefetcher(ai_predict, name="ai-prefetch", on_done=lambda sid, slot: republish_prediction(sid))
+
+def _akira_predict(session_details):
+    """Nhóm Hùng Akira: khởi động dữ liệu khi cần rồi lấy dự đoán tổng hợp"""
+    # Giữ khóa engine cả khi nhóm trễ hạn chạy nốt ở nền: poller không nạp phiên giữa chừng
+    with engine_lock:
+        # Poller đã nạp từng phiên mới; chỉ khởi động từ lịch sử khi engine còn trống
+        if not akira_system.history:
+            for s in reversed(session_details[:20]):
+                akira_system.add_result(s["result"][0])  # 'T' hoặc 'X'
+
+        # Dự đoán là hàm thuần của trạng thái phiên hiện tại
+        akira_system.set_session(session_details[0]["sid"])
+
         akira_pred = akira_system.get_combined_prediction()
         if akira_pred:
             # Chuyển đổi từ 'T','X' sang 'Tài','Xỉu'
             akira_pred["prediction"] = "Tài" if akira_pred["prediction"] == "T" else "Xỉu"
             akira_pred["reason"] = f"[Hùng Akira] {akira_pred['reason']}"
-            predictions.append(akira_pred)
-    
+        return akira_pred
+
+def get_all_predictions(session_details):
+    """Lấy tất cả dự đoán từ các hệ thống (các nhóm chạy song song, có hạn chót)"""
+    # Chụp lại danh sách để các nhóm trễ hạn chạy nền không thấy dữ liệu bị sửa
+    session_details = list(session_details)
+
+    # 1. Pattern prediction
+    groups = {"pattern": lambda: pattern_predict(session_details)}
+
+    # 2. Hùng Akira system prediction
+    if session_details:
+        groups["akira"] = lambda: _akira_predict(session_details)
+
+    results, _ = model_evaluator.run(groups)
+
+    # 3. AI prediction: chỉ đọc ô gọi nền của phiên này, không chờ OpenRouter
+    if OPENROUTER_API_KEY and session_details:
+        ai_slot = ai_prefetch.schedule(session_details[0]["sid"], session_details)
+        if ai_slot["status"] == READY:
+            results["ai"] = ai_slot["result"]
+
+    predictions = [pred for pred in results.values() if pred]
+
     # 4. Trend analysis (đơn giản)
     if len(session_details) >= 8:
         recent = [s["result"] for s in session_details[:8]]
@@ -587,40 +633,115 @@ def get_all_predictions(session_details):
     
     return predictions
 
-def combined_prediction(session_details):
-    """Kết hợp tất cả dự đoán và chọn cái tốt nhất"""
-    all_predictions = get_all_predictions(session_details)
+def combined_prediction(session_details, all_predictions=None):
+    """Kết hợp tất cả dự đoán và chọn cái tốt nhất (dùng lại all_predictions nếu đã có)"""
+    if all_predictions is None:
+        all_predictions = get_all_predictions(session_details)
     
     if not all_predictions:
         return "Tài", 0.5, "Không có dự đoán nào"
     
-    # Tính điểm cho Tài và Xỉu
-    tai_score = 0
-    xiu_score = 0
-    reasons = []
-    
-    for pred in all_predictions:
-        weight = pred["confidence"]
-        if pred["prediction"] == "Tài":
-            tai_score += weight
-        else:
-            xiu_score += weight
-        reasons.append(pred["reason"])
-    
-    total_score = tai_score + xiu_score
-    
-    if total_score == 0:
+    # Tính điểm weighted (trọng số = confidence), chỉ dựng lý do cho 2 nguồn mạnh nhất
+    combined = EnsembleCombiner(labels=COMBINED_LABELS).load(all_predictions).combine(
+        top_k=2, tie="Xỉu", reason_format=lambda name, pred: pred["reason"]
+    )
+
+    if combined["total_score"] == 0:
         final_prediction = "Tài"
         final_confidence = 0.5
     else:
-        final_prediction = "Tài" if tai_score > xiu_score else "Xỉu"
-        final_confidence = max(tai_score, xiu_score) / total_score
-    
-    # Chọn 2 lý do có confidence cao nhất
-    sorted_predictions = sorted(all_predictions, key=lambda x: x["confidence"], reverse=True)
-    top_reasons = [pred["reason"] for pred in sorted_predictions[:2]]
-    
-    return final_prediction, final_confidence, " | ".join(top_reasons)
+        final_prediction = combined["prediction"]
+        final_confidence = combined["confidence"]
+
+    return final_prediction, final_confidence, " | ".join(combined["reasons"])
+
+# Gộp các request đồng thời của cùng một phiên thành một lần tính dự đoán
+prediction_flight = SingleFlight()
+# Các lần công bố dự đoán nối tiếp nhau; không giữ app.lock khi model đang chạy
+publish_lock = threading.Lock()
+
+# Phản hồi /api/hitclub dựng sẵn một lần mỗi phiên, phần chi tiết chỉ trả khi được yêu cầu
+prediction_snapshots = SnapshotPublisher(detail_keys=("prediction_details",))
+
+# ETag/Last-Modified cho các endpoint chỉ đổi khi có phiên mới (client đã có bản mới nhất nhận 304)
+conditional = ConditionalGet("taixiu_anhbaocx_hung_akira", SessionClock())
+
+# Luồng SSE /api/stream: mỗi phiên một sự kiện (kết quả + dự đoán phiên kế tiếp)
+session_events = EventStream(backfill=session_backfill(app.state))
+
+# Hub WebSocket (bật bằng WS_PORT, cần gói websockets): client đăng ký sự kiện phiên theo bàn/engine
+ws_hub = WebSocketHub(table=API_URL, engine="taixiu_anhbaocx_hung_akira")
+session_events.add_listener(ws_hub.publish)
+
+# ------------------------- BATCH PREDICTION -------------------------
+# /api/predict_batch: dự đoán cho chuỗi T/X (+ xúc xắc) do client gửi
+# Mỗi chuỗi chạy trên một HungAkiraPredictionSystem riêng, không đụng akira_system
+def _batch_feed(engine, result, dice):
+    engine.add_result(result)
+
+def _batch_predict(engine, sequence):
+    engine.set_session(sequence.sid)
+    return engine_result(engine.get_combined_prediction())
+
+batch_predictor = BatchPredictor(lambda: HungAkiraPredictionSystem(table=API_URL), _batch_feed, _batch_predict)
+
+def publish_prediction():
+    """Tính dự đoán kết hợp cho phiên mới nhất và công bố bản chụp phản hồi"""
+    # Tính trên bản chụp trạng thái đã công bố: poller vẫn nạp phiên trong lúc model chạy tới hạn chót
+    with publish_lock:
+        state = app.state.current
+        current_sid = state.session_ids[-1]
+        current_result = state.history[-1]
+
+        # Tính dự đoán các hệ thống con một lần, dùng cho cả kết hợp lẫn phần chi tiết
+        all_predictions = get_all_predictions(state.session_details)
+        prediction, confidence, reason = combined_prediction(state.session_details, all_predictions)
+        models_missed = list(model_evaluator.last_missed)
+
+        response_data = {
+            "api": "taixiu_anhbaocx_hung_akira",
+            "current_session": current_sid,
+            "current_result": current_result,
+            "next_session": current_sid + 1,
+            "prediction": prediction,
+            "confidence": round(confidence * 100, 2),  # Tỉ lệ phần trăm
+            "reason": reason,
+            "system_version": "Hùng Akira AI v2.0",
+            "prediction_details": [
+                {
+                    "system": pred["reason"].split("]")[0] + "]",
+                    "prediction": pred["prediction"],
+                    "confidence": round(pred["confidence"] * 100, 2)
+                }
+                for pred in all_predictions
+            ]
+        }
+
+        # Báo các nhóm model trễ hạn chót trong phiên này
+        if models_missed:
+            response_data["models_missed"] = models_missed
+
+        # Trạng thái AI gọi nền cho phiên này ("pending" khi OpenRouter chưa trả về)
+        if OPENROUTER_API_KEY:
+            response_data["ai_status"] = ai_prefetch.get(current_sid)["status"]
+
+    snapshot = prediction_snapshots.publish(current_sid, response_data)
+    # Chỉ lần công bố đầu của phiên thành sự kiện SSE (dựng lại sau khi AI trả về thì bỏ qua)
+    session_events.publish(snapshot.sid, snapshot.compact())
+    return snapshot
+
+def republish_prediction(sid):
+    """Dựng lại bản chụp khi phiên `sid` vẫn là phiên mới nhất"""
+    if app.session_ids and app.session_ids[-1] == sid:
+        publish_prediction()
+
+# ------------------------- APP STATE -------------------------
+def publish_state():
+    """Công bố bản chụp trạng thái mới cho các endpoint đọc (gọi khi đang giữ app.lock)"""
+    with engine_lock:
+        app.state.publish(app.history, app.session_ids, app.session_details)
+    if app.session_ids:
+        conditional.clock.tick(app.session_ids[-1])
 
 # ------------------------- POLL API -------------------------
 def poll_api():
@@ -642,7 +763,7 @@ def poll_api():
                 time.sleep(POLL_INTERVAL)
                 continue
 
-            with app.lock:
+            with app.lock, engine_lock:
                 if not app.session_ids or sid > app.session_ids[-1]:
                     app.session_ids.append(sid)
                     app.history.append(result)
@@ -658,6 +779,17 @@ def poll_api():
                     
                     logging.info(f"✅ Phiên mới #{sid}: {result} ({total})")
 
+                    # Gọi AI nền cho phiên kế tiếp với bản chụp lịch sử
+                    if OPENROUTER_API_KEY:
+                        ai_prefetch.schedule(sid, list(app.session_details))
+
+                    # Công bố bản chụp trạng thái mới cho các endpoint đọc
+                    publish_state()
+
+            # Tính và công bố dự đoán của phiên mới ngay khi nạp, ngoài app.lock
+            if app.session_ids and app.session_ids[-1] == sid and prediction_snapshots.get(sid) is None:
+                prediction_flight.do(sid, publish_prediction)
+
         except Exception as e:
             logging.error(f"❌ Lỗi API: {e}")
         time.sleep(POLL_INTERVAL)
@@ -668,94 +800,139 @@ from datetime import datetime
 @app.route("/api/hitclub", methods=["GET"])
 def get_prediction():
     try:
-        with app.lock:
-            if not app.history or not app.session_ids or not app.session_details:
-                return jsonify({"error": "Chưa có dữ liệu"}), 500
-
-            current_sid = app.session_ids[-1]
-            current_result = app.history[-1]
-
-            # Sử dụng combined prediction
-            prediction, confidence, reason = combined_prediction(app.session_details)
-
-            # 👉 Thêm thời gian hiện tại
-            now_str = datetime.now().strftime("%d/%m/%Y %H:%M:%S")
-
-            response_data = {
-                "api": "taixiu_anhbaocx_hung_akira",
-                "current_time": now_str,
-                "current_session": current_sid,
-                "current_result": current_result,
-                "next_session": current_sid + 1,
-                "prediction": prediction,
-                "confidence": round(confidence * 100, 2),  # Tỉ lệ phần trăm
-                "reason": reason,
-                "system_version": "Hùng Akira AI v2.0"
-            }
-
-            # Thêm thông tin chi tiết từ các hệ thống con
-            all_predictions = get_all_predictions(app.session_details)
-            prediction_details = []
-            
-            for i, pred in enumerate(all_predictions):
-                prediction_details.append({
-                    "system": pred["reason"].split("]")[0] + "]",
-                    "prediction": pred["prediction"],
-                    "confidence": round(pred["confidence"] * 100, 2)
-                })
-            
-            response_data["prediction_details"] = prediction_details
-
-            return jsonify(response_data)
+        # Đọc bản chụp trạng thái hiện tại, không cần app.lock
+        state = app.state.current
+        if not state.history or not state.session_ids or not state.session_details:
+            return json_response({"error": "Chưa có dữ liệu"}), 500
+
+        current_sid = state.session_ids[-1]
+
+        # Bản chụp của phiên hiện tại; chỉ tính khi poller chưa kịp công bố (gộp theo mã phiên)
+        snapshot = prediction_snapshots.get(current_sid)
+        if snapshot is None:
+            snapshot = prediction_flight.do(current_sid, publish_prediction)
+
+        # Client đã có bản chụp này (cùng phiên, cùng lần công bố) thì trả 304, không dựng lại body
+        etag = conditional.etag(snapshot.sid, snapshot.revision, request.query_string.decode())
+        headers = conditional.headers(etag, snapshot.published_at, snapshot.provisional)
+        if conditional.not_modified(request.headers, etag, snapshot.published_at):
+            return Response(status=304, headers=headers)
+
+        # 👉 Thêm thời gian hiện tại
+        now_str = format_now()
+        return Response(snapshot.body(request.args, now_str), mimetype="application/json", headers=headers)
     except Exception as e:
         logging.error(f"❌ Lỗi trong get_prediction: {e}")
-        return jsonify({"error": f"Lỗi máy chủ nội bộ: {str(e)}"}), 500
+        return json_response({"error": f"Lỗi máy chủ nội bộ: {str(e)}"}), 500
+
+@app.route("/api/stream", methods=["GET"])
+def stream_sessions():
+    """Server-Sent Events: một sự kiện mỗi phiên mới, nối lại bằng Last-Event-ID"""
+    # EventSource gửi Last-Event-ID khi tự nối lại; lần kết nối đầu có thể truyền qua ?last_event_id=
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    subscriber = session_events.subscribe(last_event_id)
+    return Response(session_events.iter_events(subscriber), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 @app.route("/api/history", methods=["GET"])
 def get_history():
-    with app.lock:
-        return jsonify({
-            "history": app.history,
-            "session_ids": app.session_ids,
-            "details": app.session_details,
-            "length": len(app.history)
+    state = app.state.current
+    etag = conditional.etag("history", state.version, request.query_string.decode())
+    headers = conditional.headers(etag, state.published_at)
+    if conditional.not_modified(request.headers, etag, state.published_at):
+        return Response(status=304, headers=headers)
+    # Có tham số phân trang/chọn trường thì trả theo trang; không có thì giữ định dạng cũ
+    if paginated(request.args):
+        try:
+            data = query_history(state.session_ids, state.session_details, request.args)
+        except ValueError as e:
+            return json_response({"error": str(e)}), 400
+        response = json_response(data)
+    else:
+        response = json_response({
+            "history": state.history,
+            "session_ids": state.session_ids,
+            "details": state.session_details,
+            "length": len(state.history)
         })
+    response.headers.update(headers)
+    return response
+
+@app.route("/api/predict_batch", methods=["POST"])
+def predict_batch():
+    """Dự đoán hàng loạt cho các chuỗi của client trên engine riêng, không đụng trạng thái live"""
+    try:
+        sequences = parse_batch(request.get_json(silent=True))
+    except ValueError as e:
+        return json_response({"error": str(e)}), 400
+    try:
+        data = batch_predictor.run(sequences)
+    except BatchBusy as e:
+        return json_response({"error": str(e)}), 503
+    data["api"] = "taixiu_anhbaocx_hung_akira"
+    return json_response(data)
 
 @app.route("/api/health", methods=["GET"])
 def health_check():
-    return jsonify({
+    return json_response({
         "status": "healthy",
         "timestamp": datetime.now().isoformat(),
-        "history_count": len(app.history),
+        "history_count": len(app.state.current.history),
         "ai_configured": bool(OPENROUTER_API_KEY),
+        "model_evaluator": model_evaluator.status(),
+        "ai_prefetch": ai_prefetch.status(),
+        "llm_cache": llm_cache.status(),
+        "llm_breaker": llm_cache.guard.status(),
+        "prediction_flight": prediction_flight.status(),
+        "prediction_snapshot": prediction_snapshots.status(),
+        "app_state": app.state.status(),
+        "conditional_get": conditional.status(),
+        "event_stream": session_events.status(),
+        "ws_hub": ws_hub.status(),
+        "rate_limit": rate_limiter.status(),
+        "batch_predict": batch_predictor.status(),
+        "lock_wait": app.lock.status(),
         "hung_akira_system": "active",
         "systems": ["Pattern Matching", "AI Deepseek", "Hùng Akira AI"]
     })
 
+# Mô tả hệ thống không đổi khi đang chạy (API key, số pattern cố định từ lúc khởi động) nên serialize một lần
+SYSTEMS_INFO = StaticJSON({
+    "systems": {
+        "pattern_matching": {
+            "status": "active",
+            "patterns_count": len(PATTERN_DATA),
+            "description": "Hệ thống nhận diện pattern cơ bản"
+        },
+        "ai_deepseek": {
+            "status": "active" if OPENROUTER_API_KEY else "inactive",
+            "model": "Deepseek V3",
+            "description": "AI thông minh qua OpenRouter"
+        },
+        "hung_akira_ai": {
+            "status": "active",
+            "models_count": 5,
+            "description": "Hệ thống Hùng Akira với 5 model AI kết hợp"
+        }
+    }
+})
+
 @app.route("/api/systems", methods=["GET"])
 def get_systems_info():
-    return jsonify({
-        "systems": {
-            "pattern_matching": {
-                "status": "active",
-                "patterns_count": len(PATTERN_DATA),
-                "description": "Hệ thống nhận diện pattern cơ bản"
-            },
-            "ai_deepseek": {
-                "status": "active" if OPENROUTER_API_KEY else "inactive",
-                "model": "Deepseek V3",
-                "description": "AI thông minh qua OpenRouter"
-            },
-            "hung_akira_ai": {
-                "status": "active",
-                "models_count": 5,
-                "description": "Hệ thống Hùng Akira với 5 model AI kết hợp"
-            }
-        }
-    })
+    return SYSTEMS_INFO.response()
+
+def start_ingestion():
+    """Khởi động phần nạp dữ liệu (poller, hub WebSocket); khi chạy nhiều worker chỉ leader gọi"""
+    # Worker vừa được bầu làm leader đã có lịch sử sao từ leader cũ: nạp lại vào engine, cũ nhất trước
+    with app.lock, engine_lock:
+        for detail in reversed(app.session_details):
+            akira_system.add_result(detail["result"][0])  # 'T' hoặc 'X'
 
-if __name__ == "__main__":
     threading.Thread(target=poll_api, daemon=True).start()
+    ws_hub.start()
+
+if __name__ == "__main__":
+    start_ingestion()
     port = int(os.getenv("PORT", 9099))
     logging.info(f"🚀 Khởi động Hùng Akira AI System trên port {port}")
     logging.info(f"📊 Hệ thống bao gồm: Pattern Matching, AI Deepseek, Hùng Akira AI")
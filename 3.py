@@ -4,26 +4,53 @@ import time
 import logging
 import threading
 import requests
-import random
 import math
 from collections import Counter
-from flask import Flask, jsonify
+from functools import partial
+from flask import Flask, Response, request
 from flask_cors import CORS
+from fast_json import json_response, format_now
+from rate_limit import LoadShedder, expensive_budget
+from ensemble import EnsembleCombiner
+from parallel_eval import DeadlineEvaluator
+from llm_prefetch import LLMPrefetcher, READY
+from llm_cache import LLMCache
+from circuit_breaker import LLMUnavailable
+from single_flight import SingleFlight
+from snapshot import SnapshotPublisher
+from conditional import ConditionalGet, SessionClock
+from history_query import paginated, query_history
+from event_stream import EventStream, session_backfill
+from ws_hub import WebSocketHub
+from batch_predict import BatchPredictor, BatchBusy, engine_result, parse_batch
+from state_store import StateStore, TimedLock
+from session_rng import SessionRNG
+from model_registry import ModelRegistry
+from accuracy_tracker import AccuracyTracker, RECENT_WINDOW
+from hedge import HedgeWeights
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
 API_URL = "https://hithu-ddo6.onrender.com/api/hit"
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY", "")
-OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
+OPENROUTER_URL = os.getenv("OPENROUTER_URL", "https://openrouter.ai/api/v1/chat/completions")
 POLL_INTERVAL = 5
 MAX_HISTORY_LEN = 500
+MODEL_DEADLINE = float(os.getenv("MODEL_DEADLINE", "2.5"))  # giây
 
 app = Flask(__name__)
 CORS(app)
+# Hạn mức request theo client và giới hạn đồng thời: trả 429 trước mọi khóa và model
+rate_limiter = LoadShedder(routes={"/api/predict_batch": expensive_budget()}).install(app)
 app.history = []
 app.session_ids = []
 app.session_details = []
-app.lock = threading.Lock()
+app.lock = TimedLock()  # Khóa của bên ghi, có đo thời gian chờ
+# Bản chụp trạng thái copy-on-write cho các endpoint đọc (không cần app.lock)
+app.state = StateStore()
+
+# Cache phản hồi OpenRouter theo nội dung yêu cầu (model + prompt + tham số)
+llm_cache = LLMCache()
 
 # Thêm biến để lưu dự đoán phiên trước và kết quả so sánh
 app.previous_predictions = {}  # Lưu dự đoán theo session_id
@@ -34,9 +61,14 @@ app.prediction_accuracy = {    # Thống kê độ chính xác
 }
 
 # ------------------------- LMC GAMING AI SYSTEM -------------------------
+# Sổ đăng ký model: mỗi model khai báo lookback, đặc trưng và lớp chi phí
+LMC_MODELS = ModelRegistry()
+
 class LMCPredictionSystem:
-    def __init__(self):
+    def __init__(self, table="default"):
         self.history = []
+        # Nguồn ngẫu nhiên tất định theo (bàn, phiên) thay cho random toàn cục
+        self.rng = SessionRNG(table)
         self.models = {}
         self.weights = {}
         self.performance = {}
@@ -64,26 +96,30 @@ class LMCPredictionSystem:
             'pattern_confidence_decay': 0.95,
             'pattern_confidence_growth': 1.05
         }
+        self.ensemble = EnsembleCombiner()
         self.init_all_models()
 
     def init_all_models(self):
         """Khởi tạo tất cả models"""
-        for i in range(1, 22):
-            model_name = f'model{i}'
-            self.models[model_name] = getattr(self, model_name, lambda: None)
+        for model_name in LMC_MODELS.names():
+            # Gọi qua registry để luôn được kiểm tra lookback và dùng lại kết quả
+            self.models[model_name] = partial(self.predict_model, model_name)
             self.weights[model_name] = 1.0
-            self.performance[model_name] = {
-                'correct': 0,
-                'total': 0,
-                'recent_correct': 0,
-                'recent_total': 0,
-                'streak': 0,
-                'max_streak': 0
-            }
+            self.ensemble.slot(model_name)
+            self.performance[model_name] = AccuracyTracker()
         
+        # Trọng số học trực tuyến (Hedge), khởi tạo từ trọng số mặc định
+        self.hedge = HedgeWeights(list(self.weights), initial=self.weights)
+        # Dự đoán từng model đưa ra trước khi phiên tới có kết quả, chờ đối chiếu
+        self.pending_predictions = None
         self.init_pattern_database()
         self.init_advanced_patterns()
 
+    def predict_model(self, name):
+        """Chạy một model qua registry (self.models giữ partial của phương thức này
+        để bản sao deepcopy của engine gọi model trên chính bản sao)"""
+        return LMC_MODELS.predict(self, name)
+
     def init_pattern_database(self):
         """Khởi tạo cơ sở dữ liệu pattern"""
         self.pattern_database = {
@@ -123,6 +159,16 @@ class LMCPredictionSystem:
             }
         }
 
+    @property
+    def window(self):
+        """Lát lịch sử dùng chung của lượt chạy model hiện tại"""
+        ctx = LMC_MODELS.context(self)
+        return ctx.window if ctx is not None else self.history
+
+    def set_session(self, sid):
+        """Gắn phiên hiện tại để mọi lựa chọn ngẫu nhiên tất định theo phiên"""
+        self.rng.set_session(sid)
+
     def add_result(self, result):
         """Thêm kết quả mới và cập nhật thống kê"""
         if self.history:
@@ -241,11 +287,10 @@ class LMCPredictionSystem:
                         }
 
     # MODEL 1: Nhận biết các loại cầu cơ bản
+    @LMC_MODELS.register('model1', min_lookback=4, max_lookback=10,
+                         features=('pattern_database', 'market_state'), cost='expensive')
     def model1(self):
-        if len(self.history) < 4:
-            return None
-        
-        recent = self.history[-10:]
+        recent = self.window[-10:]
         patterns = []
         
         for pattern_key, pattern_data in self.pattern_database.items():
@@ -282,12 +327,10 @@ class LMCPredictionSystem:
         }
 
     # MODEL 2: Bắt trend xu hướng ngắn và dài
+    @LMC_MODELS.register('model2', min_lookback=20, max_lookback=20, features=('market_state',), cost='medium')
     def model2(self):
-        short_term = self.history[-5:] if len(self.history) >= 5 else []
-        long_term = self.history[-20:] if len(self.history) >= 20 else []
-        
-        if not short_term or not long_term:
-            return None
+        short_term = self.window[-5:]
+        long_term = self.window[-20:]
         
         def analyze_trend(data):
             t_count = data.count('T')
@@ -330,11 +373,9 @@ class LMCPredictionSystem:
         }
 
     # MODEL 3: Mean reversion trong 12 phiên
+    @LMC_MODELS.register('model3', min_lookback=12, max_lookback=12, features=('market_state',))
     def model3(self):
-        if len(self.history) < 12:
-            return None
-        
-        recent = self.history[-12:]
+        recent = self.window[-12:]
         t_count = recent.count('T')
         x_count = recent.count('X')
         total = len(recent)
@@ -358,11 +399,9 @@ class LMCPredictionSystem:
         }
 
     # MODEL 4: Bắt cầu ngắn hạn
+    @LMC_MODELS.register('model4', min_lookback=4, max_lookback=6, features=('market_state',))
     def model4(self):
-        if len(self.history) < 4:
-            return None
-        
-        recent = self.history[-6:]
+        recent = self.window[-6:]
         last_3 = recent[-3:] if len(recent) >= 3 else recent
         
         t_count = last_3.count('T')
@@ -397,8 +436,10 @@ class LMCPredictionSystem:
         }
 
     # MODEL 5: Cân bằng tỷ lệ model
+    @LMC_MODELS.register('model5', features=('predictions',), cost='meta')
     def model5(self):
-        predictions = self.get_all_predictions()
+        # Chỉ xét model cơ sở (đã tính trong lượt này) để tránh đệ quy vô hạn
+        predictions = LMC_MODELS.base_predictions(self)
         t_predictions = sum(1 for p in predictions.values() if p and p['prediction'] == 'T')
         x_predictions = sum(1 for p in predictions.values() if p and p['prediction'] == 'X')
         total = t_predictions + x_predictions
@@ -419,13 +460,14 @@ class LMCPredictionSystem:
         return None
 
     # MODEL 6: Quyết định bắt theo cầu hay bẻ cầu
+    @LMC_MODELS.register('model6', min_lookback=20, max_lookback=None, features=('model2',), cost='expensive')
     def model6(self):
-        trend_analysis = self.model2()
+        trend_analysis = LMC_MODELS.predict(self, 'model2')
         if not trend_analysis:
             return None
         
-        continuity = self.analyze_continuity(self.history[-8:] if len(self.history) >= 8 else self.history)
-        break_probability = self.calculate_break_probability(self.history)
+        continuity = self.analyze_continuity(self.window[-8:])
+        break_probability = self.calculate_break_probability(self.window)
         
         if continuity['streak'] >= 5 and break_probability > 0.7:
             prediction = 'X' if trend_analysis['prediction'] == 'T' else 'T'
@@ -477,19 +519,18 @@ class LMCPredictionSystem:
         return break_count / total_opportunities if total_opportunities > 0 else 0.5
 
     # MODEL 7-21: Các model còn lại (simplified)
+    @LMC_MODELS.register('model7', max_lookback=0)
     def model7(self):
         """Cân bằng trọng số model"""
         return None  # Implement later
 
+    @LMC_MODELS.register('model8', min_lookback=10, max_lookback=15)
     def model8(self):
         """Nhận biết cầu xấu"""
-        if len(self.history) < 10:
-            return None
-        
-        randomness = self.calculate_randomness(self.history[-15:])
+        randomness = self.calculate_randomness(self.window[-15:])
         if randomness > 0.7:
             return {
-                'prediction': 'T' if random.random() > 0.5 else 'X',
+                'prediction': 'T' if self.rng.random('model8') > 0.5 else 'X',
                 'confidence': 0.5,
                 'reason': f"[Model8] Phát hiện cầu xấu (độ ngẫu nhiên {randomness:.2f})"
             }
@@ -517,31 +558,40 @@ class LMCPredictionSystem:
         return change_ratio * 0.4 + (1 - distribution) * 0.3 + entropy * 0.3
 
     # Các model 9-21 sẽ được triển khai tương tự
-    def model9(self): return self.model1()  # Pattern nâng cao
-    def model10(self): return self.model6()  # Xác suất bẻ cầu
-    def model11(self): return self.model8()  # Phân tích biến động
-    def model12(self): return self.model4()  # Pattern ngắn
+    @LMC_MODELS.register('model9', alias_of='model1')
+    def model9(self): return LMC_MODELS.predict(self, 'model1')  # Pattern nâng cao
+    @LMC_MODELS.register('model10', alias_of='model6')
+    def model10(self): return LMC_MODELS.predict(self, 'model6')  # Xác suất bẻ cầu
+    @LMC_MODELS.register('model11', alias_of='model8')
+    def model11(self): return LMC_MODELS.predict(self, 'model8')  # Phân tích biến động
+    @LMC_MODELS.register('model12', alias_of='model4')
+    def model12(self): return LMC_MODELS.predict(self, 'model4')  # Pattern ngắn
+    @LMC_MODELS.register('model13', features=('performance',), cost='meta')
     def model13(self): return self.analyze_performance()  # Đánh giá hiệu suất
-    def model14(self): return self.model6()  # Xác suất bẻ cầu xu hướng
-    def model15(self): return self.model6()  # Quyết định theo/bẻ xu hướng
-    def model16(self): return self.model10()  # Xác suất bẻ tổng hợp
-    def model17(self): return self.model7()  # Cân bằng trọng số nâng cao
-    def model18(self): return self.model2()  # Xu hướng ngắn hạn
-    def model19(self): return self.model1()  # Xu hướng phổ biến
+    @LMC_MODELS.register('model14', alias_of='model6')
+    def model14(self): return LMC_MODELS.predict(self, 'model6')  # Xác suất bẻ cầu xu hướng
+    @LMC_MODELS.register('model15', alias_of='model6')
+    def model15(self): return LMC_MODELS.predict(self, 'model6')  # Quyết định theo/bẻ xu hướng
+    @LMC_MODELS.register('model16', alias_of='model10')
+    def model16(self): return LMC_MODELS.predict(self, 'model10')  # Xác suất bẻ tổng hợp
+    @LMC_MODELS.register('model17', alias_of='model7')
+    def model17(self): return LMC_MODELS.predict(self, 'model7')  # Cân bằng trọng số nâng cao
+    @LMC_MODELS.register('model18', alias_of='model2')
+    def model18(self): return LMC_MODELS.predict(self, 'model2')  # Xu hướng ngắn hạn
+    @LMC_MODELS.register('model19', alias_of='model1')
+    def model19(self): return LMC_MODELS.predict(self, 'model1')  # Xu hướng phổ biến
+    @LMC_MODELS.register('model20', features=('performance',), cost='meta')
     def model20(self): return self.ensemble_prediction()  # Max Performance
-    def model21(self): return self.model5()  # Cân bằng tổng thể
+    @LMC_MODELS.register('model21', alias_of='model5')
+    def model21(self): return LMC_MODELS.predict(self, 'model5')  # Cân bằng tổng thể
 
     def analyze_performance(self):
         """Model 13: Đánh giá hiệu suất"""
-        performance_stats = {}
-        for model_name, perf in self.performance.items():
-            if perf['total'] > 0:
-                performance_stats[model_name] = {
-                    'accuracy': perf['correct'] / perf['total'],
-                    'recent_accuracy': perf['recent_correct'] / perf['recent_total'] if perf['recent_total'] > 0 else 0,
-                    'total': perf['total'],
-                    'streak': perf['streak']
-                }
+        performance_stats = {
+            model_name: perf.to_dict()
+            for model_name, perf in self.performance.items()
+            if perf.total > 0
+        }
         
         best_model = max(performance_stats.items(), key=lambda x: x[1]['accuracy'], default=(None, {'accuracy': 0}))
         
@@ -557,8 +607,9 @@ class LMCPredictionSystem:
         """Model 20: Kết hợp model hiệu suất cao"""
         performance_stats = {}
         for model_name, perf in self.performance.items():
-            if perf['total'] > 10:
-                performance_stats[model_name] = perf['correct'] / perf['total']
+            if perf.total > 10:
+                # Độ chính xác thực tế trong RECENT_WINDOW phiên gần nhất
+                performance_stats[model_name] = perf.accuracy(RECENT_WINDOW)
         
         if not performance_stats:
             return None
@@ -569,7 +620,7 @@ class LMCPredictionSystem:
         x_score = 0
         
         for model_name, accuracy in best_models:
-            prediction = self.models[model_name]()
+            prediction = LMC_MODELS.predict(self, model_name)
             if prediction and prediction['prediction']:
                 weight = accuracy
                 if prediction['prediction'] == 'T':
@@ -588,40 +639,23 @@ class LMCPredictionSystem:
         }
 
     def get_all_predictions(self):
-        """Lấy tất cả dự đoán từ các model"""
-        predictions = {}
-        for i in range(1, 22):
-            model_name = f'model{i}'
-            predictions[model_name] = self.models[model_name]()
-        return predictions
+        """Lấy tất cả dự đoán từ các model đã đăng ký"""
+        return LMC_MODELS.run(self)
 
     def get_final_prediction(self):
         """Lấy dự đoán cuối cùng kết hợp tất cả model"""
         predictions = self.get_all_predictions()
-        
-        t_score = 0
-        x_score = 0
-        total_weight = 0
-        reasons = []
-        
-        for model_name, prediction in predictions.items():
-            if prediction and prediction['prediction']:
-                weight = self.weights.get(model_name, 1.0)
-                score = prediction['confidence'] * weight
-                
-                if prediction['prediction'] == 'T':
-                    t_score += score
-                else:
-                    x_score += score
-                
-                total_weight += weight
-                reasons.append(f"{model_name}: {prediction['reason']}")
-        
-        if total_weight == 0:
+        self.pending_predictions = predictions
+
+        # Kết hợp vector hóa: dấu dự đoán x độ tin cậy x trọng số
+        self.ensemble.set_weights(self.weights)
+        combined = self.ensemble.load(predictions).combine(top_k=2, tie='X')
+
+        if combined['total_weight'] == 0 or combined['total_score'] == 0:
             return None
-        
-        final_prediction = 'T' if t_score > x_score else 'X'
-        final_confidence = max(t_score, x_score) / (t_score + x_score)
+
+        final_prediction = combined['prediction']
+        final_confidence = combined['confidence']
         
         # Điều chỉnh confidence theo độ biến động
         if self.session_stats['volatility'] > 0.7:
@@ -632,44 +666,37 @@ class LMCPredictionSystem:
         return {
             'prediction': final_prediction,
             'confidence': final_confidence,
-            'reason': ' | '.join(reasons[:2]),  # Chỉ lấy 2 lý do đầu
+            'reason': ' | '.join(combined['reasons']),  # Chỉ 2 model đóng góp nhiều nhất
             'details': predictions,
             'session_stats': self.session_stats,
             'market_state': self.market_state
         }
 
     def update_performance(self, actual_result):
-        """Cập nhật hiệu suất các model"""
-        predictions = self.get_all_predictions()
+        """Cập nhật hiệu suất các model; gọi trước add_result của cùng phiên"""
+        # Chấm dự đoán đã đưa ra trước phiên này; lịch sử lúc đó chưa chứa kết quả
+        predictions = self.pending_predictions
+        self.pending_predictions = None
+        if predictions is None:
+            # Chưa dự đoán phiên này: lịch sử vẫn chưa có kết quả nên dự đoán bây giờ vẫn hợp lệ
+            if not self.history:
+                return
+            predictions = self.get_all_predictions()
         
         for model_name, prediction in predictions.items():
             if prediction and prediction['prediction']:
                 perf = self.performance[model_name]
-                perf['total'] += 1
-                perf['recent_total'] += 1
-                
-                if prediction['prediction'] == actual_result:
-                    perf['correct'] += 1
-                    perf['recent_correct'] += 1
-                    perf['streak'] += 1
-                    perf['max_streak'] = max(perf['max_streak'], perf['streak'])
-                else:
-                    perf['streak'] = 0
-                
-                # Giữ recent stats trong phạm vi 50
-                if perf['recent_total'] > 50:
-                    perf['recent_total'] -= 1
-                    if (perf['recent_correct'] > 0 and 
-                        perf['recent_correct'] / perf['recent_total'] > 
-                        perf['correct'] / perf['total']):
-                        perf['recent_correct'] -= 1
-                
-                # Cập nhật trọng số
-                accuracy = perf['correct'] / perf['total'] if perf['total'] > 0 else 0
-                self.weights[model_name] = max(0.1, min(2.0, accuracy * 2))
+                perf.record(prediction['prediction'] == actual_result)
+
+        # Cập nhật trọng số bằng Hedge: một bước nhân trên toàn bộ model mỗi phiên
+        self.hedge.update_outcomes(predictions, actual_result)
+        self.weights.update(self.hedge.as_dict())
 
 # Khởi tạo hệ thống LMC Gaming AI
-lmc_system = LMCPredictionSystem()
+lmc_system = LMCPredictionSystem(table=API_URL)
+
+# Khóa riêng của engine cho poller, nhóm model và view công bố (luôn lấy sau app.lock)
+engine_lock = threading.RLock()
 
 # ------------------------- PATTERN DATA -------------------------
 PATTERN_DATA = {
@@ -789,7 +816,7 @@ def ai_predict(session_details):
             "temperature": 0.3,
         }
 
-        response = requests.post(OPENROUTER_URL, headers=headers, json=data, timeout=10)
+        response = llm_cache.post(OPENROUTER_URL, json=data, headers=headers, timeout=10)
         
         if response.status_code == 200:
             result = response.json()
@@ -831,35 +858,64 @@ def ai_predict(session_details):
         else:
             return {"prediction": "Tài", "confidence": 0.5, "reason": f"[AI] Lỗi API: {response.status_code}"}
 
+    except LLMUnavailable as e:
+        # Mạch ngắt đang mở: bỏ phiếu AI ngay, các hệ thống cục bộ tự quyết định
+        logging.info(f"⏭️ Bỏ qua AI: {e}")
+        return None
     except Exception as e:
         logging.error(f"Lỗi AI prediction: {e}")
         return {"prediction": "Tài", "confidence": 0.5, "reason": f"[AI] Lỗi: {str(e)}"}
 
-def get_all_predictions(session_details):
-    """Lấy tất cả dự đoán từ các hệ thống"""
-    predictions = []
-    
-    # 1. Pattern prediction
-    pattern_pred = pattern_predict(session_details)
-    predictions.append(pattern_pred)
-    
-    # 2. AI prediction
-    if OPENROUTER_API_KEY:
-        ai_pred = ai_predict(session_details)
-        predictions.append(ai_pred)
-    
-    # 3. LMC Gaming AI system prediction
-    if session_details:
-        recent_results = [s["result"][0] for s in session_details[:20]]  # 'T' hoặc 'X'
-        for result in recent_results:
-            lmc_system.add_result(result)
-        
+# Nhãn của bộ kết hợp trong combined_prediction; mỗi lần gọi dựng bộ kết hợp riêng nên các luồng không chia sẻ mảng
+COMBINED_LABELS = ("Tài", "Xỉu")
+
+# Bộ đánh giá song song các nhóm model, giới hạn thời gian mỗi phiên
+model_evaluator = DeadlineEvaluator(deadline=MODEL_DEADLINE)
+
+# Dự đoán AI cho phiên kế tiếp được gọi nền ngay khi poller nạp phiên mới
+# AI trả về thì dựng lại bản chụp của phiên để dự đoán có thêm nhóm AI
+ai_prefetch = LLMPrefetcher(ai_predict, name="ai-prefetch", on_done=lambda sid, slot: republish_prediction(sid))
+
+def _lmc_predict(session_details):
+    """Nhóm LMC Gaming AI: khởi động dữ liệu khi cần rồi lấy dự đoán cuối cùng"""
+    # Giữ khóa engine cả khi nhóm trễ hạn chạy nốt ở nền: poller không nạp phiên giữa chừng
+    with engine_lock:
+        # Poller đã nạp từng phiên mới; chỉ khởi động từ lịch sử khi engine còn trống
+        if not lmc_system.history:
+            for s in reversed(session_details[:20]):
+                lmc_system.add_result(s["result"][0])  # 'T' hoặc 'X'
+
+        # Dự đoán là hàm thuần của trạng thái phiên hiện tại
+        lmc_system.set_session(session_details[0]["sid"])
+
         lmc_pred = lmc_system.get_final_prediction()
         if lmc_pred:
             lmc_pred["prediction"] = "Tài" if lmc_pred["prediction"] == "T" else "Xỉu"
             lmc_pred["reason"] = f"[LMC AI] {lmc_pred['reason']}"
-            predictions.append(lmc_pred)
-    
+        return lmc_pred
+
+def get_all_predictions(session_details):
+    """Lấy tất cả dự đoán từ các hệ thống (các nhóm chạy song song, có hạn chót)"""
+    # Chụp lại danh sách để các nhóm trễ hạn chạy nền không thấy dữ liệu bị sửa
+    session_details = list(session_details)
+
+    # 1. Pattern prediction
+    groups = {"pattern": lambda: pattern_predict(session_details)}
+
+    # 2. LMC Gaming AI system prediction
+    if session_details:
+        groups["lmc"] = lambda: _lmc_predict(session_details)
+
+    results, _ = model_evaluator.run(groups)
+
+    # 3. AI prediction: chỉ đọc ô gọi nền của phiên này, không chờ OpenRouter
+    if OPENROUTER_API_KEY and session_details:
+        ai_slot = ai_prefetch.schedule(session_details[0]["sid"], session_details)
+        if ai_slot["status"] == READY:
+            results["ai"] = ai_slot["result"]
+
+    predictions = [pred for pred in results.values() if pred]
+
     # 4. Trend analysis đơn giản
     if len(session_details) >= 8:
         recent = [s["result"] for s in session_details[:8]]
@@ -881,37 +937,135 @@ def get_all_predictions(session_details):
     
     return predictions
 
-def combined_prediction(session_details):
-    """Kết hợp tất cả dự đoán và chọn cái tốt nhất"""
-    all_predictions = get_all_predictions(session_details)
+def combined_prediction(session_details, all_predictions=None):
+    """Kết hợp tất cả dự đoán và chọn cái tốt nhất (dùng lại all_predictions nếu đã có)"""
+    if all_predictions is None:
+        all_predictions = get_all_predictions(session_details)
     
     if not all_predictions:
         return "Tài", 0.5, "Không có dự đoán nào"
     
-    # Tính điểm weighted
-    tai_score = 0
-    xiu_score = 0
-    
-    for pred in all_predictions:
-        weight = pred["confidence"]
-        if pred["prediction"] == "Tài":
-            tai_score += weight
-        else:
-            xiu_score += weight
-    
-    total_score = tai_score + xiu_score
-    
-    if total_score == 0:
-        final_prediction, final_confidence = "Tài", 0.5
+    # Tính điểm weighted (trọng số = confidence), chỉ dựng lý do cho 2 nguồn mạnh nhất
+    combined = EnsembleCombiner(labels=COMBINED_LABELS).load(all_predictions).combine(
+        top_k=2, tie="Xỉu", reason_format=lambda name, pred: pred["reason"]
+    )
+
+    if combined["total_score"] == 0:
+        final_prediction = "Tài"
+        final_confidence = 0.5
     else:
-        final_prediction = "Tài" if tai_score > xiu_score else "Xỉu"
-        final_confidence = max(tai_score, xiu_score) / total_score
-    
-    # Chọn 2 lý do có confidence cao nhất
-    sorted_predictions = sorted(all_predictions, key=lambda x: x["confidence"], reverse=True)
-    top_reasons = [pred["reason"] for pred in sorted_predictions[:2]]
-    
-    return final_prediction, final_confidence, " | ".join(top_reasons)
+        final_prediction = combined["prediction"]
+        final_confidence = combined["confidence"]
+
+    return final_prediction, final_confidence, " | ".join(combined["reasons"])
+
+# Gộp các request đồng thời của cùng một phiên thành một lần tính dự đoán
+prediction_flight = SingleFlight()
+# Các lần công bố dự đoán nối tiếp nhau; không giữ app.lock khi model đang chạy
+publish_lock = threading.Lock()
+
+# Phản hồi /api/hitclub dựng sẵn một lần mỗi phiên, phần chi tiết chỉ trả khi được yêu cầu
+prediction_snapshots = SnapshotPublisher(detail_keys=("prediction_details",))
+
+# ETag/Last-Modified cho các endpoint chỉ đổi khi có phiên mới (client đã có bản mới nhất nhận 304)
+conditional = ConditionalGet("taixiu_lmc_gaming_ai", SessionClock())
+
+# Luồng SSE /api/stream: mỗi phiên một sự kiện (kết quả + dự đoán phiên kế tiếp)
+session_events = EventStream(backfill=session_backfill(app.state))
+
+# Hub WebSocket (bật bằng WS_PORT, cần gói websockets): client đăng ký sự kiện phiên theo bàn/engine
+ws_hub = WebSocketHub(table=API_URL, engine="taixiu_lmc_gaming_ai")
+session_events.add_listener(ws_hub.publish)
+
+# ------------------------- BATCH PREDICTION -------------------------
+# /api/predict_batch: dự đoán cho chuỗi T/X (+ xúc xắc) do client gửi
+# Mỗi chuỗi chạy trên một LMCPredictionSystem riêng, không đụng lmc_system
+def _batch_feed(engine, result, dice):
+    engine.add_result(result)
+
+def _batch_predict(engine, sequence):
+    engine.set_session(sequence.sid)
+    return engine_result(engine.get_final_prediction())
+
+batch_predictor = BatchPredictor(lambda: LMCPredictionSystem(table=API_URL), _batch_feed, _batch_predict)
+
+def publish_prediction():
+    """Tính dự đoán kết hợp cho phiên mới nhất và công bố bản chụp phản hồi"""
+    # Tính trên bản chụp trạng thái đã công bố: poller vẫn nạp phiên trong lúc model chạy tới hạn chót
+    with publish_lock:
+        state = app.state.current
+        current_sid = state.session_ids[-1]
+        current_result = state.history[-1]
+
+        # Tính dự đoán các hệ thống con một lần, dùng cho cả kết hợp lẫn phần chi tiết
+        all_predictions = get_all_predictions(state.session_details)
+        prediction, confidence, reason = combined_prediction(state.session_details, all_predictions)
+        models_missed = list(model_evaluator.last_missed)
+
+        # Lưu dự đoán hiện tại cho phiên tiếp theo
+        app.previous_predictions[current_sid + 1] = {
+            "prediction": prediction,
+            "confidence": confidence,
+            "reason": reason,
+            "timestamp": format_now()
+        }
+
+        response_data = {
+            "api": "taixiu_lmc_gaming_ai",
+            "current_session": current_sid,
+            "current_result": current_result,
+            "next_session": current_sid + 1,
+            "prediction": prediction,
+            "confidence": round(confidence * 100, 2),
+            "reason": reason,
+            "system_version": "LMC Gaming AI v3.0",
+            "prediction_details": [
+                {
+                    "system": pred["reason"].split("]")[0] + "]",
+                    "prediction": pred["prediction"],
+                    "confidence": round(pred["confidence"] * 100, 2)
+                }
+                for pred in all_predictions
+            ]
+        }
+
+        # Báo các nhóm model trễ hạn chót trong phiên này
+        if models_missed:
+            response_data["models_missed"] = models_missed
+
+        # Trạng thái AI gọi nền cho phiên này ("pending" khi OpenRouter chưa trả về)
+        if OPENROUTER_API_KEY:
+            response_data["ai_status"] = ai_prefetch.get(current_sid)["status"]
+
+        # Thêm thông tin so sánh phiên trước (poller đã tính vào thống kê khi nạp phiên)
+        previous_pred = app.previous_predictions.get(current_sid - 1)
+        if previous_pred:
+            correct = previous_pred["prediction"] == current_result
+            response_data["previous_prediction_comparison"] = {
+                "session": current_sid - 1,
+                "prediction": previous_pred["prediction"],
+                "actual_result": current_result,
+                "correct": correct,
+                "confidence": round(previous_pred["confidence"] * 100, 2),
+                "status": "✅ ĐÚNG" if correct else "❌ SAI"
+            }
+
+        # Thêm thống kê độ chính xác tổng thể
+        response_data["accuracy_stats"] = {
+            "total_predictions": app.prediction_accuracy['total_predictions'],
+            "correct_predictions": app.prediction_accuracy['correct_predictions'],
+            "accuracy_rate": round(app.prediction_accuracy['accuracy_rate'], 2)
+        }
+
+    snapshot = prediction_snapshots.publish(current_sid, response_data)
+    # Chỉ lần công bố đầu của phiên thành sự kiện SSE (dựng lại sau khi AI trả về thì bỏ qua)
+    session_events.publish(snapshot.sid, snapshot.compact())
+    return snapshot
+
+def republish_prediction(sid):
+    """Dựng lại bản chụp khi phiên `sid` vẫn là phiên mới nhất"""
+    if app.session_ids and app.session_ids[-1] == sid:
+        publish_prediction()
 
 # ------------------------- SO SÁNH DỰ ĐOÁN PHIÊN TRƯỚC -------------------------
 def check_previous_prediction(current_session_id, current_result):
@@ -946,6 +1100,26 @@ def check_previous_prediction(current_session_id, current_result):
     
     return None
 
+# ------------------------- APP STATE -------------------------
+def lmc_status_view():
+    """Dữ liệu cho /api/lmc_status"""
+    return {
+        "system": "LMC Gaming AI",
+        "status": "active",
+        "total_models": 21,
+        "market_state": lmc_system.market_state,
+        "session_stats": lmc_system.session_stats,
+        "pattern_database_size": len(lmc_system.pattern_database),
+        "prediction_accuracy": app.prediction_accuracy
+    }
+
+def publish_state():
+    """Công bố bản chụp trạng thái mới cho các endpoint đọc (gọi khi đang giữ app.lock)"""
+    with engine_lock:
+        app.state.publish(app.history, app.session_ids, app.session_details, lmc_status=lmc_status_view())
+    if app.session_ids:
+        conditional.clock.tick(app.session_ids[-1])
+
 # ------------------------- POLL API -------------------------
 def poll_api():
     while True:
@@ -966,7 +1140,7 @@ def poll_api():
                 time.sleep(POLL_INTERVAL)
                 continue
 
-            with app.lock:
+            with app.lock, engine_lock:
                 if not app.session_ids or sid > app.session_ids[-1]:
                     app.session_ids.append(sid)
                     app.history.append(result)
@@ -978,6 +1152,7 @@ def poll_api():
                     
                     # Cập nhật LMC system
                     lmc_result = "T" if result == "Tài" else "X"
+                    lmc_system.update_performance(lmc_result)
                     lmc_system.add_result(lmc_result)
                     
                     # Kiểm tra dự đoán phiên trước
@@ -988,6 +1163,17 @@ def poll_api():
                     
                     logging.info(f"✅ Phiên mới #{sid}: {result} ({total})")
 
+                    # Gọi AI nền cho phiên kế tiếp với bản chụp lịch sử
+                    if OPENROUTER_API_KEY:
+                        ai_prefetch.schedule(sid, list(app.session_details))
+
+                    # Công bố bản chụp trạng thái mới cho các endpoint đọc
+                    publish_state()
+
+            # Tính và công bố dự đoán của phiên mới ngay khi nạp, ngoài app.lock
+            if app.session_ids and app.session_ids[-1] == sid and prediction_snapshots.get(sid) is None:
+                prediction_flight.do(sid, publish_prediction)
+
         except Exception as e:
             logging.error(f"❌ Lỗi API: {e}")
         time.sleep(POLL_INTERVAL)
@@ -998,113 +1184,122 @@ from datetime import datetime
 @app.route("/api/hitclub", methods=["GET"])
 def get_prediction():
     try:
-        with app.lock:
-            if not app.history or not app.session_ids or not app.session_details:
-                return jsonify({"error": "Chưa có dữ liệu"}), 500
-
-            current_sid = app.session_ids[-1]
-            current_result = app.history[-1]
-
-            prediction, confidence, reason = combined_prediction(app.session_details)
-
-            now_str = datetime.now().strftime("%d/%m/%Y %H:%M:%S")
-
-            # Lưu dự đoán hiện tại cho phiên tiếp theo
-            app.previous_predictions[current_sid + 1] = {
-                "prediction": prediction,
-                "confidence": confidence,
-                "reason": reason,
-                "timestamp": now_str
-            }
-
-            # Kiểm tra dự đoán phiên trước
-            previous_comparison = check_previous_prediction(current_sid, current_result)
-
-            response_data = {
-                "api": "taixiu_lmc_gaming_ai",
-                "current_time": now_str,
-                "current_session": current_sid,
-                "current_result": current_result,
-                "next_session": current_sid + 1,
-                "prediction": prediction,
-                "confidence": round(confidence * 100, 2),
-                "reason": reason,
-                "system_version": "LMC Gaming AI v3.0"
-            }
-
-            # Thêm thông tin so sánh phiên trước
-            if previous_comparison:
-                response_data["previous_prediction_comparison"] = {
-                    "session": previous_comparison["previous_session"],
-                    "prediction": previous_comparison["prediction"],
-                    "actual_result": previous_comparison["actual_result"],
-                    "correct": previous_comparison["correct"],
-                    "confidence": round(previous_comparison["confidence"] * 100, 2),
-                    "status": "✅ ĐÚNG" if previous_comparison["correct"] else "❌ SAI"
-                }
-
-            # Thêm thống kê độ chính xác tổng thể
-            response_data["accuracy_stats"] = {
-                "total_predictions": app.prediction_accuracy['total_predictions'],
-                "correct_predictions": app.prediction_accuracy['correct_predictions'],
-                "accuracy_rate": round(app.prediction_accuracy['accuracy_rate'], 2)
-            }
-
-            # Thêm thông tin chi tiết từ các hệ thống con
-            all_predictions = get_all_predictions(app.session_details)
-            prediction_details = []
-            
-            for pred in all_predictions:
-                prediction_details.append({
-                    "system": pred["reason"].split("]")[0] + "]",
-                    "prediction": pred["prediction"],
-                    "confidence": round(pred["confidence"] * 100, 2)
-                })
-            
-            response_data["prediction_details"] = prediction_details
-
-            return jsonify(response_data)
+        # Đọc bản chụp trạng thái hiện tại, không cần app.lock
+        state = app.state.current
+        if not state.history or not state.session_ids or not state.session_details:
+            return json_response({"error": "Chưa có dữ liệu"}), 500
+
+        current_sid = state.session_ids[-1]
+
+        # Bản chụp của phiên hiện tại; chỉ tính khi poller chưa kịp công bố (gộp theo mã phiên)
+        snapshot = prediction_snapshots.get(current_sid)
+        if snapshot is None:
+            snapshot = prediction_flight.do(current_sid, publish_prediction)
+
+        # Client đã có bản chụp này (cùng phiên, cùng lần công bố) thì trả 304, không dựng lại body
+        etag = conditional.etag(snapshot.sid, snapshot.revision, request.query_string.decode())
+        headers = conditional.headers(etag, snapshot.published_at, snapshot.provisional)
+        if conditional.not_modified(request.headers, etag, snapshot.published_at):
+            return Response(status=304, headers=headers)
+
+        now_str = format_now()
+        return Response(snapshot.body(request.args, now_str), mimetype="application/json", headers=headers)
     except Exception as e:
         logging.error(f"❌ Lỗi trong get_prediction: {e}")
-        return jsonify({"error": f"Lỗi máy chủ nội bộ: {str(e)}"}), 500
+        return json_response({"error": f"Lỗi máy chủ nội bộ: {str(e)}"}), 500
+
+@app.route("/api/stream", methods=["GET"])
+def stream_sessions():
+    """Server-Sent Events: một sự kiện mỗi phiên mới, nối lại bằng Last-Event-ID"""
+    # EventSource gửi Last-Event-ID khi tự nối lại; lần kết nối đầu có thể truyền qua ?last_event_id=
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    subscriber = session_events.subscribe(last_event_id)
+    return Response(session_events.iter_events(subscriber), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 @app.route("/api/history", methods=["GET"])
 def get_history():
-    with app.lock:
-        return jsonify({
-            "history": app.history,
-            "session_ids": app.session_ids,
-            "details": app.session_details,
-            "length": len(app.history)
+    state = app.state.current
+    etag = conditional.etag("history", state.version, request.query_string.decode())
+    headers = conditional.headers(etag, state.published_at)
+    if conditional.not_modified(request.headers, etag, state.published_at):
+        return Response(status=304, headers=headers)
+    # Có tham số phân trang/chọn trường thì trả theo trang; không có thì giữ định dạng cũ
+    if paginated(request.args):
+        try:
+            data = query_history(state.session_ids, state.session_details, request.args)
+        except ValueError as e:
+            return json_response({"error": str(e)}), 400
+        response = json_response(data)
+    else:
+        response = json_response({
+            "history": state.history,
+            "session_ids": state.session_ids,
+            "details": state.session_details,
+            "length": len(state.history)
         })
+    response.headers.update(headers)
+    return response
+
+@app.route("/api/predict_batch", methods=["POST"])
+def predict_batch():
+    """Dự đoán hàng loạt cho các chuỗi của client trên engine riêng, không đụng trạng thái live"""
+    try:
+        sequences = parse_batch(request.get_json(silent=True))
+    except ValueError as e:
+        return json_response({"error": str(e)}), 400
+    try:
+        data = batch_predictor.run(sequences)
+    except BatchBusy as e:
+        return json_response({"error": str(e)}), 503
+    data["api"] = "taixiu_lmc_gaming_ai"
+    return json_response(data)
 
 @app.route("/api/health", methods=["GET"])
 def health_check():
-    return jsonify({
+    # Phần engine đọc từ view đã công bố: worker theo sau không chạy engine
+    lmc = app.state.current.view("lmc_status") or lmc_status_view()
+    return json_response({
         "status": "healthy",
         "timestamp": datetime.now().isoformat(),
-        "history_count": len(app.history),
+        "history_count": len(app.state.current.history),
         "ai_configured": bool(OPENROUTER_API_KEY),
+        "model_evaluator": model_evaluator.status(),
+        "ai_prefetch": ai_prefetch.status(),
+        "llm_cache": llm_cache.status(),
+        "llm_breaker": llm_cache.guard.status(),
+        "prediction_flight": prediction_flight.status(),
+        "prediction_snapshot": prediction_snapshots.status(),
+        "app_state": app.state.status(),
+        "conditional_get": conditional.status(),
+        "event_stream": session_events.status(),
+        "ws_hub": ws_hub.status(),
+        "rate_limit": rate_limiter.status(),
+        "batch_predict": batch_predictor.status(),
+        "lock_wait": app.lock.status(),
         "lmc_gaming_ai": "active",
         "total_models": 21,
-        "prediction_accuracy": app.prediction_accuracy,
+        "prediction_accuracy": lmc["prediction_accuracy"],
         "systems": ["Pattern Matching", "AI Deepseek", "LMC Gaming AI (21 models)"]
     })
 
 @app.route("/api/lmc_status", methods=["GET"])
 def lmc_status():
-    return jsonify({
-        "system": "LMC Gaming AI",
-        "status": "active",
-        "total_models": 21,
-        "market_state": lmc_system.market_state,
-        "session_stats": lmc_system.session_stats,
-        "pattern_database_size": len(lmc_system.pattern_database),
-        "prediction_accuracy": app.prediction_accuracy
-    })
+    # Dựng sẵn khi công bố trạng thái; trước phiên đầu tiên thì dựng trực tiếp
+    return json_response(app.state.current.view("lmc_status") or lmc_status_view())
+
+def start_ingestion():
+    """Khởi động phần nạp dữ liệu (poller, hub WebSocket); khi chạy nhiều worker chỉ leader gọi"""
+    # Worker vừa được bầu làm leader đã có lịch sử sao từ leader cũ: nạp lại vào engine, cũ nhất trước
+    with app.lock, engine_lock:
+        for detail in reversed(app.session_details):
+            lmc_system.add_result(detail["result"][0])  # 'T' hoặc 'X'
 
-if __name__ == "__main__":
     threading.Thread(target=poll_api, daemon=True).start()
+    ws_hub.start()
+
+if __name__ == "__main__":
+    start_ingestion()
     port = int(os.getenv("PORT", 9099))
     logging.info(f"🚀 Khởi động LMC Gaming AI System trên port {port}")
     logging.info(f"📊 Hệ thống bao gồm 21 AI models tích hợp")
@@ -7,26 +7,53 @@ import requests
 import random
 import math
 from collections import Counter
-from flask import Flask, jsonify
+from functools import partial
+from flask import Flask, Response, request
 from flask_cors import CORS
-from datetime import datetime
+from fast_json import json_response, format_now
+from rate_limit import LoadShedder, expensive_budget
+from ensemble import EnsembleCombiner
+from parallel_eval import DeadlineEvaluator, serialized
+from llm_prefetch import LLMPrefetcher, READY
+from llm_cache import LLMCache
+from circuit_breaker import LLMUnavailable
+from llm_stream import JSONFieldParser
+from single_flight import SingleFlight
+from snapshot import SnapshotPublisher
+from conditional import ConditionalGet, SessionClock
+from history_query import paginated, query_history
+from event_stream import EventStream, session_backfill
+from ws_hub import WebSocketHub
+from batch_predict import BatchPredictor, BatchBusy, engine_result, parse_batch
+from state_store import StateStore, TimedLock
+from model_registry import ModelRegistry
+from accuracy_tracker import AccuracyTracker
+from hedge import HedgeWeights
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
 API_URL = "https://hithu-ddo6.onrender.com/api/hit"
 POLL_INTERVAL = 5
 MAX_HISTORY_LEN = 500
+MODEL_DEADLINE = float(os.getenv("MODEL_DEADLINE", "2.5"))  # giây
 
 # OpenRouter API configuration
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY","")
-OPENROUTER_API_URL = "https://openrouter.ai/api/v1/chat/completions"
+OPENROUTER_API_URL = os.getenv("OPENROUTER_URL", "https://openrouter.ai/api/v1/chat/completions")
 
 app = Flask(__name__)
 CORS(app)
+# Hạn mức request theo client và giới hạn đồng thời: trả 429 trước mọi khóa và model
+rate_limiter = LoadShedder(routes={"/api/predict_batch": expensive_budget()}).install(app)
 app.history = []
 app.session_ids = []
 app.session_details = []
-app.lock = threading.Lock()
+app.lock = TimedLock()  # Khóa của bên ghi, có đo thời gian chờ
+# Bản chụp trạng thái copy-on-write cho các endpoint đọc (không cần app.lock)
+app.state = StateStore()
+
+# Cache phản hồi OpenRouter theo nội dung yêu cầu (model + prompt + tham số)
+llm_cache = LLMCache()
 
 # ------------------------- PATTERN DATA -------------------------
 PATTERN_DATA = {
@@ -129,6 +156,9 @@ SUM_STATS = {
 }
 
 # ------------------------- ULTRA DICE PREDICTION SYSTEM -------------------------
+# Sổ đăng ký model: mỗi model khai báo lookback, đặc trưng và lớp chi phí
+ULTRA_MODELS = ModelRegistry()
+
 class UltraDicePredictionSystem:
     def __init__(self):
         self.history = []
@@ -160,24 +190,34 @@ class UltraDicePredictionSystem:
             "pattern_confidence_growth": 1.05
         }
         self.previous_top_models = []
+        self.ensemble = EnsembleCombiner()
         self.init_all_models()
 
     def init_all_models(self):
-        for i in range(1, 22):
-            model_name = f"model{i}"
-            self.models[model_name] = getattr(self, model_name, lambda: None)
+        for model_name in ULTRA_MODELS.names():
+            # Gọi qua registry để luôn được kiểm tra lookback và dùng lại kết quả
+            self.models[model_name] = partial(self.predict_model, model_name)
             self.weights[model_name] = 1
-            self.performance[model_name] = {
-                "correct": 0,
-                "total": 0,
-                "recent_correct": 0,
-                "recent_total": 0,
-                "streak": 0,
-                "max_streak": 0
-            }
+            self.ensemble.slot(model_name)
+            self.performance[model_name] = AccuracyTracker()
+        # Trọng số học trực tuyến (Hedge), khởi tạo từ trọng số mặc định
+        self.hedge = HedgeWeights(list(self.weights), initial=self.weights)
+        # Dự đoán từng model đưa ra trước khi phiên tới có kết quả, chờ đối chiếu
+        self.pending_predictions = None
         self.init_pattern_database()
         self.init_advanced_patterns()
 
+    def predict_model(self, name):
+        """Chạy một model qua registry (self.models giữ partial của phương thức này
+        để bản sao deepcopy của engine gọi model trên chính bản sao)"""
+        return ULTRA_MODELS.predict(self, name)
+
+    @property
+    def window(self):
+        """Lát lịch sử dùng chung của lượt chạy model hiện tại"""
+        ctx = ULTRA_MODELS.context(self)
+        return ctx.window if ctx is not None else self.history
+
     def init_pattern_database(self):
         self.pattern_database = {
             '1-1': {"pattern": ['T', 'X', 'T', 'X'], "probability": 0.7, "strength": 0.8},
@@ -328,10 +368,10 @@ class UltraDicePredictionSystem:
                         }
 
     # Các model chính
+    @ULTRA_MODELS.register("model1", min_lookback=4, max_lookback=10,
+                           features=("pattern_database", "market_state"), cost="expensive")
     def model1(self):
-        recent = self.history[-10:] if len(self.history) >= 10 else self.history
-        if len(recent) < 4:
-            return None
+        recent = self.window[-10:]
         
         patterns = self.model1_mini(recent)
         if not patterns:
@@ -371,12 +411,10 @@ class UltraDicePredictionSystem:
         
         return patterns
 
+    @ULTRA_MODELS.register("model2", min_lookback=10, max_lookback=20, features=("market_state",), cost="medium")
     def model2(self):
-        short_term = self.history[-5:] if len(self.history) >= 5 else self.history
-        long_term = self.history[-20:] if len(self.history) >= 20 else self.history
-        
-        if len(short_term) < 3 or len(long_term) < 10:
-            return None
+        short_term = self.window[-5:]
+        long_term = self.window[-20:]
         
         short_analysis = self.model2_mini(short_term)
         long_analysis = self.model2_mini(long_term)
@@ -419,10 +457,9 @@ class UltraDicePredictionSystem:
         
         return {"trend": trend, "strength": strength, "volatility": volatility}
 
+    @ULTRA_MODELS.register("model3", min_lookback=12, max_lookback=12, features=("market_state",))
     def model3(self):
-        recent = self.history[-12:] if len(self.history) >= 12 else self.history
-        if len(recent) < 12:
-            return None
+        recent = self.window[-12:]
         
         analysis = self.model3_mini(recent)
         
@@ -457,10 +494,9 @@ class UltraDicePredictionSystem:
     # Thêm các model khác ở đây (model4 đến model21)
     # Do giới hạn độ dài, tôi chỉ thêm một số model chính
 
+    @ULTRA_MODELS.register("model4", min_lookback=4, max_lookback=6, features=("market_state",))
     def model4(self):
-        recent = self.history[-6:] if len(self.history) >= 6 else self.history
-        if len(recent) < 4:
-            return None
+        recent = self.window[-6:]
         
         analysis = self.model4_mini(recent)
         
@@ -499,13 +535,14 @@ class UltraDicePredictionSystem:
             else:
                 return {"prediction": data[-1], "confidence": 0.55, "trend": "Ổn định"}
 
+    @ULTRA_MODELS.register("model20", features=("performance",), cost="meta")
     def model20(self):
         performance = self.model13_mini()
         best_models = [
             (model, stats) for model, stats in performance.items() 
             if stats["total"] > 10
         ]
-        best_models.sort(key=lambda x: x[1]["accuracy"], reverse=True)
+        best_models.sort(key=lambda x: x[1]["recent_accuracy"], reverse=True)
         best_models = best_models[:3]
         
         if not best_models:
@@ -513,14 +550,14 @@ class UltraDicePredictionSystem:
         
         predictions = {}
         for model_name, _ in best_models:
-            predictions[model_name] = self.models[model_name]()
+            predictions[model_name] = ULTRA_MODELS.predict(self, model_name)
         
         t_score = 0
         x_score = 0
         
         for model_name, prediction in predictions.items():
             if prediction and prediction["prediction"]:
-                weight = performance[model_name]["accuracy"]
+                weight = performance[model_name]["recent_accuracy"]
                 if prediction["prediction"] == 'T':
                     t_score += weight * prediction["confidence"]
                 else:
@@ -537,65 +574,39 @@ class UltraDicePredictionSystem:
         }
 
     def model13_mini(self):
-        stats = {}
-        for model_name, perf in self.performance.items():
-            if perf["total"] > 0:
-                stats[model_name] = {
-                    "accuracy": perf["correct"] / perf["total"],
-                    "recent_accuracy": perf["recent_correct"] / perf["recent_total"] if perf["recent_total"] > 0 else 0,
-                    "total": perf["total"],
-                    "recent_total": perf["recent_total"],
-                    "streak": perf["streak"],
-                    "max_streak": perf["max_streak"]
-                }
-        return stats
+        # recent_* và windows là số liệu đếm đúng trên các cửa sổ 20/50/200 phiên
+        return {
+            model_name: perf.to_dict()
+            for model_name, perf in self.performance.items()
+            if perf.total > 0
+        }
 
     def get_all_predictions(self):
-        predictions = {}
-        for i in range(1, 22):
-            model_name = f"model{i}"
-            predictions[model_name] = self.models[model_name]()
-        return predictions
+        return ULTRA_MODELS.run(self)
 
     def get_final_prediction(self):
         predictions = self.get_all_predictions()
-        t_score = 0
-        x_score = 0
-        total_weight = 0
-        reasons = []
-        
-        for model_name, prediction in predictions.items():
-            if prediction and prediction["prediction"]:
-                weight = self.weights.get(model_name, 1)
-                score = prediction["confidence"] * weight
-                
-                if prediction["prediction"] == 'T':
-                    t_score += score
-                elif prediction["prediction"] == 'X':
-                    x_score += score
-                
-                total_weight += weight
-                reasons.append(f"{model_name}: {prediction['reason']} ({prediction['confidence']:.2f})")
-        
-        if total_weight == 0:
+        self.pending_predictions = predictions
+
+        # Kết hợp vector hóa; lý do chỉ được dựng cho các model đóng góp nhiều nhất
+        self.ensemble.set_weights(self.weights)
+        combined = self.ensemble.load(predictions).combine(
+            top_k=3,
+            reason_format=lambda name, p: f"{name}: {p['reason']} ({p['confidence']:.2f})"
+        )
+        
+        if combined["total_weight"] == 0:
             return None
         
-        final_prediction = None
-        final_confidence = 0
-        
-        if t_score > x_score:
-            final_prediction = 'T'
-            final_confidence = t_score / (t_score + x_score)
-        elif x_score > t_score:
-            final_prediction = 'X'
-            final_confidence = x_score / (t_score + x_score)
+        final_prediction = combined["prediction"]
+        final_confidence = combined["confidence"] if final_prediction else 0
         
         final_confidence = self.adjust_confidence_by_volatility(final_confidence)
         
         return {
             "prediction": final_prediction,
             "confidence": final_confidence,
-            "reasons": reasons,
+            "reasons": combined["reasons"],
             "details": predictions,
             "session_stats": self.session_stats,
             "market_state": self.market_state
@@ -609,33 +620,23 @@ class UltraDicePredictionSystem:
         return confidence
 
     def update_performance(self, actual_result):
-        predictions = self.get_all_predictions()
+        # Chấm dự đoán đã đưa ra trước phiên này; lịch sử lúc đó chưa chứa kết quả
+        predictions = self.pending_predictions
+        self.pending_predictions = None
+        if predictions is None:
+            # Chưa dự đoán phiên này: lịch sử vẫn chưa có kết quả nên dự đoán bây giờ vẫn hợp lệ
+            if not self.history:
+                return
+            predictions = self.get_all_predictions()
         
         for model_name, prediction in predictions.items():
             if prediction and prediction["prediction"]:
-                self.performance[model_name]["total"] += 1
-                self.performance[model_name]["recent_total"] += 1
-                
-                if prediction["prediction"] == actual_result:
-                    self.performance[model_name]["correct"] += 1
-                    self.performance[model_name]["recent_correct"] += 1
-                    self.performance[model_name]["streak"] += 1
-                    self.performance[model_name]["max_streak"] = max(
-                        self.performance[model_name]["max_streak"],
-                        self.performance[model_name]["streak"]
-                    )
-                else:
-                    self.performance[model_name]["streak"] = 0
-                
-                if self.performance[model_name]["recent_total"] > 50:
-                    self.performance[model_name]["recent_total"] -= 1
-                    if (self.performance[model_name]["recent_correct"] > 0 and 
-                        self.performance[model_name]["recent_correct"] / self.performance[model_name]["recent_total"] > 
-                        self.performance[model_name]["correct"] / self.performance[model_name]["total"]):
-                        self.performance[model_name]["recent_correct"] -= 1
-                
-                accuracy = self.performance[model_name]["correct"] / self.performance[model_name]["total"]
-                self.weights[model_name] = max(0.1, min(2, accuracy * 2))
+                perf = self.performance[model_name]
+                perf.record(prediction["prediction"] == actual_result)
+
+        # Cập nhật trọng số bằng Hedge: một bước nhân trên toàn bộ model mỗi phiên
+        self.hedge.update_outcomes(predictions, actual_result)
+        self.weights.update(self.hedge.as_dict())
         
         total_predictions = sum(1 for p in predictions.values() if p and p["prediction"])
         correct_predictions = sum(1 for p in predictions.values() if p and p["prediction"] == actual_result)
@@ -644,6 +645,9 @@ class UltraDicePredictionSystem:
 # Khởi tạo hệ thống dự đoán
 ultra_system = UltraDicePredictionSystem()
 
+# Khóa riêng của engine cho poller, nhóm model và view công bố (luôn lấy sau app.lock)
+engine_lock = threading.RLock()
+
 # ------------------------- GEMMA AI PREDICTION -------------------------
 def query_gemma_ai(history_data):
     """Truy vấn model Gemma qua OpenRouter API"""
@@ -680,13 +684,20 @@ def query_gemma_ai(history_data):
             "max_tokens": 500
         }
         
-        response = requests.post(OPENROUTER_API_URL, json=payload, headers=headers, timeout=30)
-        response.raise_for_status()
+        # Stream câu trả lời, đóng kết nối ngay khi đã có prediction và confidence
+        response = llm_cache.stream(OPENROUTER_API_URL, json=payload, headers=headers, timeout=30,
+                                    parser_class=JSONFieldParser)
+        if response.status_code != 200:
+            logging.error(f"Gemma AI trả về mã lỗi {response.status_code}")
+            return None
         
-        result = response.json()
-        content = result["choices"][0]["message"]["content"]
+        if response.fields:
+            prediction_data = response.fields
+            prediction_data.setdefault("reason", "Gemma dự đoán (dừng stream sớm)")
+            return prediction_data
         
-        # Parse JSON response
+        # Stream kết thúc mà chưa đủ trường: parse JSON trên toàn bộ nội dung
+        content = response.text
         import re
         json_match = re.search(r'\{.*\}', content, re.DOTALL)
         if json_match:
@@ -696,6 +707,10 @@ def query_gemma_ai(history_data):
             logging.error("Không thể parse JSON từ response Gemma AI")
             return None
             
+    except LLMUnavailable as e:
+        # Mạch ngắt đang mở: bỏ phiếu Gemma ngay, các hệ thống cục bộ tự quyết định
+        logging.info(f"⏭️ Bỏ qua Gemma: {e}")
+        return None
     except Exception as e:
         logging.error(f"Lỗi khi query Gemma AI: {e}")
         return None
@@ -724,6 +739,17 @@ def pattern_predict(session_details):
     return "Tài", "[Pattern] Không match pattern, fallback Tài"
 
 # ------------------------- COMBINED PREDICTION -------------------------
+# Nhãn của bộ kết hợp trong get_combined_prediction; mỗi lần gọi dựng bộ kết hợp riêng nên các luồng không chia sẻ mảng
+COMBINED_LABELS = ("Tài", "Xỉu")
+
+# Bộ đánh giá song song các nhóm model, giới hạn thời gian mỗi phiên
+model_evaluator = DeadlineEvaluator(deadline=MODEL_DEADLINE)
+
+# Dự đoán Gemma cho phiên kế tiếp được gọi nền ngay khi poller nạp phiên mới
+# Gemma trả về thì dựng lại bản chụp của phiên để dự đoán có thêm nhóm Gemma
+gemma_prefetch = LLMPrefetcher(query_gemma_ai, name="gemma-prefetch",
+                               on_done=lambda sid, slot: republish_prediction(sid))
+
 def get_combined_prediction(session_details):
     """Kết hợp dự đoán từ multiple sources"""
     try:
@@ -731,19 +757,25 @@ def get_combined_prediction(session_details):
         pattern_pred, pattern_reason = pattern_predict(session_details)
         
         # 2. Ultra System prediction
-        ultra_result = None
+        groups = {}
         if ultra_system.history:
-            ultra_result = ultra_system.get_final_prediction()
+            groups["ultra"] = serialized(engine_lock, ultra_system.get_final_prediction)
+        
+        # Chạy song song các nhóm, chỉ dùng kết quả về kịp hạn chót
+        results, _ = model_evaluator.run(groups)
+        ultra_result = results.get("ultra")
         
-        # 3. Gemma AI prediction (nếu có API key)
+        # 3. Gemma AI prediction: chỉ đọc ô gọi nền của phiên này, không chờ OpenRouter
         gemma_result = None
         if OPENROUTER_API_KEY and session_details:
-            history_data = [s["result"] for s in session_details]
-            gemma_result = query_gemma_ai(history_data)
+            gemma_slot = gemma_prefetch.schedule(
+                session_details[0]["sid"], [s["result"] for s in session_details]
+            )
+            if gemma_slot["status"] == READY:
+                gemma_result = gemma_slot["result"]
         
         # Kết hợp các dự đoán
         predictions = []
-        reasons = []
         
         # Pattern prediction
         pattern_confidence = 0.6  # Default confidence
@@ -781,36 +813,18 @@ def get_combined_prediction(session_details):
         if not predictions:
             return "Tài", "[Combined] Không có dự đoán nào", []
         
-        # Weighted average
-        tai_score = 0
-        xiu_score = 0
-        total_weight = 0
+        # Weighted average (trọng số = confidence) qua bộ kết hợp vector
+        combined = EnsembleCombiner(labels=COMBINED_LABELS).load(predictions).combine(top_k=0, tie="Xỉu")
         
-        for pred in predictions:
-            weight = pred["confidence"]
-            if pred["prediction"] == "Tài":
-                tai_score += weight
-            else:
-                xiu_score += weight
-            total_weight += weight
-            reasons.append(f"{pred['source']}: {pred['reason']}")
-        
-        if total_weight == 0:
+        if combined["total_score"] == 0:
             final_prediction = "Tài"
             final_confidence = 0.5
         else:
-            tai_prob = tai_score / total_weight
-            xiu_prob = xiu_score / total_weight
-            
-            if tai_prob > xiu_prob:
-                final_prediction = "Tài"
-                final_confidence = tai_prob
-            else:
-                final_prediction = "Xỉu" 
-                final_confidence = xiu_prob
+            final_prediction = combined["prediction"]
+            final_confidence = combined["confidence"]
         
         # Adjust confidence based on agreement
-        agreement = max(tai_prob, xiu_prob)
+        agreement = final_confidence
         if agreement > 0.7:
             final_confidence = min(0.95, final_confidence * 1.1)
         elif agreement < 0.5:
@@ -824,6 +838,95 @@ def get_combined_prediction(session_details):
         logging.error(f"Lỗi trong combined prediction: {e}")
         return "Tài", f"[Combined] Lỗi: {str(e)}", []
 
+# Gộp các request đồng thời của cùng một phiên thành một lần tính dự đoán
+prediction_flight = SingleFlight()
+# Các lần công bố dự đoán nối tiếp nhau; không giữ app.lock khi model đang chạy
+publish_lock = threading.Lock()
+
+# Phản hồi /api/hitclub dựng sẵn một lần mỗi phiên, phần chi tiết chỉ trả khi được yêu cầu
+prediction_snapshots = SnapshotPublisher(detail_keys=("all_predictions",))
+
+# ETag/Last-Modified cho các endpoint chỉ đổi khi có phiên mới (client đã có bản mới nhất nhận 304)
+conditional = ConditionalGet("taixiu_anhbaocx_ultra", SessionClock())
+
+# Luồng SSE /api/stream: mỗi phiên một sự kiện (kết quả + dự đoán phiên kế tiếp)
+session_events = EventStream(backfill=session_backfill(app.state))
+
+# Hub WebSocket (bật bằng WS_PORT, cần gói websockets): client đăng ký sự kiện phiên theo bàn/engine
+ws_hub = WebSocketHub(table=API_URL, engine="taixiu_anhbaocx_ultra")
+session_events.add_listener(ws_hub.publish)
+
+# ------------------------- BATCH PREDICTION -------------------------
+# /api/predict_batch: dự đoán cho chuỗi T/X (+ xúc xắc) do client gửi
+# Mỗi chuỗi chạy trên một UltraDicePredictionSystem riêng, không đụng ultra_system
+def _batch_feed(engine, result, dice):
+    engine.add_result(result)
+
+def _batch_predict(engine, sequence):
+    return engine_result(engine.get_final_prediction())
+
+batch_predictor = BatchPredictor(UltraDicePredictionSystem, _batch_feed, _batch_predict)
+
+def publish_prediction():
+    """Tính dự đoán kết hợp cho phiên mới nhất và công bố bản chụp phản hồi"""
+    # Tính trên bản chụp trạng thái đã công bố: poller vẫn nạp phiên trong lúc model chạy tới hạn chót
+    with publish_lock:
+        state = app.state.current
+        current_sid = state.session_ids[-1]
+        current_result = state.history[-1]
+
+        prediction, reason, all_predictions = get_combined_prediction(state.session_details)
+        models_missed = list(model_evaluator.last_missed)
+
+        response_data = {
+            "api": "taixiu_anhbaocx_ultra",
+            "current_session": current_sid,
+            "current_result": current_result,
+            "next_session": current_sid + 1,
+            "prediction": prediction,
+            "reason": reason,
+            "confidence": 0.7,  # Placeholder, sẽ được tính từ combined prediction
+            "all_predictions": all_predictions
+        }
+
+        # Báo các nhóm model trễ hạn chót trong phiên này
+        if models_missed:
+            response_data["models_missed"] = models_missed
+
+        # Trạng thái Gemma gọi nền cho phiên này ("pending" khi OpenRouter chưa trả về)
+        if OPENROUTER_API_KEY:
+            response_data["gemma_status"] = gemma_prefetch.get(current_sid)["status"]
+
+    snapshot = prediction_snapshots.publish(current_sid, response_data)
+    # Chỉ lần công bố đầu của phiên thành sự kiện SSE (dựng lại sau khi AI trả về thì bỏ qua)
+    session_events.publish(snapshot.sid, snapshot.compact())
+    return snapshot
+
+def republish_prediction(sid):
+    """Dựng lại bản chụp khi phiên `sid` vẫn là phiên mới nhất"""
+    if app.session_ids and app.session_ids[-1] == sid:
+        publish_prediction()
+
+# ------------------------- APP STATE -------------------------
+def ultra_stats_view():
+    """Phần engine của /api/ultra_stats"""
+    return {
+        "performance": ultra_system.model13_mini(),
+        "weights": ultra_system.weights,
+        "session_stats": ultra_system.session_stats,
+        "market_state": ultra_system.market_state,
+        "pattern_count": len(ultra_system.pattern_database)
+    }
+
+def publish_state():
+    """Công bố bản chụp trạng thái mới cho các endpoint đọc (gọi khi đang giữ app.lock)"""
+    with engine_lock:
+        app.state.publish(app.history, app.session_ids, app.session_details,
+                          ultra_system_stats=ultra_system.session_stats, market_state=ultra_system.market_state,
+                          ultra_stats=ultra_stats_view())
+    if app.session_ids:
+        conditional.clock.tick(app.session_ids[-1])
+
 # ------------------------- POLL API -------------------------
 def poll_api():
     while True:
@@ -844,7 +947,7 @@ def poll_api():
                 time.sleep(POLL_INTERVAL)
                 continue
 
-            with app.lock:
+            with app.lock, engine_lock:
                 if not app.session_ids or sid > app.session_ids[-1]:
                     app.session_ids.append(sid)
                     app.history.append(result)
@@ -852,8 +955,8 @@ def poll_api():
                     
                     # Cập nhật Ultra System
                     ultra_result = "T" if result == "Tài" else "X"
-                    ultra_system.add_result(ultra_result)
                     ultra_system.update_performance(ultra_result)
+                    ultra_system.add_result(ultra_result)
                     
                     if len(app.history) > MAX_HISTORY_LEN:
                         app.history.pop(0)
@@ -861,6 +964,17 @@ def poll_api():
                         app.session_details.pop()
                     logging.info(f"✅ Phiên mới #{sid}: {result} ({total})")
 
+                    # Gọi Gemma nền cho phiên kế tiếp với bản chụp lịch sử
+                    if OPENROUTER_API_KEY:
+                        gemma_prefetch.schedule(sid, [s["result"] for s in app.session_details])
+
+                    # Công bố bản chụp trạng thái mới cho các endpoint đọc
+                    publish_state()
+
+            # Tính và công bố dự đoán của phiên mới ngay khi nạp, ngoài app.lock
+            if app.session_ids and app.session_ids[-1] == sid and prediction_snapshots.get(sid) is None:
+                prediction_flight.do(sid, publish_prediction)
+
         except Exception as e:
             logging.error(f"❌ Lỗi API: {e}")
         time.sleep(POLL_INTERVAL)
@@ -871,67 +985,114 @@ import re
 @app.route("/api/hitclub", methods=["GET"])
 def get_prediction():
     try:
-        with app.lock:
-            if not app.history or not app.session_ids or not app.session_details:
-                return jsonify({"error": "Chưa có dữ liệu"}), 500
-
-            current_sid = app.session_ids[-1]
-            current_result = app.history[-1]
-
-            # Sử dụng combined prediction
-            prediction, reason, all_predictions = get_combined_prediction(app.session_details)
-
-            # 👉 Thêm thời gian hiện tại
-            now_str = datetime.now().strftime("%d/%m/%Y %H:%M:%S")
-
-            response_data = {
-                "api": "taixiu_anhbaocx_ultra",
-                "current_time": now_str,
-                "current_session": current_sid,
-                "current_result": current_result,
-                "next_session": current_sid + 1,
-                "prediction": prediction,
-                "reason": reason,
-                "confidence": 0.7,  # Placeholder, sẽ được tính từ combined prediction
-                "all_predictions": all_predictions
-            }
+        # Đọc bản chụp trạng thái hiện tại, không cần app.lock
+        state = app.state.current
+        if not state.history or not state.session_ids or not state.session_details:
+            return json_response({"error": "Chưa có dữ liệu"}), 500
+
+        current_sid = state.session_ids[-1]
+
+        # Bản chụp của phiên hiện tại; chỉ tính khi poller chưa kịp công bố (gộp theo mã phiên)
+        snapshot = prediction_snapshots.get(current_sid)
+        if snapshot is None:
+            snapshot = prediction_flight.do(current_sid, publish_prediction)
 
-            return jsonify(response_data)
+        # Client đã có bản chụp này (cùng phiên, cùng lần công bố) thì trả 304, không dựng lại body
+        etag = conditional.etag(snapshot.sid, snapshot.revision, request.query_string.decode())
+        headers = conditional.headers(etag, snapshot.published_at, snapshot.provisional)
+        if conditional.not_modified(request.headers, etag, snapshot.published_at):
+            return Response(status=304, headers=headers)
+
+        # 👉 Thêm thời gian hiện tại
+        now_str = format_now()
+        return Response(snapshot.body(request.args, now_str), mimetype="application/json", headers=headers)
     except Exception as e:
         logging.error(f"❌ Lỗi trong get_prediction: {e}")
-        return jsonify({"error": f"Lỗi máy chủ nội bộ: {str(e)}"}), 500
+        return json_response({"error": f"Lỗi máy chủ nội bộ: {str(e)}"}), 500
+
+@app.route("/api/stream", methods=["GET"])
+def stream_sessions():
+    """Server-Sent Events: một sự kiện mỗi phiên mới, nối lại bằng Last-Event-ID"""
+    # EventSource gửi Last-Event-ID khi tự nối lại; lần kết nối đầu có thể truyền qua ?last_event_id=
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    subscriber = session_events.subscribe(last_event_id)
+    return Response(session_events.iter_events(subscriber), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 @app.route("/api/history", methods=["GET"])
 def get_history():
-    with app.lock:
-        return jsonify({
-            "history": app.history,
-            "session_ids": app.session_ids,
-            "details": app.session_details,
-            "length": len(app.history),
-            "ultra_system_stats": ultra_system.session_stats,
-            "market_state": ultra_system.market_state
+    state = app.state.current
+    etag = conditional.etag("history", state.version, request.query_string.decode())
+    headers = conditional.headers(etag, state.published_at)
+    if conditional.not_modified(request.headers, etag, state.published_at):
+        return Response(status=304, headers=headers)
+    # Có tham số phân trang/chọn trường thì trả theo trang; không có thì giữ định dạng cũ
+    if paginated(request.args):
+        try:
+            data = query_history(state.session_ids, state.session_details, request.args,
+                                 extras={"ultra_system_stats": state.view("ultra_system_stats"),
+                                         "market_state": state.view("market_state")})
+        except ValueError as e:
+            return json_response({"error": str(e)}), 400
+        response = json_response(data)
+    else:
+        response = json_response({
+            "history": state.history,
+            "session_ids": state.session_ids,
+            "details": state.session_details,
+            "length": len(state.history),
+            "ultra_system_stats": state.view("ultra_system_stats"),
+            "market_state": state.view("market_state")
         })
+    response.headers.update(headers)
+    return response
+
+@app.route("/api/predict_batch", methods=["POST"])
+def predict_batch():
+    """Dự đoán hàng loạt cho các chuỗi của client trên engine riêng, không đụng trạng thái live"""
+    try:
+        sequences = parse_batch(request.get_json(silent=True))
+    except ValueError as e:
+        return json_response({"error": str(e)}), 400
+    try:
+        data = batch_predictor.run(sequences)
+    except BatchBusy as e:
+        return json_response({"error": str(e)}), 503
+    data["api"] = "taixiu_anhbaocx_ultra"
+    return json_response(data)
 
 @app.route("/api/ultra_stats", methods=["GET"])
 def get_ultra_stats():
     """Endpoint để xem thống kê Ultra System"""
-    performance = ultra_system.model13_mini()
-    return jsonify({
-        "performance": performance,
-        "weights": ultra_system.weights,
-        "session_stats": ultra_system.session_stats,
-        "market_state": ultra_system.market_state,
-        "pattern_count": len(ultra_system.pattern_database)
+    # Đọc view đã công bố: worker theo sau không chạy engine; trước phiên đầu tiên thì dựng trực tiếp
+    return json_response({
+        **(app.state.current.view("ultra_stats") or ultra_stats_view()),
+        "gemma_prefetch": gemma_prefetch.status(),
+        "llm_cache": llm_cache.status(),
+        "llm_breaker": llm_cache.guard.status(),
+        "prediction_flight": prediction_flight.status(),
+        "prediction_snapshot": prediction_snapshots.status(),
+        "app_state": app.state.status(),
+        "conditional_get": conditional.status(),
+        "event_stream": session_events.status(),
+        "ws_hub": ws_hub.status(),
+        "rate_limit": rate_limiter.status(),
+        "batch_predict": batch_predictor.status(),
+        "lock_wait": app.lock.status()
     })
 
-if __name__ == "__main__":
-    # Khởi tạo dữ liệu ban đầu cho Ultra System từ lịch sử hiện có
-    with app.lock:
-        for detail in app.session_details:
+def start_ingestion():
+    """Khởi động phần nạp dữ liệu (poller, hub WebSocket); khi chạy nhiều worker chỉ leader gọi"""
+    # Khởi tạo dữ liệu ban đầu cho Ultra System từ lịch sử hiện có (session_details mới nhất trước)
+    with app.lock, engine_lock:
+        for detail in reversed(app.session_details):
             result_char = "T" if detail["result"] == "Tài" else "X"
             ultra_system.add_result(result_char)
     
     threading.Thread(target=poll_api, daemon=True).start()
+    ws_hub.start()
+
+if __name__ == "__main__":
+    start_ingestion()
     port = int(os.getenv("PORT", 9099))
     app.run(host="0.0.0.0", port=port)
@@ -6,8 +6,23 @@ import threading
 import requests
 import math
 import sys
-from flask import Flask, jsonify
+from flask import Flask, Response, request
 from flask_cors import CORS
+from fast_json import json_response, format_now
+from rate_limit import LoadShedder, expensive_budget
+from ensemble import EnsembleCombiner
+from hedge import HedgeWeights
+from parallel_eval import DeadlineEvaluator, serialized
+from llm_prefetch import LLMPrefetcher, READY
+from llm_cache import LLMCache
+from circuit_breaker import LLMUnavailable
+from single_flight import SingleFlight
+from snapshot import SnapshotPublisher
+from conditional import ConditionalGet, SessionClock
+from event_stream import EventStream, session_backfill
+from ws_hub import WebSocketHub
+from batch_predict import BatchPredictor, BatchBusy, engine_result, parse_batch
+from state_store import StateStore, TimedLock
 from datetime import datetime
 
 # Tăng giới hạn đệ quy để tránh lỗi
@@ -18,17 +33,25 @@ logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(
 API_URL = "https://apihithu.onrender.com/api/hit"
 POLL_INTERVAL = 5
 MAX_HISTORY_LEN = 200
+MODEL_DEADLINE = float(os.getenv("MODEL_DEADLINE", "2.5"))  # giây
 
 # OpenRouter API configuration
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY", "")
-OPENROUTER_API_URL = "https://openrouter.ai/api/v1/chat/completions"
+OPENROUTER_API_URL = os.getenv("OPENROUTER_URL", "https://openrouter.ai/api/v1/chat/completions")
 
 app = Flask(__name__)
 CORS(app)
+# Hạn mức request theo client và giới hạn đồng thời: trả 429 trước mọi khóa và model
+rate_limiter = LoadShedder(routes={"/api/predict_batch": expensive_budget()}).install(app)
 app.history = []
 app.session_ids = []
 app.session_details = []
-app.lock = threading.Lock()
+app.lock = TimedLock()  # Khóa của bên ghi, có đo thời gian chờ
+# Bản chụp trạng thái copy-on-write cho các endpoint đọc (không cần app.lock)
+app.state = StateStore()
+
+# Cache phản hồi OpenRouter theo nội dung yêu cầu (model + prompt + tham số)
+llm_cache = LLMCache()
 
 # Thêm biến để theo dõi kết quả dự đoán
 app.prediction_results = {
@@ -237,13 +260,18 @@ class CombinedPredictionSystem:
             "last_result": None,
             "volatility": 0.5
         }
+        # Khóa trùng tên model trong get_all_predictions để Hedge và bộ kết hợp khớp được
         self.model_weights = {
-            "trend_analysis": 1.0,
-            "streak_analysis": 1.0,
-            "probability_balance": 1.0,
+            "trend": 1.0,
+            "streak": 1.0,
+            "probability": 1.0,
             "momentum": 1.0,
-            "legacy_system": 1.2
+            "legacy": 1.2
         }
+        self.ensemble = EnsembleCombiner(weights=self.model_weights)
+        # Trọng số học trực tuyến (Hedge) và dự đoán chờ đối chiếu với phiên tới
+        self.hedge = HedgeWeights(list(self.model_weights), initial=self.model_weights)
+        self.pending_predictions = None
         
         # Legacy system variables
         self.legacy_data = {
@@ -274,6 +302,12 @@ class CombinedPredictionSystem:
                 self.session_stats["current_streak"] = 1
                 self.session_stats["last_result"] = result
 
+            # Cập nhật trọng số Hedge từ dự đoán gần nhất trước phiên này
+            if self.pending_predictions:
+                self.hedge.update_outcomes(self.pending_predictions, result)
+                self.model_weights.update(self.hedge.as_dict())
+                self.pending_predictions = None
+
             self.history.append(result)
             
             # Giới hạn lịch sử
@@ -488,6 +522,7 @@ class CombinedPredictionSystem:
         """Tổng hợp dự đoán cuối cùng"""
         try:
             predictions = self.get_all_predictions(xx_str)
+            self.pending_predictions = predictions
             
             if not predictions:
                 # Fallback: nếu không có dự đoán nào, dựa trên kết quả gần nhất
@@ -503,37 +538,24 @@ class CombinedPredictionSystem:
                 else:
                     return None
 
-            # Tính điểm tổng hợp
-            t_score = 0
-            x_score = 0
-            details = {}
+            # Tính điểm tổng hợp bằng bộ kết hợp vector
+            self.ensemble.set_weights(self.model_weights)
+            combined = self.ensemble.load(predictions).combine(top_k=0, tie="X")
 
-            for name, pred in predictions.items():
-                weight = self.model_weights.get(name, 1.0)
-                score = pred["confidence"] * weight
-                
-                if pred["prediction"] == "T":
-                    t_score += score
-                else:
-                    x_score += score
-                
-                details[name] = {
+            if combined["total_score"] == 0:
+                return None
+
+            final_prediction = combined["prediction"]
+            final_confidence = combined["confidence"]
+
+            details = {
+                name: {
                     "prediction": "Tài" if pred["prediction"] == "T" else "Xỉu",
                     "confidence": pred["confidence"],
                     "reason": pred["reason"]
                 }
-
-            total_score = t_score + x_score
-            
-            if total_score == 0:
-                return None
-
-            if t_score > x_score:
-                final_prediction = "T"
-                final_confidence = t_score / total_score
-            else:
-                final_prediction = "X" 
-                final_confidence = x_score / total_score
+                for name, pred in predictions.items()
+            }
 
             # Điều chỉnh confidence dựa trên volatility
             if self.session_stats["volatility"] > 0.7:
@@ -556,6 +578,9 @@ class CombinedPredictionSystem:
 # Khởi tạo hệ thống dự đoán
 prediction_system = CombinedPredictionSystem()
 
+# Khóa riêng của engine cho poller, nhóm model và view công bố (luôn lấy sau app.lock)
+engine_lock = threading.RLock()
+
 # ------------------------- AI PREDICTION -------------------------
 def query_ai_prediction(history_data):
     """Truy vấn AI dự đoán - với xử lý lỗi đầy đủ"""
@@ -591,7 +616,7 @@ def query_ai_prediction(history_data):
         }
 
         logging.info(f"Gửi request đến AI với {len(recent_history)} phiên lịch sử")
-        response = requests.post(OPENROUTER_API_URL, json=payload, headers=headers, timeout=30)
+        response = llm_cache.post(OPENROUTER_API_URL, json=payload, headers=headers, timeout=30)
         
         if response.status_code != 200:
             logging.warning(f"AI API trả về mã lỗi: {response.status_code}")
@@ -640,6 +665,10 @@ def query_ai_prediction(history_data):
         logging.warning("Không thể parse AI response")
         return None
 
+    except LLMUnavailable as e:
+        # Mạch ngắt đang mở: bỏ phiếu AI ngay, các hệ thống cục bộ tự quyết định
+        logging.info(f"⏭️ Bỏ qua AI: {e}")
+        return None
     except requests.exceptions.Timeout:
         logging.warning("AI request timeout sau 30 giây")
         return None
@@ -651,6 +680,17 @@ def query_ai_prediction(history_data):
         return None
 
 # ------------------------- COMBINED PREDICTION -------------------------
+# Nhãn của bộ kết hợp trong get_combined_prediction; mỗi lần gọi dựng bộ kết hợp riêng nên các luồng không chia sẻ mảng
+COMBINED_LABELS = ("Tài", "Xỉu")
+
+# Bộ đánh giá song song các nhóm model, giới hạn thời gian mỗi phiên
+model_evaluator = DeadlineEvaluator(deadline=MODEL_DEADLINE)
+
+# Dự đoán AI cho phiên kế tiếp được gọi nền ngay khi poller nạp phiên mới
+# AI trả về thì dựng lại bản chụp của phiên để dự đoán có thêm nhóm AI
+ai_prefetch = LLMPrefetcher(query_ai_prediction, name="ai-prefetch",
+                            on_done=lambda sid, slot: republish_prediction(sid))
+
 def get_combined_prediction(session_details):
     """Dự đoán kết hợp - an toàn và hiệu quả"""
     try:
@@ -663,17 +703,20 @@ def get_combined_prediction(session_details):
             current_xx = f"{session_details[0]['xuc_xac_1']}-{session_details[0]['xuc_xac_2']}-{session_details[0]['xuc_xac_3']}"
 
         # 1. Combined System prediction
-        system_result = prediction_system.get_final_prediction(current_xx)
-        
-        # 2. AI prediction (nếu có API key và đủ dữ liệu)
+        groups = {"system": serialized(engine_lock, lambda: prediction_system.get_final_prediction(current_xx))}
+
+        # Chạy song song các nhóm, chỉ dùng kết quả về kịp hạn chót
+        results, _ = model_evaluator.run(groups)
+        system_result = results.get("system")
+
+        # 2. AI prediction: chỉ đọc ô gọi nền của phiên này, không chờ OpenRouter
         ai_result = None
         if OPENROUTER_API_KEY and len(session_details) >= 5:
-            try:
-                history_data = [s["result"] for s in session_details]
-                ai_result = query_ai_prediction(history_data)
-            except Exception as e:
-                logging.error(f"Lỗi khi gọi AI: {e}")
-                ai_result = None
+            ai_slot = ai_prefetch.schedule(
+                session_details[0]["sid"], [s["result"] for s in session_details]
+            )
+            if ai_slot["status"] == READY:
+                ai_result = ai_slot["result"]
 
         # Thu thập tất cả dự đoán
         all_predictions = []
@@ -711,33 +754,18 @@ def get_combined_prediction(session_details):
         if not all_predictions:
             return "Tài", "Không có dự đoán khả dụng", []
 
-        # Tính toán dự đoán cuối cùng
-        tai_score = 0
-        xiu_score = 0
-        total_confidence = 0
+        # Tính toán dự đoán cuối cùng (trọng số = confidence) qua bộ kết hợp vector
+        combined = EnsembleCombiner(labels=COMBINED_LABELS).load(all_predictions).combine(top_k=0, tie="Xỉu")
 
-        for pred in all_predictions:
-            confidence = pred["confidence"]
-            total_confidence += confidence
-            
-            if pred["prediction"] == "Tài":
-                tai_score += confidence
-            else:
-                xiu_score += confidence
-
-        if total_confidence == 0:
+        if combined["total_score"] == 0:
             final_prediction = "Tài"
             final_confidence = 0.5
         else:
-            if tai_score > xiu_score:
-                final_prediction = "Tài"
-                final_confidence = tai_score / total_confidence
-            else:
-                final_prediction = "Xỉu"
-                final_confidence = xiu_score / total_confidence
+            final_prediction = combined["prediction"]
+            final_confidence = combined["confidence"]
 
         # Điều chỉnh confidence dựa trên sự đồng thuận
-        agreement = max(tai_score, xiu_score) / total_confidence
+        agreement = final_confidence
         if agreement > 0.7:
             final_confidence = min(0.95, final_confidence * 1.1)
 
@@ -749,44 +777,184 @@ def get_combined_prediction(session_details):
         logging.error(f"Lỗi trong get_combined_prediction: {e}")
         return "Tài", f"Lỗi hệ thống: {str(e)}", []
 
+# Gộp các request đồng thời của cùng một phiên thành một lần tính dự đoán
+prediction_flight = SingleFlight()
+# Các lần công bố dự đoán nối tiếp nhau; không giữ app.lock khi model đang chạy
+publish_lock = threading.Lock()
+
+# Phản hồi /api/hitclub dựng sẵn một lần mỗi phiên, phần chi tiết chỉ trả khi được yêu cầu
+prediction_snapshots = SnapshotPublisher(detail_keys=("all_predictions",))
+
+# ETag/Last-Modified cho các endpoint chỉ đổi khi có phiên mới (client đã có bản mới nhất nhận 304)
+conditional = ConditionalGet("taixiu_predictor_combined", SessionClock())
+
+# Luồng SSE /api/stream: mỗi phiên một sự kiện (kết quả + dự đoán phiên kế tiếp)
+session_events = EventStream(backfill=session_backfill(app.state))
+
+# Hub WebSocket (bật bằng WS_PORT, cần gói websockets): client đăng ký sự kiện phiên theo bàn/engine
+ws_hub = WebSocketHub(table=API_URL, engine="taixiu_predictor_combined")
+session_events.add_listener(ws_hub.publish)
+
+# ------------------------- BATCH PREDICTION -------------------------
+# /api/predict_batch: dự đoán cho chuỗi T/X (+ xúc xắc) do client gửi
+# Mỗi chuỗi chạy trên một CombinedPredictionSystem riêng, không đụng prediction_system
+def _batch_xx(dice):
+    return f"{dice[0]}-{dice[1]}-{dice[2]}" if dice else "0-0-0"
+
+def _batch_feed(engine, result, dice):
+    engine.add_result(result, _batch_xx(dice))
+
+def _batch_predict(engine, sequence):
+    return engine_result(engine.get_final_prediction(_batch_xx(sequence.last_dice())))
+
+batch_predictor = BatchPredictor(CombinedPredictionSystem, _batch_feed, _batch_predict)
+
+def publish_prediction():
+    """Tính dự đoán kết hợp cho phiên mới nhất và công bố bản chụp phản hồi"""
+    # Tính trên bản chụp trạng thái đã công bố: poller vẫn nạp phiên trong lúc model chạy tới hạn chót
+    with publish_lock:
+        state = app.state.current
+        current_session = state.session_ids[-1] if state.session_ids else "N/A"
+        current_result = state.history[-1] if state.history else "N/A"
+
+        prediction, reason, all_predictions = get_combined_prediction(state.session_details)
+        models_missed = list(model_evaluator.last_missed)
+
+        # Lấy thông tin xúc xắc của phiên hiện tại
+        current_details = state.session_details[0] if state.session_details else {}
+
+        # Lưu dự đoán vào session details (chỉ khi poller chưa nạp phiên mới hơn)
+        with app.lock:
+            if app.session_details and app.session_details[0].get("sid") == current_session:
+                app.session_details[0]["prediction"] = prediction
+                publish_state()
+
+        # Thống kê kết quả gần nhất
+        latest_stats = {
+            "total_predictions": app.prediction_results["total"],
+            "correct_predictions": app.prediction_results["correct"],
+            "incorrect_predictions": app.prediction_results["incorrect"],
+            "accuracy": round(app.prediction_results["accuracy"] * 100, 2),
+            "recent_results": app.prediction_results["history"][-5:]  # 5 kết quả gần nhất
+        }
+
+        response_data = {
+            "api": "taixiu_predictor_combined",
+            "current_session": {
+                "session_id": current_session,
+                "result": current_result,
+                "xuc_xac_1": current_details.get("xuc_xac_1", "N/A"),
+                "xuc_xac_2": current_details.get("xuc_xac_2", "N/A"),
+                "xuc_xac_3": current_details.get("xuc_xac_3", "N/A"),
+                "next_session": current_session + 1 if isinstance(current_session, int) else "N/A"
+            },
+            "prediction": prediction,
+            "reason": reason,
+            "total_predictions": len(all_predictions),
+            "prediction_stats": latest_stats,
+            "all_predictions": all_predictions
+        }
+
+        # Báo các nhóm model trễ hạn chót trong phiên này
+        if models_missed:
+            response_data["models_missed"] = models_missed
+
+        # Trạng thái AI gọi nền cho phiên này ("pending" khi OpenRouter chưa trả về)
+        ai_slot = ai_prefetch.get(current_session)
+        if ai_slot:
+            response_data["ai_status"] = ai_slot["status"]
+
+    snapshot = prediction_snapshots.publish(current_session, response_data)
+    # Chỉ lần công bố đầu của phiên thành sự kiện SSE (dựng lại sau khi AI trả về thì bỏ qua)
+    session_events.publish(snapshot.sid, snapshot.compact())
+    return snapshot
+
+def republish_prediction(sid):
+    """Dựng lại bản chụp khi phiên `sid` vẫn là phiên mới nhất"""
+    if app.session_ids and app.session_ids[-1] == sid:
+        publish_prediction()
+
 # ------------------------- PREDICTION TRACKING -------------------------
 def update_prediction_result(session_id, predicted, actual):
-    """Cập nhật kết quả dự đoán"""
+    """Cập nhật kết quả dự đoán (poller gọi khi đang giữ app.lock)"""
     try:
-        with app.lock:
-            app.prediction_results["total"] += 1
-            
-            if predicted == actual:
-                app.prediction_results["correct"] += 1
-                status = "ĐÚNG"
-                logging.info(f"✅ Dự đoán ĐÚNG cho phiên #{session_id}: Dự đoán {predicted}, Thực tế {actual}")
-            else:
-                app.prediction_results["incorrect"] += 1
-                status = "SAI"
-                logging.info(f"❌ Dự đoán SAI cho phiên #{session_id}: Dự đoán {predicted}, Thực tế {actual}")
-            
-            # Tính độ chính xác
-            if app.prediction_results["total"] > 0:
-                app.prediction_results["accuracy"] = (
-                    app.prediction_results["correct"] / app.prediction_results["total"]
-                )
-            
-            # Lưu lịch sử
-            app.prediction_results["history"].append({
-                "session_id": session_id,
-                "predicted": predicted,
-                "actual": actual,
-                "status": status,
-                "timestamp": datetime.now().isoformat()
-            })
+        app.prediction_results["total"] += 1
+        
+        if predicted == actual:
+            app.prediction_results["correct"] += 1
+            status = "ĐÚNG"
+            logging.info(f"✅ Dự đoán ĐÚNG cho phiên #{session_id}: Dự đoán {predicted}, Thực tế {actual}")
+        else:
+            app.prediction_results["incorrect"] += 1
+            status = "SAI"
+            logging.info(f"❌ Dự đoán SAI cho phiên #{session_id}: Dự đoán {predicted}, Thực tế {actual}")
+        
+        # Tính độ chính xác
+        if app.prediction_results["total"] > 0:
+            app.prediction_results["accuracy"] = (
+                app.prediction_results["correct"] / app.prediction_results["total"]
+            )
+        
+        # Lưu lịch sử
+        app.prediction_results["history"].append({
+            "session_id": session_id,
+            "predicted": predicted,
+            "actual": actual,
+            "status": status,
+            "timestamp": datetime.now().isoformat()
+        })
+        
+        # Giới hạn lịch sử
+        if len(app.prediction_results["history"]) > 100:
+            app.prediction_results["history"].pop(0)
             
-            # Giới hạn lịch sử
-            if len(app.prediction_results["history"]) > 100:
-                app.prediction_results["history"].pop(0)
-                
     except Exception as e:
         logging.error(f"Lỗi khi cập nhật kết quả dự đoán: {e}")
 
+# ------------------------- APP STATE -------------------------
+def stats_view():
+    """Dữ liệu cho /api/stats"""
+    system_stats = prediction_system.session_stats
+
+    return {
+        "system_stats": system_stats,
+        "history_size": len(prediction_system.history),
+        "app_history_size": len(app.history),
+        "model_weights": prediction_system.model_weights,
+        "hedge": prediction_system.hedge.status(),
+        "legacy_stats": {
+            "dem_sai": prediction_system.legacy_data["dem_sai"],
+            "pattern_sai_count": len(prediction_system.legacy_data["pattern_sai"]),
+            "diem_lich_su": prediction_system.legacy_data["diem_lich_su"]
+        }
+    }
+
+def prediction_stats_view():
+    """Dữ liệu cho /api/prediction_stats"""
+    return {
+        "total_predictions": app.prediction_results["total"],
+        "correct_predictions": app.prediction_results["correct"],
+        "incorrect_predictions": app.prediction_results["incorrect"],
+        "accuracy": round(app.prediction_results["accuracy"] * 100, 2),
+        "history": app.prediction_results["history"][-50:]  # 50 kết quả gần nhất
+    }
+
+def health_view():
+    """Phần engine của /api/health"""
+    return {
+        "system_ready": len(prediction_system.history) > 0,
+        "app_data_ready": len(app.history) > 0,
+        "prediction_tracking": app.prediction_results["total"] > 0
+    }
+
+def publish_state():
+    """Công bố bản chụp trạng thái mới cho các endpoint đọc (gọi khi đang giữ app.lock)"""
+    with engine_lock:
+        app.state.publish(app.history, app.session_ids, app.session_details, stats=stats_view(),
+                          prediction_stats=prediction_stats_view(), health=health_view())
+    if app.session_ids:
+        conditional.clock.tick(app.session_ids[-1])
+
 # ------------------------- API POLLING -------------------------
 def poll_api():
     """Lấy dữ liệu từ API - với xử lý lỗi robust"""
@@ -809,7 +977,7 @@ def poll_api():
                 xuc_xac_3 = data.get("Xuc_xac_3")
 
                 if all([sid, result, total is not None]):
-                    with app.lock:
+                    with app.lock, engine_lock:
                         # Kiểm tra phiên mới
                         if not app.session_ids or sid > app.session_ids[-1]:
                             # Kiểm tra dự đoán cho phiên trước
@@ -853,6 +1021,17 @@ def poll_api():
 
                             # Log với thông tin xúc xắc và so sánh kết quả
                             logging.info(f"✅ Phiên mới #{sid}: {result} ({total}) - Xúc xắc: {xuc_xac_1}, {xuc_xac_2}, {xuc_xac_3}")
+
+                            # Gọi AI nền cho phiên kế tiếp với bản chụp lịch sử
+                            if OPENROUTER_API_KEY and len(app.session_details) >= 5:
+                                ai_prefetch.schedule(sid, [s["result"] for s in app.session_details])
+
+                            # Công bố bản chụp trạng thái mới cho các endpoint đọc
+                            publish_state()
+
+                    # Tính và công bố dự đoán của phiên mới ngay khi nạp, ngoài app.lock
+                    if app.session_ids and app.session_ids[-1] == sid and prediction_snapshots.get(sid) is None:
+                        prediction_flight.do(sid, publish_prediction)
                 else:
                     logging.warning("Dữ liệu API không đầy đủ")
             else:
@@ -885,112 +1064,98 @@ def poll_api():
 def get_prediction():
     """Endpoint dự đoán chính"""
     try:
-        with app.lock:
-            if not app.session_details:
-                return jsonify({"error": "Chưa có dữ liệu"}), 400
+        # Đọc bản chụp trạng thái hiện tại, không cần app.lock
+        state = app.state.current
+        if not state.session_details:
+            return json_response({"error": "Chưa có dữ liệu"}), 400
 
-            current_session = app.session_ids[-1] if app.session_ids else "N/A"
-            current_result = app.history[-1] if app.history else "N/A"
-            
-            # Lấy thông tin xúc xắc của phiên hiện tại
-            current_details = app.session_details[0] if app.session_details else {}
-            xuc_xac_1 = current_details.get("xuc_xac_1", "N/A")
-            xuc_xac_2 = current_details.get("xuc_xac_2", "N/A")
-            xuc_xac_3 = current_details.get("xuc_xac_3", "N/A")
+        current_session = state.session_ids[-1]
 
-            prediction, reason, all_predictions = get_combined_prediction(app.session_details)
-            
-            # Lưu dự đoán vào session details
-            if app.session_details:
-                app.session_details[0]["prediction"] = prediction
+        # Bản chụp của phiên hiện tại; chỉ tính khi poller chưa kịp công bố (gộp theo mã phiên)
+        snapshot = prediction_snapshots.get(current_session)
+        if snapshot is None:
+            snapshot = prediction_flight.do(current_session, publish_prediction)
 
-            # Thống kê kết quả gần nhất
-            latest_stats = {
-                "total_predictions": app.prediction_results["total"],
-                "correct_predictions": app.prediction_results["correct"],
-                "incorrect_predictions": app.prediction_results["incorrect"],
-                "accuracy": round(app.prediction_results["accuracy"] * 100, 2),
-                "recent_results": app.prediction_results["history"][-5:]  # 5 kết quả gần nhất
-            }
+        # Client đã có bản chụp này (cùng phiên, cùng lần công bố) thì trả 304, không dựng lại body
+        etag = conditional.etag(snapshot.sid, snapshot.revision, request.query_string.decode())
+        headers = conditional.headers(etag, snapshot.published_at, snapshot.provisional)
+        if conditional.not_modified(request.headers, etag, snapshot.published_at):
+            return Response(status=304, headers=headers)
 
-            response_data = {
-                "api": "taixiu_predictor_combined",
-                "current_time": datetime.now().strftime("%d/%m/%Y %H:%M:%S"),
-                "current_session": {
-                    "session_id": current_session,
-                    "result": current_result,
-                    "xuc_xac_1": xuc_xac_1,
-                    "xuc_xac_2": xuc_xac_2,
-                    "xuc_xac_3": xuc_xac_3,
-                    "next_session": current_session + 1 if isinstance(current_session, int) else "N/A"
-                },
-                "prediction": prediction,
-                "reason": reason,
-                "all_predictions": all_predictions,
-                "total_predictions": len(all_predictions),
-                "prediction_stats": latest_stats
-            }
-
-            return jsonify(response_data)
+        now_str = format_now()
+        return Response(snapshot.body(request.args, now_str), mimetype="application/json", headers=headers)
 
     except Exception as e:
         logging.error(f"Lỗi endpoint /api/hitclub: {e}")
-        return jsonify({"error": "Lỗi server nội bộ"}), 500
+        return json_response({"error": "Lỗi server nội bộ"}), 500
+
+@app.route("/api/stream", methods=["GET"])
+def stream_sessions():
+    """Server-Sent Events: một sự kiện mỗi phiên mới, nối lại bằng Last-Event-ID"""
+    # EventSource gửi Last-Event-ID khi tự nối lại; lần kết nối đầu có thể truyền qua ?last_event_id=
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    subscriber = session_events.subscribe(last_event_id)
+    return Response(session_events.iter_events(subscriber), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 @app.route("/api/history", methods=["GET"])
 def get_history():
     """Lấy lịch sử kết quả"""
-    with app.lock:
-        # Thêm thông tin xúc xắc vào response history
-        detailed_history = []
-        for detail in app.session_details[:20]:
-            detailed_history.append({
-                "sid": detail.get("sid"),
-                "result": detail.get("result"),
-                "total": detail.get("total"),
-                "xuc_xac_1": detail.get("xuc_xac_1", "N/A"),
-                "xuc_xac_2": detail.get("xuc_xac_2", "N/A"),
-                "xuc_xac_3": detail.get("xuc_xac_3", "N/A"),
-                "prediction": detail.get("prediction", "N/A")
-            })
-            
-        return jsonify({
-            "recent_history": detailed_history,
-            "total_count": len(app.history)
+    state = app.state.current
+    etag = conditional.etag("history", state.version)
+    headers = conditional.headers(etag, state.published_at)
+    if conditional.not_modified(request.headers, etag, state.published_at):
+        return Response(status=304, headers=headers)
+
+    # Thêm thông tin xúc xắc vào response history
+    detailed_history = []
+    for detail in state.session_details[:20]:
+        detailed_history.append({
+            "sid": detail.get("sid"),
+            "result": detail.get("result"),
+            "total": detail.get("total"),
+            "xuc_xac_1": detail.get("xuc_xac_1", "N/A"),
+            "xuc_xac_2": detail.get("xuc_xac_2", "N/A"),
+            "xuc_xac_3": detail.get("xuc_xac_3", "N/A"),
+            "prediction": detail.get("prediction", "N/A")
         })
 
+    response = json_response({
+        "recent_history": detailed_history,
+        "total_count": len(state.history)
+    })
+    response.headers.update(headers)
+    return response
+
 @app.route("/api/prediction_stats", methods=["GET"])
 def get_prediction_stats():
     """Thống kê kết quả dự đoán"""
-    with app.lock:
-        return jsonify({
-            "total_predictions": app.prediction_results["total"],
-            "correct_predictions": app.prediction_results["correct"],
-            "incorrect_predictions": app.prediction_results["incorrect"],
-            "accuracy": round(app.prediction_results["accuracy"] * 100, 2),
-            "history": app.prediction_results["history"][-50:]  # 50 kết quả gần nhất
-        })
+    # Dựng sẵn khi công bố trạng thái; trước phiên đầu tiên thì dựng trực tiếp
+    return json_response(app.state.current.view("prediction_stats") or prediction_stats_view())
 
 @app.route("/api/stats", methods=["GET"])
 def get_stats():
     """Thống kê hệ thống"""
     try:
-        system_stats = prediction_system.session_stats
-        
-        return jsonify({
-            "system_stats": system_stats,
-            "history_size": len(prediction_system.history),
-            "app_history_size": len(app.history),
-            "model_weights": prediction_system.model_weights,
-            "legacy_stats": {
-                "dem_sai": prediction_system.legacy_data["dem_sai"],
-                "pattern_sai_count": len(prediction_system.legacy_data["pattern_sai"]),
-                "diem_lich_su": prediction_system.legacy_data["diem_lich_su"]
-            }
-        })
+        # Dựng sẵn khi công bố trạng thái; trước phiên đầu tiên thì dựng trực tiếp
+        return json_response(app.state.current.view("stats") or stats_view())
     except Exception as e:
         logging.error(f"Lỗi endpoint /api/stats: {e}")
-        return jsonify({"error": "Lỗi khi lấy thống kê"}), 500
+        return json_response({"error": "Lỗi khi lấy thống kê"}), 500
+
+@app.route("/api/predict_batch", methods=["POST"])
+def predict_batch():
+    """Dự đoán hàng loạt cho các chuỗi của client trên engine riêng, không đụng trạng thái live"""
+    try:
+        sequences = parse_batch(request.get_json(silent=True))
+    except ValueError as e:
+        return json_response({"error": str(e)}), 400
+    try:
+        data = batch_predictor.run(sequences)
+    except BatchBusy as e:
+        return json_response({"error": str(e)}), 503
+    data["api"] = "taixiu_predictor_combined"
+    return json_response(data)
 
 @app.route("/api/health", methods=["GET"])
 def health_check():
@@ -998,30 +1163,42 @@ def health_check():
     health_status = {
         "status": "healthy",
         "timestamp": datetime.now().isoformat(),
-        "system_ready": len(prediction_system.history) > 0,
-        "app_data_ready": len(app.history) > 0,
+        # Phần engine đọc từ view đã công bố: worker theo sau không chạy engine
+        **(app.state.current.view("health") or health_view()),
         "ai_available": bool(OPENROUTER_API_KEY),
-        "prediction_tracking": app.prediction_results["total"] > 0
+        "model_evaluator": model_evaluator.status(),
+        "ai_prefetch": ai_prefetch.status(),
+        "llm_cache": llm_cache.status(),
+        "llm_breaker": llm_cache.guard.status(),
+        "prediction_flight": prediction_flight.status(),
+        "prediction_snapshot": prediction_snapshots.status(),
+        "app_state": app.state.status(),
+        "conditional_get": conditional.status(),
+        "event_stream": session_events.status(),
+        "ws_hub": ws_hub.status(),
+        "rate_limit": rate_limiter.status(),
+        "batch_predict": batch_predictor.status(),
+        "lock_wait": app.lock.status()
     }
-    return jsonify(health_status)
+    return json_response(health_status)
 
 @app.errorhandler(404)
 def not_found(error):
-    return jsonify({"error": "Endpoint không tồn tại"}), 404
+    return json_response({"error": "Endpoint không tồn tại"}), 404
 
 @app.errorhandler(500)
 def internal_error(error):
-    return jsonify({"error": "Lỗi server nội bộ"}), 500
+    return json_response({"error": "Lỗi server nội bộ"}), 500
 
 # ------------------------- INITIALIZATION -------------------------
 def initialize_system():
     """Khởi tạo hệ thống với dữ liệu hiện có"""
     try:
-        with app.lock:
+        with app.lock, engine_lock:
             if app.session_details:
                 logging.info(f"Khởi tạo hệ thống với {len(app.session_details)} phiên lịch sử")
                 
-                for detail in app.session_details[:50]:
+                for detail in reversed(app.session_details[:50]):  # 50 phiên gần nhất, cũ nhất trước
                     try:
                         result_char = "T" if detail["result"] == "Tài" else "X"
                         xx_str = f"{detail.get('xuc_xac_1', '0')}-{detail.get('xuc_xac_2', '0')}-{detail.get('xuc_xac_3', '0')}"
@@ -1031,13 +1208,18 @@ def initialize_system():
     except Exception as e:
         logging.error(f"Lỗi khởi tạo hệ thống: {e}")
 
-if __name__ == "__main__":
+def start_ingestion():
+    """Khởi động phần nạp dữ liệu (poller, hub WebSocket); khi chạy nhiều worker chỉ leader gọi"""
     # Khởi tạo hệ thống
     initialize_system()
     
     # Bắt đầu polling thread
     polling_thread = threading.Thread(target=poll_api, daemon=True)
     polling_thread.start()
+    ws_hub.start()
+
+if __name__ == "__main__":
+    start_ingestion()
     
     # Khởi động server
     port = int(os.getenv("PORT", 9099))
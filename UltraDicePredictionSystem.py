@@ -1,12 +1,16 @@
 import math
 import random
 from collections import defaultdict
+from ensemble import EnsembleCombiner
+from accuracy_tracker import AccuracyTracker
+from hedge import HedgeWeights
 
 class UltraDicePredictionSystem:
     def __init__(self):
         self.history = []
         self.models = {}
         self.weights = {}
+        self.ensemble = EnsembleCombiner()
         self.performance = {}
         self.pattern_database = {}
         self.advanced_patterns = {}
@@ -47,15 +51,13 @@ class UltraDicePredictionSystem:
             
             # Khởi tạo trọng số và hiệu suất
             self.weights[f'model{i}'] = 1
-            self.performance[f'model{i}'] = {
-                'correct': 0,
-                'total': 0,
-                'recent_correct': 0,
-                'recent_total': 0,
-                'streak': 0,
-                'max_streak': 0
-            }
+            self.ensemble.slot(f'model{i}')
+            self.performance[f'model{i}'] = AccuracyTracker()
         
+        # Trọng số học trực tuyến (Hedge), khởi tạo từ trọng số mặc định
+        self.hedge = HedgeWeights(list(self.weights), initial=self.weights)
+        # Dự đoán từng model đưa ra trước khi phiên tới có kết quả, chờ đối chiếu
+        self.pending_predictions = None
         self.init_pattern_database()
         self.init_advanced_patterns()
         self.init_support_models()
@@ -401,43 +403,27 @@ class UltraDicePredictionSystem:
 
     def get_final_prediction(self):
         predictions = self.get_all_predictions()
-        t_score = 0
-        x_score = 0
-        total_weight = 0
-        reasons = []
-        
-        for model_name, prediction in predictions.items():
-            if prediction and prediction.get('prediction'):
-                weight = self.weights.get(model_name, 1)
-                score = prediction['confidence'] * weight
-                
-                if prediction['prediction'] == 'T':
-                    t_score += score
-                elif prediction['prediction'] == 'X':
-                    x_score += score
-                
-                total_weight += weight
-                reasons.append(f"{model_name}: {prediction['reason']} ({prediction['confidence']:.2f})")
-        
-        if total_weight == 0:
+        self.pending_predictions = predictions
+
+        # Kết hợp vector hóa; lý do chỉ được dựng cho các model đóng góp nhiều nhất
+        self.ensemble.set_weights(self.weights)
+        combined = self.ensemble.load(predictions).combine(
+            top_k=3,
+            reason_format=lambda name, p: f"{name}: {p['reason']} ({p['confidence']:.2f})"
+        )
+        
+        if combined['total_weight'] == 0:
             return None
         
-        final_prediction = None
-        final_confidence = 0
-        
-        if t_score > x_score:
-            final_prediction = 'T'
-            final_confidence = t_score / (t_score + x_score)
-        elif x_score > t_score:
-            final_prediction = 'X'
-            final_confidence = x_score / (t_score + x_score)
+        final_prediction = combined['prediction']
+        final_confidence = combined['confidence'] if final_prediction else 0
         
         final_confidence = self.adjust_confidence_by_volatility(final_confidence)
         
         return {
             'prediction': final_prediction,
             'confidence': final_confidence,
-            'reasons': reasons,
+            'reasons': combined['reasons'],
             'details': predictions,
             'session_stats': self.session_stats,
             'market_state': self.market_state
@@ -451,33 +437,23 @@ class UltraDicePredictionSystem:
         return confidence
 
     def update_performance(self, actual_result):
-        predictions = self.get_all_predictions()
+        # Chấm dự đoán đã đưa ra trước phiên này; lịch sử lúc đó chưa chứa kết quả
+        predictions = self.pending_predictions
+        self.pending_predictions = None
+        if predictions is None:
+            # Chưa dự đoán phiên này: lịch sử vẫn chưa có kết quả nên dự đoán bây giờ vẫn hợp lệ
+            if not self.history:
+                return
+            predictions = self.get_all_predictions()
         
         for model_name, prediction in predictions.items():
             if prediction and prediction.get('prediction'):
-                self.performance[model_name]['total'] += 1
-                self.performance[model_name]['recent_total'] += 1
-                
-                if prediction['prediction'] == actual_result:
-                    self.performance[model_name]['correct'] += 1
-                    self.performance[model_name]['recent_correct'] += 1
-                    self.performance[model_name]['streak'] += 1
-                    self.performance[model_name]['max_streak'] = max(
-                        self.performance[model_name]['max_streak'],
-                        self.performance[model_name]['streak']
-                    )
-                else:
-                    self.performance[model_name]['streak'] = 0
-                
-                if self.performance[model_name]['recent_total'] > 50:
-                    self.performance[model_name]['recent_total'] -= 1
-                    if (self.performance[model_name]['recent_correct'] > 0 and 
-                        self.performance[model_name]['recent_correct'] / self.performance[model_name]['recent_total'] > 
-                        self.performance[model_name]['correct'] / self.performance[model_name]['total']):
-                        self.performance[model_name]['recent_correct'] -= 1
-                
-                accuracy = self.performance[model_name]['correct'] / self.performance[model_name]['total']
-                self.weights[model_name] = max(0.1, min(2, accuracy * 2))
+                perf = self.performance[model_name]
+                perf.record(prediction['prediction'] == actual_result)
+
+        # Cập nhật trọng số bằng Hedge: một bước nhân trên toàn bộ model mỗi phiên
+        self.hedge.update_outcomes(predictions, actual_result)
+        self.weights.update(self.hedge.as_dict())
         
         total_predictions = sum(1 for p in predictions.values() if p and p.get('prediction'))
         correct_predictions = sum(1 for p in predictions.values() if p and p.get('prediction') == actual_result)
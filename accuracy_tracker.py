@@ -0,0 +1,88 @@
+# ------------------------- ACCURACY TRACKER -------------------------
+# Các cửa sổ đánh giá độ chính xác gần đây (số phiên)
+WINDOWS = (20, 50, 200)
+RECENT_WINDOW = 50
+
+
+class AccuracyTracker:
+    """Theo dõi đúng/sai của một model, đếm đúng độ chính xác trên từng cửa sổ.
+
+    Kết quả đúng/sai được lưu dạng bit trong một bytearray vòng (1 bit/phiên).
+    Mỗi cửa sổ giữ sẵn số lần đúng; khi ghi kết quả mới chỉ cần cộng bit mới
+    và trừ bit vừa rời khỏi cửa sổ, nên cập nhật là O(số cửa sổ).
+    """
+
+    __slots__ = ("windows", "capacity", "bits", "pos", "count", "hits",
+                 "total", "correct", "streak", "max_streak")
+
+    def __init__(self, windows=WINDOWS):
+        self.windows = tuple(sorted(windows))
+        self.capacity = self.windows[-1]
+        self.bits = bytearray((self.capacity + 7) // 8)
+        self.pos = 0
+        self.count = 0
+        self.hits = dict.fromkeys(self.windows, 0)
+        self.total = 0
+        self.correct = 0
+        self.streak = 0
+        self.max_streak = 0
+
+    def _bit(self, index):
+        return (self.bits[index >> 3] >> (index & 7)) & 1
+
+    def record(self, hit):
+        """Ghi một kết quả dự đoán (True = đúng)"""
+        hit = 1 if hit else 0
+        for window in self.windows:
+            if self.count >= window:
+                # Bit cũ nhất của cửa sổ này rời đi (đọc trước khi bị ghi đè)
+                self.hits[window] -= self._bit((self.pos - window) % self.capacity)
+            self.hits[window] += hit
+
+        byte, mask = self.pos >> 3, 1 << (self.pos & 7)
+        if hit:
+            self.bits[byte] |= mask
+        else:
+            self.bits[byte] &= ~mask & 0xFF
+        self.pos = (self.pos + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+
+        self.total += 1
+        if hit:
+            self.correct += 1
+            self.streak += 1
+            self.max_streak = max(self.max_streak, self.streak)
+        else:
+            self.streak = 0
+
+    def window_total(self, window):
+        """Số phiên thực sự có trong cửa sổ"""
+        return min(self.count, window)
+
+    def accuracy(self, window=None):
+        """Độ chính xác trọn đời (window=None) hoặc trên `window` phiên gần nhất"""
+        if window is None:
+            return self.correct / self.total if self.total else 0
+        total = self.window_total(window)
+        return self.hits[window] / total if total else 0
+
+    def to_dict(self):
+        """Ảnh chụp thống kê cho model13/model20 và các endpoint"""
+        return {
+            "accuracy": self.accuracy(),
+            "recent_accuracy": self.accuracy(RECENT_WINDOW),
+            "total": self.total,
+            "correct": self.correct,
+            "recent_total": self.window_total(RECENT_WINDOW),
+            "streak": self.streak,
+            "max_streak": self.max_streak,
+            "windows": {
+                str(window): {
+                    "total": self.window_total(window),
+                    "correct": self.hits[window],
+                    "accuracy": self.accuracy(window),
+                }
+                for window in self.windows
+            },
+        }
@@ -0,0 +1,210 @@
+import os
+import copy
+import time
+import threading
+
+# ------------------------- BATCH PREDICTION -------------------------
+# Giới hạn mỗi request /api/predict_batch: số chuỗi và độ dài mỗi chuỗi
+BATCH_MAX_SEQUENCES = int(os.getenv("BATCH_MAX_SEQUENCES", "5000"))
+BATCH_MAX_LENGTH = int(os.getenv("BATCH_MAX_LENGTH", "200"))
+# Số batch chạy đồng thời mỗi tiến trình và thời gian chờ một chỗ trống (giây)
+BATCH_SLOTS = int(os.getenv("BATCH_SLOTS", "2"))
+BATCH_WAIT = float(os.getenv("BATCH_WAIT", "1"))
+
+RESULT_CHARS = {"T": "T", "X": "X", "Tài": "T", "Xỉu": "X"}
+LABELS = {"T": "Tài", "X": "Xỉu"}
+
+
+class BatchBusy(RuntimeError):
+    """Mọi chỗ chạy batch đều bận"""
+
+
+class Sequence:
+    """Một chuỗi cần dự đoán: kết quả 'T'/'X' (cũ nhất trước), xúc xắc tùy chọn và mã phiên"""
+
+    __slots__ = ("results", "dice", "sid")
+
+    def __init__(self, results, dice=None, sid=0):
+        self.results = results
+        self.dice = dice
+        self.sid = sid
+
+    def key(self):
+        return (self.results, self.dice or (), self.sid)
+
+    def step(self, i):
+        """(kết quả, xúc xắc) của bước thứ i; xúc xắc None khi client không gửi"""
+        return self.results[i], self.dice[i] if self.dice else None
+
+    def last_dice(self):
+        return self.dice[-1] if self.dice else None
+
+
+def _parse_sequence(item, index):
+    sid = 0
+    dice = None
+    if isinstance(item, dict):
+        results = item.get("results")
+        dice = item.get("dice")
+        sid = item.get("sid", 0)
+        if not isinstance(sid, int):
+            raise ValueError(f"sequences[{index}].sid phải là số nguyên")
+    else:
+        results = item
+    if isinstance(results, str):
+        results = list(results)
+    if not isinstance(results, list) or not results:
+        raise ValueError(f"sequences[{index}] phải là chuỗi T/X hoặc danh sách kết quả khác rỗng")
+    if len(results) > BATCH_MAX_LENGTH:
+        raise ValueError(f"sequences[{index}] dài quá {BATCH_MAX_LENGTH} phiên")
+    try:
+        chars = tuple(RESULT_CHARS[r] for r in results)
+    except (KeyError, TypeError):
+        raise ValueError(f"sequences[{index}] chỉ được chứa T/X hoặc Tài/Xỉu")
+
+    if dice is not None:
+        if not isinstance(dice, list) or len(dice) != len(chars):
+            raise ValueError(f"sequences[{index}].dice phải có đúng một bộ xúc xắc cho mỗi phiên")
+        rolls = []
+        for step, (roll, char) in enumerate(zip(dice, chars)):
+            if (not isinstance(roll, list) or len(roll) != 3
+                    or not all(isinstance(d, int) and 1 <= d <= 6 for d in roll)):
+                raise ValueError(f"sequences[{index}].dice[{step}] phải gồm 3 số từ 1 đến 6")
+            if ("T" if sum(roll) >= 11 else "X") != char:
+                raise ValueError(f"sequences[{index}].dice[{step}] không khớp kết quả {char}")
+            rolls.append(tuple(roll))
+        dice = tuple(rolls)
+    return Sequence(chars, dice, sid)
+
+
+def parse_batch(payload):
+    """Đọc body JSON {"sequences": [...]} thành danh sách Sequence; dữ liệu sai -> ValueError.
+
+    Mỗi phần tử là chuỗi "TXTT", danh sách ["T", "Xỉu", ...] hoặc dict
+    {"results": ..., "dice": [[d1, d2, d3], ...], "sid": N} (sid chỉ gieo
+    nguồn ngẫu nhiên tất định của engine).
+    """
+    if not isinstance(payload, dict) or not isinstance(payload.get("sequences"), list):
+        raise ValueError('Body phải là JSON {"sequences": [...]}')
+    items = payload["sequences"]
+    if not items:
+        raise ValueError("sequences rỗng")
+    if len(items) > BATCH_MAX_SEQUENCES:
+        raise ValueError(f"Tối đa {BATCH_MAX_SEQUENCES} chuỗi mỗi request")
+    return [_parse_sequence(item, i) for i, item in enumerate(items)]
+
+
+def engine_result(pred):
+    """Chuẩn hóa dict dự đoán của engine thành (prediction, confidence, reason)"""
+    if not pred or not pred.get("prediction"):
+        return None, None, "Chưa đủ dữ liệu để dự đoán"
+    prediction = LABELS.get(pred["prediction"], pred["prediction"])
+    confidence = pred.get("confidence")
+    reason = pred.get("reason") or " | ".join(pred.get("reasons") or [])
+    return prediction, None if confidence is None else round(float(confidence), 4), reason
+
+
+class BatchPredictor:
+    """Dự đoán hàng loạt trên các engine riêng, không đụng engine đang chạy.
+
+    `factory()` dựng một engine trống; engine mẫu được dựng một lần và mỗi
+    chuỗi chạy trên một bản sao (copy.deepcopy) của nó, nên engine không được
+    giữ closure trỏ về chính nó (dùng phương thức gắn với engine hoặc
+    functools.partial của phương thức đó). `feed(engine, result, dice)` nạp
+    một phiên, `predict(engine, sequence)` trả về (prediction, confidence, reason).
+
+    Các chuỗi trùng nhau chỉ tính một lần. Chuỗi được xử lý theo thứ tự từ
+    điển nên chuỗi là tiền tố của chuỗi kế tiếp dùng lại engine đã nạp và chỉ
+    nạp thêm phần đuôi (engine được sao ra trước khi dự đoán, vì dự đoán có
+    thể đổi trạng thái engine). Số batch chạy cùng lúc bị giới hạn bởi `slots`.
+    """
+
+    def __init__(self, factory, feed, predict, slots=BATCH_SLOTS, wait=BATCH_WAIT):
+        self.factory = factory
+        self.feed = feed
+        self.predict = predict
+        self.wait = wait
+        self.prototype = None
+        self.prototype_lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(slots)
+        self.last_elapsed = 0.0
+        self.stats = {"batches": 0, "sequences": 0, "unique": 0, "fed": 0, "shared": 0,
+                      "errors": 0, "busy": 0}
+
+    def fresh(self):
+        """Engine trống: bản sao của engine mẫu dựng sẵn"""
+        with self.prototype_lock:
+            if self.prototype is None:
+                self.prototype = self.factory()
+        return copy.deepcopy(self.prototype)
+
+    def run(self, sequences):
+        """Dự đoán cho danh sách Sequence, kết quả theo đúng thứ tự đầu vào"""
+        if not self.slots.acquire(timeout=self.wait):
+            self.stats["busy"] += 1
+            raise BatchBusy("Đang xử lý quá nhiều batch, thử lại sau")
+        try:
+            start = time.monotonic()
+            unique = {}
+            for sequence in sequences:
+                unique.setdefault(sequence.key(), sequence)
+            order = sorted(unique)
+            outputs = {}
+            engine, fed = None, None
+            for i, key in enumerate(order):
+                sequence = unique[key]
+                try:
+                    engine, fed = self._advance(engine, fed, sequence)
+                    # Chuỗi kế tiếp nối dài chuỗi này: dự đoán trên bản sao, giữ engine để nạp tiếp
+                    following = unique[order[i + 1]] if i + 1 < len(order) else None
+                    target = engine
+                    if following is not None and self._extends(following, fed):
+                        target = copy.deepcopy(engine)
+                    else:
+                        engine, fed = None, None
+                    prediction, confidence, reason = self.predict(target, sequence)
+                    outputs[key] = {"prediction": prediction, "confidence": confidence, "reason": reason}
+                except Exception as e:
+                    engine, fed = None, None
+                    self.stats["errors"] += 1
+                    outputs[key] = {"error": str(e)}
+
+            self.stats["batches"] += 1
+            self.stats["sequences"] += len(sequences)
+            self.stats["unique"] += len(order)
+            self.last_elapsed = time.monotonic() - start
+            return {
+                "count": len(sequences),
+                "unique": len(order),
+                "elapsed_ms": round(self.last_elapsed * 1000, 2),
+                "results": [dict(outputs[sequence.key()], index=i) for i, sequence in enumerate(sequences)],
+            }
+        finally:
+            self.slots.release()
+
+    @staticmethod
+    def _extends(sequence, fed):
+        results, dice = fed
+        size = len(results)
+        return sequence.results[:size] == results and (sequence.dice or ())[:size] == dice
+
+    def _advance(self, engine, fed, sequence):
+        """Nạp engine tới hết `sequence`, dùng lại phần tiền tố đã nạp nếu có"""
+        if engine is None or not self._extends(sequence, fed):
+            engine, done = self.fresh(), 0
+        else:
+            done = len(fed[0])
+            self.stats["shared"] += done
+        for i in range(done, len(sequence.results)):
+            self.feed(engine, *sequence.step(i))
+        self.stats["fed"] += len(sequence.results) - done
+        return engine, (sequence.results, sequence.dice or ())
+
+    def status(self):
+        """Thông tin cho endpoint health/debug"""
+        return {
+            "last_elapsed_ms": round(self.last_elapsed * 1000, 2),
+            "max_sequences": BATCH_MAX_SEQUENCES,
+            "max_length": BATCH_MAX_LENGTH,
+            **self.stats,
+        }
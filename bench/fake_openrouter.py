@@ -0,0 +1,215 @@
+"""Server giả lập API chat completions của OpenRouter để test và đo tải offline.
+
+Chạy server rồi trỏ các script vào nó qua biến môi trường OPENROUTER_URL:
+    python bench/fake_openrouter.py --port 8099 --latency lognormal:800,0.6 --error-rate 0.05
+    OPENROUTER_URL=http://127.0.0.1:8099/api/v1/chat/completions OPENROUTER_API_KEY=test python 9.py
+
+Độ trễ có dạng fixed:MS, uniform:MIN_MS,MAX_MS hoặc lognormal:MEDIAN_MS,SIGMA và
+có thể đặt riêng cho từng model (--model-latency MODEL=SPEC). Yêu cầu có
+"stream": true được trả về dạng SSE theo từng đoạn nhỏ. GET /stats trả về số
+request server thực sự nhận được (để so với số lần gọi phía client khi đo
+cache, gộp request, hedging và mạch ngắt); POST /stats/reset đặt lại.
+"""
+import argparse
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+COMPLETIONS_PATH = "/api/v1/chat/completions"
+
+
+def parse_latency(spec):
+    """Chuỗi cấu hình độ trễ -> hàm sinh độ trễ (giây)"""
+    kind, _, args = spec.partition(":")
+    values = [float(v) for v in args.split(",") if v]
+    if kind == "fixed":
+        return lambda rng: values[0] / 1000
+    if kind == "uniform":
+        return lambda rng: rng.uniform(values[0], values[1]) / 1000
+    if kind == "lognormal":
+        median, sigma = values
+        return lambda rng: rng.lognormvariate(math.log(median), sigma) / 1000
+    raise ValueError(f"độ trễ không hợp lệ: {spec}")
+
+
+def verdict_content(rng):
+    """Câu trả lời hợp lệ cho mọi bộ phân tích trong repo: dòng kết luận, tỉ lệ % và JSON"""
+    prediction = rng.choice(["Tài", "Xỉu"])
+    other = "Xỉu" if prediction == "Tài" else "Tài"
+    confidence = rng.randint(55, 80)
+    reason = f"Giả lập: {prediction} chiếm ưu thế trong chuỗi gần đây"
+    body = json.dumps({"prediction": prediction, "confidence": confidence / 100, "reason": reason},
+                      ensure_ascii=False)
+    return f"Dự đoán: {prediction}\n{prediction} {confidence}% - {other} {100 - confidence}%\n{body}"
+
+
+def malformed_content(rng):
+    """Câu trả lời hỏng: JSON bị cắt hoặc văn bản không có kết luận"""
+    return rng.choice([
+        '{"prediction": "Tài", "confidence": 0.',
+        "Xin lỗi, tôi không thể dự đoán kết quả này.",
+        '```json\n{"prediction": Tài, confidence: cao}\n```',
+    ])
+
+
+class FakeOpenRouter:
+    """Trạng thái chung của server: cấu hình, bộ sinh ngẫu nhiên và số liệu"""
+
+    def __init__(self, latency, model_latency=None, error_rate=0.0, error_status=500,
+                 malformed_rate=0.0, chunk_size=8, chunk_delay=0.02, seed=None):
+        self.latency = latency
+        self.model_latency = model_latency or {}
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.malformed_rate = malformed_rate
+        self.chunk_size = chunk_size
+        self.chunk_delay = chunk_delay
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.stats = {"requests": 0, "streamed": 0, "errors": 0, "malformed": 0,
+                          "chunks_sent": 0, "disconnects": 0, "by_model": {}}
+
+    def plan(self, model):
+        """Quyết định trước cho một request: độ trễ, lỗi HTTP hay nội dung"""
+        with self.lock:
+            self.stats["requests"] += 1
+            self.stats["by_model"][model] = self.stats["by_model"].get(model, 0) + 1
+            delay = self.model_latency.get(model, self.latency)(self.rng)
+            if self.rng.random() < self.error_rate:
+                self.stats["errors"] += 1
+                return delay, self.error_status, None
+            if self.rng.random() < self.malformed_rate:
+                self.stats["malformed"] += 1
+                return delay, 200, malformed_content(self.rng)
+            return delay, 200, verdict_content(self.rng)
+
+    def count(self, key, value=1):
+        with self.lock:
+            self.stats[key] += value
+
+    def snapshot(self):
+        with self.lock:
+            return json.loads(json.dumps(self.stats))
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "FakeOpenRouter/1.0"
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, body):
+        raw = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def do_GET(self):
+        if self.path == "/stats":
+            self.send_json(200, self.server.fake.snapshot())
+        else:
+            self.send_json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        fake = self.server.fake
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length)
+        if self.path == "/stats/reset":
+            fake.reset()
+            self.send_json(200, {"ok": True})
+            return
+        if self.path != COMPLETIONS_PATH:
+            self.send_json(404, {"error": {"message": "not found"}})
+            return
+        try:
+            payload = json.loads(raw)
+        except ValueError:
+            self.send_json(400, {"error": {"message": "invalid JSON body"}})
+            return
+
+        model = payload.get("model", "")
+        delay, status, content = fake.plan(model)
+        time.sleep(delay)
+        if status != 200:
+            self.send_json(status, {"error": {"code": status, "message": "simulated provider error"}})
+            return
+        if payload.get("stream"):
+            fake.count("streamed")
+            self.stream(model, content)
+            return
+        self.send_json(200, {
+            "id": f"gen-fake-{int(time.time() * 1000)}",
+            "object": "chat.completion",
+            "model": model,
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": content}}],
+        })
+
+    def stream(self, model, content):
+        """Gửi nội dung theo từng đoạn SSE; client đóng kết nối sớm thì dừng"""
+        fake = self.server.fake
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        try:
+            self.wfile.write(b": OPENROUTER PROCESSING\n\n")
+            for i in range(0, len(content), fake.chunk_size):
+                event = {"model": model, "choices": [{"index": 0, "delta": {"content": content[i:i + fake.chunk_size]}}]}
+                self.wfile.write(f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+                fake.count("chunks_sent")
+                time.sleep(fake.chunk_delay)
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            fake.count("disconnects")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--latency", default="lognormal:800,0.5", help="độ trễ mặc định")
+    parser.add_argument("--model-latency", action="append", default=[], metavar="MODEL=SPEC",
+                        help="độ trễ riêng cho một model (lặp lại được)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="tỉ lệ trả về lỗi HTTP")
+    parser.add_argument("--error-status", type=int, default=500, help="mã lỗi trả về (500, 429...)")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="tỉ lệ câu trả lời hỏng")
+    parser.add_argument("--chunk-size", type=int, default=8, help="số ký tự mỗi đoạn SSE")
+    parser.add_argument("--chunk-delay-ms", type=float, default=20, help="độ trễ giữa các đoạn SSE")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    model_latency = {}
+    for item in args.model_latency:
+        model, _, spec = item.partition("=")
+        model_latency[model] = parse_latency(spec)
+
+    server = ThreadingHTTPServer((args.host, args.port), Handler)
+    server.daemon_threads = True
+    server.fake = FakeOpenRouter(
+        parse_latency(args.latency), model_latency, args.error_rate, args.error_status,
+        args.malformed_rate, args.chunk_size, args.chunk_delay_ms / 1000, args.seed
+    )
+    print(f"Fake OpenRouter: http://{args.host}:{args.port}{COMPLETIONS_PATH} (thống kê: /stats)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
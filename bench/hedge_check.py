@@ -0,0 +1,55 @@
+"""Kiểm tra trọng số Hedge của engine thực sự học sau các phiên có kết quả.
+
+    python bench/hedge_check.py 7.py 8.py -n 50
+
+Nạp engine của từng script (không chạy server), xen kẽ dự đoán và kết quả
+ngẫu nhiên như poller rồi báo lỗi (mã thoát 1) nếu trọng số không đổi so
+với ban đầu hoặc có lần dự đoán không khớp tên model nào của Hedge.
+"""
+import argparse
+import importlib.util
+import os
+import random
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def load_script(name):
+    spec = importlib.util.spec_from_file_location(f"script_{os.path.splitext(name)[0]}", os.path.join(ROOT, name))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def check(name, rounds, seed):
+    engine = load_script(name).CombinedPredictionSystem()
+    initial = dict(engine.model_weights)
+    rng = random.Random(seed)
+    for _ in range(rounds):
+        dice = [rng.randint(1, 6) for _ in range(3)]
+        xx = "-".join(map(str, dice))
+        engine.get_final_prediction(xx)
+        engine.add_result("T" if sum(dice) >= 11 else "X", xx)
+    status = engine.hedge.status()
+    changed = {key: round(weight, 4) for key, weight in engine.model_weights.items()
+               if abs(weight - initial[key]) > 1e-9}
+    ok = bool(changed) and status["unmatched"] == 0 and status["updates"] > 0
+    print(f"{name}: updates={status['updates']} unmatched={status['unmatched']} "
+          f"đổi={len(changed)}/{len(initial)} {changed} -> {'OK' if ok else 'LỖI'}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("scripts", nargs="*", default=["7.py", "8.py"])
+    parser.add_argument("-n", type=int, default=50, help="số phiên")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    results = [check(name, args.n, args.seed) for name in args.scripts]
+    sys.exit(0 if all(results) else 1)
+
+
+if __name__ == "__main__":
+    main()
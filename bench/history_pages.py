@@ -0,0 +1,62 @@
+"""So sánh kích thước payload và độ trễ của /api/history theo chế độ truy vấn.
+
+Chạy một server (ví dụ `python 5.py`) rồi:
+    python bench/history_pages.py --url http://127.0.0.1:9099/api/history -n 200
+"""
+import argparse
+import json
+import statistics
+import time
+import urllib.request
+
+VARIANTS = {
+    "legacy": "",
+    "page100": "?limit=100",
+    "columnar": "?limit=100&format=columnar",
+    "fields": "?limit=100&format=columnar&fields=sid,result",
+    "delta": "?since_sid={newest}",
+}
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def measure(url, count):
+    sizes = []
+    latencies = []
+    for _ in range(count):
+        start = time.perf_counter()
+        with urllib.request.urlopen(url, timeout=30) as res:
+            body = res.read()
+        latencies.append((time.perf_counter() - start) * 1000)
+        sizes.append(len(body))
+    json.loads(body)  # Đảm bảo phản hồi hợp lệ
+    return {
+        "bytes": statistics.mean(sizes),
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:9099/api/history")
+    parser.add_argument("-n", type=int, default=100, help="số request cho mỗi chế độ")
+    args = parser.parse_args()
+
+    # Client lấy phần chênh lệch thường đã có gần hết: hỏi từ phiên thứ hai mới nhất
+    with urllib.request.urlopen(args.url + "?limit=2", timeout=30) as res:
+        newest = json.loads(res.read())["oldest_sid"]
+    results = {name: measure(args.url + query.format(newest=newest), args.n) for name, query in VARIANTS.items()}
+    legacy = results["legacy"]
+    print(f"{'chế độ':<10}{'bytes':>10}{'p50 ms':>10}{'p95 ms':>10}{'bytes/legacy':>14}")
+    for name, r in results.items():
+        ratio = r["bytes"] / legacy["bytes"] if legacy["bytes"] else 0
+        print(f"{name:<10}{r['bytes']:>10.0f}{r['p50_ms']:>10.2f}{r['p95_ms']:>10.2f}{ratio:>14.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""So sánh kích thước payload và độ trễ của /api/hitclub theo chế độ chi tiết.
+
+Chạy một server (ví dụ `python 4.py`) rồi:
+    python bench/hitclub_detail.py --url http://127.0.0.1:9099/api/hitclub -n 200
+
+Không có API nguồn thì dựng server ngay trong tiến trình với lịch sử giả lập:
+    python bench/hitclub_detail.py --script 4.py --sessions 100 -n 500
+"""
+import os
+import sys
+import json
+import random
+import argparse
+import threading
+import statistics
+import time
+import importlib.util
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENGINES = ("akira_system", "lmc_system", "ultra_system", "prediction_system")
+
+VARIANTS = {
+    "compact": "",
+    "fields": "?fields=prediction,confidence",
+    "full": "?detail=full",
+}
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def measure(url, count):
+    sizes = []
+    latencies = []
+    for _ in range(count):
+        start = time.perf_counter()
+        with urllib.request.urlopen(url, timeout=30) as res:
+            body = res.read()
+        latencies.append((time.perf_counter() - start) * 1000)
+        sizes.append(len(body))
+    json.loads(body)  # Đảm bảo phản hồi hợp lệ
+    return {
+        "bytes": statistics.mean(sizes),
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+    }
+
+
+def serve_script(name, sessions, seed=3):
+    """Nạp script, giả lập `sessions` phiên như poller rồi phục vụ trên một cổng ngẫu nhiên"""
+    from werkzeug.serving import make_server
+
+    sys.path.insert(0, ROOT)
+    spec = importlib.util.spec_from_file_location("bench_app", os.path.join(ROOT, name))
+    script = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(script)
+    engine = next((getattr(script, attr) for attr in ENGINES if hasattr(script, attr)), None)
+    rng = random.Random(seed)
+    for i in range(sessions):
+        dice = [rng.randint(1, 6) for _ in range(3)]
+        result = "Tài" if sum(dice) >= 11 else "Xỉu"
+        with script.app.lock:
+            script.app.history.append(result)
+            script.app.session_ids.append(1000 + i)
+            script.app.session_details.insert(0, {
+                "sid": 1000 + i, "result": result, "total": sum(dice),
+                "xuc_xac_1": dice[0], "xuc_xac_2": dice[1], "xuc_xac_3": dice[2],
+            })
+            if engine is not None:
+                # 7.py/8.py nhận chuỗi xúc xắc "a-b-c", 9.py nhận danh sách xúc xắc
+                xx = "-".join(map(str, dice))
+                extra = {"7.py": [xx], "8.py": [xx], "9.py": [dice]}.get(os.path.basename(name), [])
+                engine.add_result("T" if result == "Tài" else "X", *extra)
+            script.publish_state()
+    script.publish_prediction()
+    server = make_server("127.0.0.1", 0, script.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}/api/hitclub"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:9099/api/hitclub")
+    parser.add_argument("--script", help="dựng server trong tiến trình từ script này thay vì gọi --url")
+    parser.add_argument("--sessions", type=int, default=100, help="số phiên giả lập khi dùng --script")
+    parser.add_argument("-n", type=int, default=100, help="số request cho mỗi chế độ")
+    args = parser.parse_args()
+    if args.script:
+        args.url = serve_script(args.script, args.sessions)
+
+    results = {name: measure(args.url + query, args.n) for name, query in VARIANTS.items()}
+    full = results["full"]
+    print(f"{'chế độ':<10}{'bytes':>10}{'p50 ms':>10}{'p95 ms':>10}{'bytes/full':>12}")
+    for name, r in results.items():
+        ratio = r["bytes"] / full["bytes"] if full["bytes"] else 0
+        print(f"{name:<10}{r['bytes']:>10.0f}{r['p50_ms']:>10.2f}{r['p95_ms']:>10.2f}{ratio:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
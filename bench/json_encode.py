@@ -0,0 +1,75 @@
+"""Đo chi phí serialize JSON của từng endpoint: json chuẩn (như jsonify) với fast_json.
+
+Chạy một server (ví dụ `python 2.py`) để lấy payload thật của các endpoint rồi:
+    python bench/json_encode.py --base http://127.0.0.1:9099 -n 2000
+
+Mỗi payload được serialize lại trong tiến trình này theo ba cách: json.dumps
+với tùy chọn của jsonify, fast_json.dumps (orjson nếu đã cài) và bytes dựng
+sẵn của StaticJSON (chỉ áp dụng cho endpoint không đổi). Kèm chi phí dựng
+chuỗi current_time bằng strftime so với format_now.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fast_json  # noqa: E402
+
+DEFAULT_PATHS = "/,/api/systems,/api/hitclub,/api/history,/api/health,/api/stats,/api/prediction_stats,/api/lmc_status,/api/ultra_stats"
+STATIC_PATHS = {"/", "/api/systems"}
+
+
+def fetch_json(url):
+    try:
+        with urllib.request.urlopen(url, timeout=30) as res:
+            return json.loads(res.read())
+    except (urllib.error.URLError, ValueError):
+        return None
+
+
+def per_call_us(fn, count):
+    start = time.perf_counter()
+    for _ in range(count):
+        fn()
+    return (time.perf_counter() - start) / count * 1e6
+
+
+def stdlib_dumps(data):
+    return (json.dumps(data, sort_keys=True, separators=(",", ":")) + "\n").encode()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--base", default="http://127.0.0.1:9099")
+    parser.add_argument("--paths", default=DEFAULT_PATHS, help="danh sách endpoint, cách nhau bởi dấu phẩy")
+    parser.add_argument("-n", type=int, default=2000, help="số lần serialize mỗi payload")
+    args = parser.parse_args()
+
+    print(f"bộ mã hóa nhanh: {'orjson' if fast_json.orjson is not None else 'json (chưa cài orjson)'}")
+    print(f"{'endpoint':<24}{'bytes':>8}{'json us':>10}{'fast us':>10}{'static us':>11}{'tăng tốc':>10}")
+    for path in (path for path in args.paths.split(",") if path):
+        data = fetch_json(args.base + path)
+        if data is None:
+            continue
+        baseline = per_call_us(lambda: stdlib_dumps(data), args.n)
+        fast = per_call_us(lambda: fast_json.dumps(data), args.n)
+        static = "-"
+        if path in STATIC_PATHS:
+            fragment = fast_json.StaticJSON(data)
+            static = f"{per_call_us(lambda: fragment.body, args.n):.2f}"
+        print(f"{path:<24}{len(fast_json.dumps(data)):>8}{baseline:>10.2f}{fast:>10.2f}{static:>11}"
+              f"{baseline / fast if fast else 0:>9.1f}x")
+
+    strftime = per_call_us(lambda: datetime.now().strftime(fast_json.TIME_FORMAT), args.n)
+    cached = per_call_us(fast_json.format_now, args.n)
+    print(f"current_time: strftime {strftime:.2f} us, format_now {cached:.2f} us")
+
+
+if __name__ == "__main__":
+    main()
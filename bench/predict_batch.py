@@ -0,0 +1,59 @@
+"""Đo thông lượng của /api/predict_batch theo kích thước batch.
+
+Chạy một server (ví dụ `python 7.py`) rồi:
+    python bench/predict_batch.py --url http://127.0.0.1:9099/api/predict_batch --sizes 1,100,1000
+
+Mỗi batch gồm các chuỗi ngẫu nhiên có xúc xắc; `--prefixes` thay bằng mọi
+tiền tố của một lịch sử dài (kiểu câu hỏi "engine dự đoán gì sau mỗi phiên"),
+trường hợp engine được dùng lại nhiều nhất.
+"""
+import argparse
+import json
+import random
+import time
+import urllib.request
+
+
+def random_sequence(rng, length):
+    dice = [[rng.randint(1, 6) for _ in range(3)] for _ in range(length)]
+    results = "".join("T" if sum(roll) >= 11 else "X" for roll in dice)
+    return {"results": results, "dice": dice}
+
+
+def build_batch(rng, size, max_length, prefixes):
+    if prefixes:
+        history = random_sequence(rng, max_length)
+        return [{"results": history["results"][:k], "dice": history["dice"][:k]}
+                for k in range(max(1, max_length - size + 1), max_length + 1)]
+    return [random_sequence(rng, rng.randint(1, max_length)) for _ in range(size)]
+
+
+def post(url, payload):
+    body = json.dumps(payload).encode()
+    req = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json"})
+    start = time.perf_counter()
+    with urllib.request.urlopen(req, timeout=300) as res:
+        data = json.loads(res.read())
+    return data, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:9099/api/predict_batch")
+    parser.add_argument("--sizes", default="1,100,1000", help="các kích thước batch, cách nhau bởi dấu phẩy")
+    parser.add_argument("--length", type=int, default=60, help="độ dài tối đa mỗi chuỗi")
+    parser.add_argument("--prefixes", action="store_true", help="batch là các tiền tố của một lịch sử")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print(f"{'batch':>7}{'unique':>8}{'wall ms':>10}{'server ms':>11}{'chuỗi/s':>10}{'lỗi':>6}")
+    for size in (int(size) for size in args.sizes.split(",") if size):
+        data, wall = post(args.url, {"sequences": build_batch(rng, size, args.length, args.prefixes)})
+        errors = sum(1 for item in data["results"] if "error" in item)
+        print(f"{data['count']:>7}{data['unique']:>8}{wall * 1000:>10.1f}{data['elapsed_ms']:>11.1f}"
+              f"{data['count'] / wall if wall else 0:>10.0f}{errors:>6}")
+
+
+if __name__ == "__main__":
+    main()
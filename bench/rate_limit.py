@@ -0,0 +1,67 @@
+"""Gọi dồn dập một endpoint để kiểm tra hạn mức: tỉ lệ 200/429 và độ trễ của từng loại.
+
+Hạn mức theo client mặc định tắt; chạy một server có bật hạn mức (ví dụ
+`RATE_LIMIT_RATE=5 RATE_LIMIT_BURST=20 python 1.py`) rồi:
+    python bench/rate_limit.py --url http://127.0.0.1:9099/api/hitclub --threads 8 --seconds 10
+
+Request bị từ chối phải trả về nhanh hơn hẳn request được xử lý, vì 429 được
+trả trong before_request trước mọi khóa và model.
+"""
+import argparse
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def worker(url, deadline, latencies, lock):
+    local = defaultdict(list)
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(url, timeout=30) as res:
+                res.read()
+                status = res.status
+        except urllib.error.HTTPError as e:
+            e.read()
+            status = e.code
+        except urllib.error.URLError:
+            status = "lỗi"
+        local[status].append((time.perf_counter() - start) * 1000)
+    with lock:
+        for status, values in local.items():
+            latencies[status].extend(values)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:9099/api/hitclub")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=10)
+    args = parser.parse_args()
+
+    latencies = defaultdict(list)
+    lock = threading.Lock()
+    deadline = time.perf_counter() + args.seconds
+    threads = [threading.Thread(target=worker, args=(args.url, deadline, latencies, lock))
+               for _ in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    print(f"{'status':>7}{'số lượng':>10}{'req/s':>9}{'p50 ms':>9}{'p99 ms':>9}")
+    for status, values in sorted(latencies.items(), key=lambda item: str(item[0])):
+        print(f"{status:>7}{len(values):>10}{len(values) / args.seconds:>9.1f}"
+              f"{percentile(values, 50):>9.2f}{percentile(values, 99):>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
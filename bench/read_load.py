@@ -0,0 +1,102 @@
+"""Đo thông lượng và độ trễ của các endpoint đọc khi nhiều client gọi đồng thời.
+
+Chạy một server (ví dụ `python 7.py`) rồi:
+    python bench/read_load.py --base http://127.0.0.1:9099 -c 32 -d 20
+
+Nếu /api/health có "lock_wait" thì in thêm thời gian chờ app.lock trong lúc
+đo, để so sánh trước/sau khi các endpoint đọc bỏ app.lock.
+"""
+import argparse
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+
+DEFAULT_PATHS = "/api/hitclub,/api/history,/api/stats,/api/prediction_stats,/api/lmc_status"
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def fetch_json(url):
+    try:
+        with urllib.request.urlopen(url, timeout=30) as res:
+            return json.loads(res.read())
+    except (urllib.error.URLError, ValueError):
+        return None
+
+
+def lock_wait(base):
+    health = fetch_json(base + "/api/health") or fetch_json(base + "/api/ultra_stats") or {}
+    return health.get("lock_wait")
+
+
+def worker(base, paths, deadline, results, lock):
+    local = {path: [] for path in paths}
+    errors = 0
+    i = 0
+    while time.monotonic() < deadline:
+        path = paths[i % len(paths)]
+        i += 1
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(base + path, timeout=30) as res:
+                res.read()
+        except urllib.error.HTTPError as e:
+            if e.code == 404:
+                continue
+            errors += 1
+            continue
+        except urllib.error.URLError:
+            errors += 1
+            continue
+        local[path].append((time.perf_counter() - start) * 1000)
+    with lock:
+        for path, latencies in local.items():
+            results["latencies"].setdefault(path, []).extend(latencies)
+        results["errors"] += errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--base", default="http://127.0.0.1:9099")
+    parser.add_argument("--paths", default=DEFAULT_PATHS, help="danh sách endpoint, cách nhau bởi dấu phẩy")
+    parser.add_argument("-c", type=int, default=16, help="số client đồng thời")
+    parser.add_argument("-d", type=float, default=10, help="thời gian đo (giây)")
+    args = parser.parse_args()
+
+    paths = [path for path in args.paths.split(",") if path]
+    before = lock_wait(args.base)
+    results = {"latencies": {}, "errors": 0}
+    lock = threading.Lock()
+    deadline = time.monotonic() + args.d
+    threads = [threading.Thread(target=worker, args=(args.base, paths, deadline, results, lock))
+               for _ in range(args.c)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    after = lock_wait(args.base)
+
+    print(f"{'endpoint':<24}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for path, latencies in results["latencies"].items():
+        if not latencies:
+            continue
+        print(f"{path:<24}{len(latencies) / args.d:>10.1f}{percentile(latencies, 50):>10.2f}"
+              f"{percentile(latencies, 95):>10.2f}{percentile(latencies, 99):>10.2f}")
+    print(f"lỗi: {results['errors']}")
+
+    if before and after:
+        acquired = after["acquired"] - before["acquired"]
+        contended = after["contended"] - before["contended"]
+        waited = after["total_wait_ms"] - before["total_wait_ms"]
+        print(f"app.lock: {acquired} lần lấy, {contended} lần phải chờ, tổng chờ {waited:.1f} ms, "
+              f"p95 {after['p95_wait_ms']} ms, max {after['max_wait_ms']} ms")
+
+
+if __name__ == "__main__":
+    main()
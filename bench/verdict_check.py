@@ -0,0 +1,46 @@
+"""Kiểm tra VerdictParser chốt đúng kết luận từ câu trả lời LLM đang stream.
+
+    python bench/verdict_check.py
+
+Mỗi mẫu được đưa vào parser từng ký tự một như các delta của stream; báo lỗi
+(mã thoát 1) nếu kết luận sai hoặc được chốt ở mẫu không có kết luận.
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from llm_stream import VerdictParser  # noqa: E402
+
+SAMPLES = [
+    ("Dự đoán: Tài\nLý do: chuỗi Xỉu dài sắp gãy", "Tài"),
+    ("**Dự đoán:** Tài\n**Lý do:** cầu bệt Xỉu đã 5 phiên", "Tài"),
+    ("**Dự đoán**: **Xỉu**\nLý do: đảo chiều", "Xỉu"),
+    ("Dự đoán cuối cùng: Xỉu\nLý do: tổng điểm giảm dần", "Xỉu"),
+    ("### Dự đoán - TÀI\nLý do: nhịp 1-1", "Tài"),
+    ("Phân tích: Tài và Xỉu đang cân bằng.\nDự đoán: Xỉu", "Xỉu"),
+    ("Không đủ dữ liệu để kết luận.\nTài: 50%, Xỉu: 50%", None),
+]
+
+
+def check(text, expected):
+    parser = VerdictParser()
+    done_at = None
+    for i, ch in enumerate(text):
+        if parser.feed(ch) and done_at is None:
+            done_at = i + 1
+    got = parser.result()["prediction"] if parser.done else None
+    ok = got == expected
+    print(f"{text.splitlines()[0][:40]!r:<44} -> {got} (chốt sau {done_at or '-'}/{len(text)} ký tự) "
+          f"{'OK' if ok else 'LỖI, cần ' + str(expected)}")
+    return ok
+
+
+def main():
+    results = [check(text, expected) for text, expected in SAMPLES]
+    sys.exit(0 if all(results) else 1)
+
+
+if __name__ == "__main__":
+    main()
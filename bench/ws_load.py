@@ -0,0 +1,191 @@
+"""Đo phát sự kiện của WebSocket hub tới hàng nghìn kết nối cục bộ.
+
+Mặc định tự chạy WebSocketHub trong tiến trình con với bên phát giả lập
+(nhiều bàn x engine) rồi mở N kết nối, một phần đăng ký bộ lọc:
+    python bench/ws_load.py -n 5000 --rate 5 -d 30
+Đo một server thật (chạy với WS_PORT=8765, sự kiện đến theo phiên):
+    python bench/ws_load.py --url ws://127.0.0.1:8765 -n 1000 -d 120
+
+Số kết nối bị giới hạn bởi `ulimit -n`; script tự nâng soft limit lên hard
+limit. Kết quả gồm tỉ lệ giao, độ trễ từ lúc phát tới lúc client nhận và số
+liệu của hub (khung đã gửi, bị lọc, client bị ngắt vì chậm).
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import websockets  # noqa: E402
+from ws_hub import WebSocketHub  # noqa: E402
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def raise_fd_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    return resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+
+
+def run_hub(port, tables, engines, rate, duration, go, published, done, results):
+    """Tiến trình con: chạy hub và phát `rate` sự kiện/giây cho mỗi cặp bàn x engine"""
+    raise_fd_limit()
+    hub = WebSocketHub(table=tables[0], engine=engines[0], host="127.0.0.1", port=port,
+                       max_clients=1_000_000)
+    hub.start()
+    go.wait()
+    seq = 0
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        tick = time.monotonic()
+        for table in tables:
+            for engine in engines:
+                seq += 1
+                hub.publish(seq, "session", {"sent_at": time.time(), "seq": seq}, table=table, engine=engine)
+        time.sleep(max(0.0, 1 / rate - (time.monotonic() - tick)))
+    published.set()
+    done.wait()
+    results.put(hub.status())
+
+
+async def client(url, subscribe, stats, stop):
+    try:
+        async with websockets.connect(url, open_timeout=120, max_queue=None) as connection:
+            if subscribe:
+                await connection.send(json.dumps({"action": "subscribe", **subscribe}))
+            stats["connected"] += 1
+            while not stop.is_set():
+                try:
+                    message = await asyncio.wait_for(connection.recv(), timeout=1)
+                except asyncio.TimeoutError:
+                    continue
+                frame = json.loads(message)
+                if frame.get("type") == "subscribed":
+                    continue
+                stats["received"] += 1
+                stats["latencies"].append((time.time() - frame["data"]["sent_at"]) * 1000)
+    except websockets.ConnectionClosed as e:
+        code = e.rcvd.code if e.rcvd else None
+        stats["closed"][code] = stats["closed"].get(code, 0) + 1
+    except (OSError, asyncio.TimeoutError):
+        stats["failed"] += 1
+
+
+async def run_clients(url, subscribes, connected, stop):
+    stats = {"connected": 0, "received": 0, "failed": 0, "closed": {}, "latencies": []}
+    stopping = asyncio.Event()
+    tasks = []
+    for i, subscribe in enumerate(subscribes):
+        tasks.append(asyncio.ensure_future(client(url, subscribe, stats, stopping)))
+        if i % 200 == 199:
+            await asyncio.sleep(0.05)  # Tránh dồn backlog accept của server
+    while stats["connected"] + stats["failed"] < len(subscribes):
+        await asyncio.sleep(0.1)
+    connected.put((stats["connected"], stats["failed"]))
+    while not stop.is_set():
+        await asyncio.sleep(0.2)
+    stopping.set()
+    await asyncio.gather(*tasks)
+    return stats
+
+
+def client_process(url, subscribes, connected, stop, results):
+    """Tiến trình con: giữ một phần kết nối trên event loop riêng"""
+    raise_fd_limit()
+    stats = asyncio.run(run_clients(url, subscribes, connected, stop))
+    # Chỉ gửi mẫu độ trễ đã lấy thưa để hàng đợi giữa các tiến trình không quá lớn
+    stats["latencies"] = stats["latencies"][::max(1, len(stats["latencies"]) // 20000)]
+    results.put(stats)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default=None, help="hub có sẵn; bỏ trống để tự chạy hub giả lập")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("-n", type=int, default=5000, help="số kết nối")
+    parser.add_argument("-d", type=float, default=20, help="thời gian phát (giây)")
+    parser.add_argument("--rate", type=float, default=0.5, help="sự kiện/giây cho mỗi cặp bàn x engine")
+    parser.add_argument("--tables", default="table_a,table_b")
+    parser.add_argument("--engines", default="engine_1,engine_2")
+    parser.add_argument("--filtered", type=float, default=0.5, help="tỉ lệ client đăng ký bộ lọc")
+    parser.add_argument("--procs", type=int, default=min(4, os.cpu_count() or 1), help="số tiến trình client")
+    parser.add_argument("--grace", type=float, default=5, help="thời gian chờ giao nốt sau khi ngừng phát (giây)")
+    args = parser.parse_args()
+
+    print(f"giới hạn file descriptor: {raise_fd_limit()}")
+    tables = args.tables.split(",")
+    engines = args.engines.split(",")
+    # Một phần client chỉ đăng ký một bàn và một engine
+    subscribes = [{"tables": [tables[i % len(tables)]], "engines": [engines[i % len(engines)]]}
+                  if i < args.n * args.filtered else None for i in range(args.n)]
+
+    go, published, done, stop = (multiprocessing.Event() for _ in range(4))
+    connected, results, hub_results = (multiprocessing.Queue() for _ in range(3))
+    hub = None
+    url = args.url
+    if url is None:
+        url = f"ws://127.0.0.1:{args.port}"
+        hub = multiprocessing.Process(target=run_hub, args=(
+            args.port, tables, engines, args.rate, args.d, go, published, done, hub_results))
+        hub.start()
+        time.sleep(1)
+
+    procs = [multiprocessing.Process(target=client_process, args=(url, subscribes[i::args.procs], connected, stop, results))
+             for i in range(args.procs)]
+    for proc in procs:
+        proc.start()
+    ok = failed = 0
+    for _ in procs:
+        c, f = connected.get()
+        ok, failed = ok + c, failed + f
+    print(f"đã kết nối {ok}/{args.n} (lỗi {failed})")
+
+    go.set()
+    if hub is not None:
+        published.wait()
+    else:
+        time.sleep(args.d)
+    time.sleep(args.grace)
+    stop.set()
+    stats = [results.get() for _ in procs]
+    for proc in procs:
+        proc.join()
+
+    received = sum(s["received"] for s in stats)
+    latencies = [value for s in stats for value in s["latencies"]]
+    closed = {}
+    for s in stats:
+        for code, count in s["closed"].items():
+            closed[code] = closed.get(code, 0) + count
+    print(f"nhận {received} khung ({received / args.d:.0f} khung/s trong thời gian phát)")
+    if hub is not None:
+        # Client không lọc nhận mọi sự kiện, client có lọc nhận 1/(bàn x engine)
+        rounds = int(args.d * args.rate)
+        pairs = len(tables) * len(engines)
+        filtered = sum(1 for subscribe in subscribes if subscribe)
+        expected = (args.n - filtered) * rounds * pairs + filtered * rounds
+        print(f"kỳ vọng khoảng {expected} khung (giao {received / max(expected, 1):.1%})")
+    if latencies:
+        print(f"độ trễ phát->nhận: p50 {percentile(latencies, 50):.1f} ms, p95 {percentile(latencies, 95):.1f} ms, "
+              f"p99 {percentile(latencies, 99):.1f} ms, max {max(latencies):.1f} ms")
+    if closed:
+        print(f"kết nối bị đóng theo mã: {closed}")
+    if hub is not None:
+        done.set()
+        print(f"hub: {hub_results.get(timeout=30)}")
+        hub.join(timeout=5)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+import os
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# ------------------------- CIRCUIT BREAKER -------------------------
+# Số lỗi liên tiếp để mở mạch, thời gian mở trước khi thử lại (giây) và số lời gọi LLM đồng thời tối đa
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "3"))
+BREAKER_RESET = float(os.getenv("BREAKER_RESET", "30"))
+LLM_MAX_INFLIGHT = int(os.getenv("LLM_MAX_INFLIGHT", "4"))
+LLM_ACQUIRE_TIMEOUT = float(os.getenv("LLM_ACQUIRE_TIMEOUT", "1"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class LLMUnavailable(Exception):
+    """LLM tạm thời không được gọi (mạch mở hoặc hết lượt gọi đồng thời)"""
+
+
+class CircuitBreaker:
+    """Mạch ngắt cho một cặp (nhà cung cấp, model).
+
+    closed: gọi bình thường, đếm lỗi liên tiếp; đủ ngưỡng thì chuyển open.
+    open: từ chối ngay trong `reset_timeout` giây, không tốn một lời gọi.
+    half_open: cho đúng một lời gọi thử; thành công thì đóng, lỗi thì mở lại.
+    """
+
+    def __init__(self, failure_threshold=BREAKER_FAILURES, reset_timeout=BREAKER_RESET):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_inflight = False
+        self.stats = {"calls": 0, "failures": 0, "rejected": 0, "opened": 0}
+
+    def allow(self):
+        """Có được gọi không (gọi khi đang giữ khóa của registry)"""
+        if self.state == OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self.state = HALF_OPEN
+            self.trial_inflight = False
+        if self.state == HALF_OPEN:
+            if self.trial_inflight:
+                return False
+            self.trial_inflight = True
+        return True
+
+    def record(self, ok):
+        self.stats["calls"] += 1
+        if ok:
+            self.state = CLOSED
+            self.failures = 0
+            self.trial_inflight = False
+            return
+        self.stats["failures"] += 1
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != OPEN:
+                self.stats["opened"] += 1
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+            self.trial_inflight = False
+
+    def to_dict(self):
+        retry_in = 0
+        if self.state == OPEN:
+            retry_in = max(0, self.reset_timeout - (time.monotonic() - self.opened_at))
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "retry_in": round(retry_in, 1),
+            **self.stats,
+        }
+
+
+class LLMGuard:
+    """Mạch ngắt theo (nhà cung cấp, model) cộng semaphore giới hạn lời gọi LLM đồng thời"""
+
+    def __init__(self, max_inflight=LLM_MAX_INFLIGHT, acquire_timeout=LLM_ACQUIRE_TIMEOUT,
+                 failure_threshold=BREAKER_FAILURES, reset_timeout=BREAKER_RESET):
+        self.max_inflight = max_inflight
+        self.acquire_timeout = acquire_timeout
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.semaphore = threading.BoundedSemaphore(max_inflight)
+        self.lock = threading.Lock()
+        self.breakers = {}
+        self.inflight = 0
+        self.busy_rejected = 0
+
+    def breaker(self, key):
+        with self.lock:
+            breaker = self.breakers.get(key)
+            if breaker is None:
+                breaker = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+                self.breakers[key] = breaker
+            return breaker
+
+    def call(self, key, fn, failed=None):
+        """Chạy fn() dưới mạch ngắt `key`; failed(kết quả) cho biết kết quả có tính là lỗi không.
+
+        Ném LLMUnavailable ngay (không gọi mạng) khi mạch mở hoặc hết lượt đồng thời.
+        """
+        breaker = self.breaker(key)
+        with self.lock:
+            if not breaker.allow():
+                breaker.stats["rejected"] += 1
+                raise LLMUnavailable(f"mạch {key} đang mở")
+
+        if not self.semaphore.acquire(timeout=self.acquire_timeout):
+            with self.lock:
+                self.busy_rejected += 1
+                # Trả lại lượt thử của half-open vì lời gọi không diễn ra
+                breaker.trial_inflight = False
+            raise LLMUnavailable(f"đã đủ {self.max_inflight} lời gọi LLM đồng thời")
+
+        with self.lock:
+            self.inflight += 1
+        try:
+            result = fn()
+        except Exception:
+            self._record(key, breaker, False)
+            raise
+        finally:
+            with self.lock:
+                self.inflight -= 1
+            self.semaphore.release()
+
+        self._record(key, breaker, not (failed and failed(result)))
+        return result
+
+    def _record(self, key, breaker, ok):
+        with self.lock:
+            before = breaker.state
+            breaker.record(ok)
+            after = breaker.state
+        if before != after:
+            if after == OPEN:
+                logger.warning(f"🔌 Mở mạch LLM {key} trong {self.reset_timeout}s")
+            elif after == CLOSED:
+                logger.info(f"✅ Đóng mạch LLM {key}")
+
+    def status(self):
+        """Thông tin cho endpoint health/debug"""
+        with self.lock:
+            return {
+                "inflight": self.inflight,
+                "max_inflight": self.max_inflight,
+                "busy_rejected": self.busy_rejected,
+                "breakers": {key: breaker.to_dict() for key, breaker in self.breakers.items()},
+            }
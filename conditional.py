@@ -0,0 +1,120 @@
+import os
+import time
+import hashlib
+import threading
+from collections import deque
+from email.utils import formatdate, parsedate_to_datetime
+
+# ------------------------- CONDITIONAL GET -------------------------
+# Phiên bản engine trong ETag: đặt ENGINE_VERSION khi triển khai, mặc định theo thời điểm khởi động
+ENGINE_VERSION = os.getenv("ENGINE_VERSION") or format(int(time.time()), "x")
+# Giới hạn max-age (giây) và khoảng cách phiên dự phòng khi chưa đủ số liệu
+CACHE_MAX_AGE = int(os.getenv("CACHE_MAX_AGE", "60"))
+SESSION_INTERVAL = float(os.getenv("SESSION_INTERVAL", "0"))
+
+
+def http_date(timestamp):
+    return formatdate(timestamp, usegmt=True)
+
+
+class SessionClock:
+    """Ước lượng thời điểm có phiên kế tiếp từ khoảng cách giữa các phiên đã nạp"""
+
+    def __init__(self, samples=20, default_interval=SESSION_INTERVAL):
+        self.default_interval = default_interval
+        self.lock = threading.Lock()
+        self.intervals = deque(maxlen=samples)
+        self.last_sid = None
+        self.last_at = None
+
+    def tick(self, sid, now=None):
+        """Ghi nhận phiên `sid` vừa nạp (gọi lại cùng sid thì bỏ qua)"""
+        now = time.time() if now is None else now
+        with self.lock:
+            if sid == self.last_sid:
+                return
+            if self.last_at is not None:
+                self.intervals.append(now - self.last_at)
+            self.last_sid = sid
+            self.last_at = now
+
+    def interval(self):
+        with self.lock:
+            if not self.intervals:
+                return self.default_interval
+            ordered = sorted(self.intervals)
+            return ordered[len(ordered) // 2]
+
+    def seconds_until_next(self, now=None):
+        """Số giây ước tính tới phiên kế tiếp (0 nếu chưa biết hoặc đã quá hạn)"""
+        now = time.time() if now is None else now
+        interval = self.interval()
+        if not interval or self.last_at is None:
+            return 0
+        return max(0, int(self.last_at + interval - now))
+
+    def status(self):
+        """Thông tin cho endpoint health/debug"""
+        return {
+            "last_sid": self.last_sid,
+            "interval": round(self.interval(), 2),
+            "next_in": self.seconds_until_next(),
+        }
+
+
+class ConditionalGet:
+    """ETag mạnh + Last-Modified cho endpoint chỉ đổi khi có phiên mới.
+
+    ETag được băm từ (bàn, phiên bản engine, các thành phần phiên bản do
+    endpoint truyền vào như sid và revision của bản chụp). current_time trong
+    /api/hitclub là siêu dữ liệu theo request nên không nằm trong ETag. Kiểm
+    tra 304 chỉ so chuỗi, không chạm vào trạng thái model.
+    """
+
+    def __init__(self, table, clock=None, engine_version=ENGINE_VERSION, max_age=CACHE_MAX_AGE):
+        self.table = table
+        self.clock = clock
+        self.engine_version = engine_version
+        self.max_age = max_age
+        self.stats = {"not_modified": 0, "full": 0}
+
+    def etag(self, *parts):
+        raw = ":".join(str(part) for part in (self.table, self.engine_version) + parts)
+        return '"' + hashlib.sha1(raw.encode("utf-8")).hexdigest()[:20] + '"'
+
+    def headers(self, etag, last_modified, provisional=False):
+        """Header kèm theo phản hồi; max-age tới phiên kế tiếp (0 khi phản hồi còn tạm thời)"""
+        max_age = 0
+        if not provisional and self.clock is not None:
+            max_age = min(self.max_age, self.clock.seconds_until_next())
+        return {
+            "ETag": etag,
+            "Last-Modified": http_date(last_modified),
+            "Cache-Control": f"public, max-age={max_age}, must-revalidate",
+        }
+
+    def not_modified(self, request_headers, etag, last_modified):
+        """True nếu có thể trả 304: If-None-Match được ưu tiên hơn If-Modified-Since"""
+        if_none_match = request_headers.get("If-None-Match")
+        if if_none_match:
+            # So khớp yếu theo RFC 7232: bỏ tiền tố W/ của thẻ client gửi lên
+            tags = [tag.strip()[2:] if tag.strip().startswith("W/") else tag.strip() for tag in if_none_match.split(",")]
+            matched = "*" in tags or etag in tags
+        else:
+            matched = False
+            if_modified_since = request_headers.get("If-Modified-Since")
+            if if_modified_since:
+                try:
+                    matched = int(last_modified) <= parsedate_to_datetime(if_modified_since).timestamp()
+                except (TypeError, ValueError):
+                    matched = False
+        self.stats["not_modified" if matched else "full"] += 1
+        return matched
+
+    def status(self):
+        """Thông tin cho endpoint health/debug"""
+        return {
+            "engine_version": self.engine_version,
+            "clock": self.clock.status() if self.clock is not None else None,
+            **self.stats,
+        }
@@ -0,0 +1,156 @@
+import heapq
+from array import array
+from operator import mul
+
+# ------------------------- ENSEMBLE COMBINER -------------------------
+# Mã hóa dự đoán thành dấu: +1 = Tài, -1 = Xỉu, 0 = model không đưa ra dự đoán
+_SIGNS = {"T": 1.0, "Tài": 1.0, "X": -1.0, "Xỉu": -1.0}
+
+
+def prediction_sign(prediction):
+    """Chuyển 'T'/'Tài'/'X'/'Xỉu' thành +1/-1 (0 nếu không hợp lệ)"""
+    return _SIGNS.get(prediction, 0.0)
+
+
+def default_reason(name, payload):
+    """Định dạng lý do mặc định cho một model đóng góp"""
+    if callable(payload):
+        payload = payload()
+    if isinstance(payload, dict):
+        payload = payload.get("reason", "")
+    return f"{name}: {payload}" if name else str(payload)
+
+
+class EnsembleCombiner:
+    """Kết hợp dự đoán của nhiều model bằng tích vô hướng trên mảng float.
+
+    Mỗi model có một slot cố định: dấu dự đoán, độ tin cậy và trọng số được
+    lưu trong array('d'), nên mỗi phiên chỉ cần ghi đè giá trị rồi tính
+    tổng có dấu một lần. Lý do chỉ được định dạng cho top-k model đóng góp
+    nhiều nhất khi kết hợp.
+
+    Một instance là trạng thái có thể ghi: `load`/`set` ghi đè các mảng rồi
+    `combine` đọc lại. Không dùng chung một instance giữa các luồng trừ khi
+    mọi lượt load + combine cùng giữ một khóa (engine giữ `self.ensemble`
+    dưới khóa engine); nơi khác thì dựng instance mới cho mỗi lần kết hợp.
+    """
+
+    def __init__(self, names=(), weights=None, labels=("T", "X")):
+        self.labels = labels
+        self.names = []
+        self.index = {}
+        self.signs = array("d")
+        self.active = array("d")
+        self.confidences = array("d")
+        self.weights = array("d")
+        self.payloads = []
+        for name in names:
+            self.slot(name)
+        if weights:
+            self.set_weights(weights)
+
+    def __len__(self):
+        return len(self.names)
+
+    def slot(self, name, weight=1.0):
+        """Lấy (hoặc cấp mới) vị trí của model trong các mảng"""
+        idx = self.index.get(name)
+        if idx is None:
+            idx = len(self.names)
+            self.index[name] = idx
+            self.names.append(name)
+            self.signs.append(0.0)
+            self.active.append(0.0)
+            self.confidences.append(0.0)
+            self.weights.append(weight)
+            self.payloads.append(None)
+        return idx
+
+    def set_weights(self, weights):
+        """Cập nhật trọng số từ dict {tên model: trọng số}"""
+        for name, weight in weights.items():
+            self.weights[self.slot(name)] = weight
+
+    def clear(self):
+        """Xóa dự đoán của phiên trước, giữ nguyên slot và trọng số"""
+        n = len(self.names)
+        zeros = array("d", bytes(8 * n))
+        self.signs[:] = zeros
+        self.active[:] = zeros
+        self.confidences[:] = zeros
+        self.payloads = [None] * n
+
+    def set(self, name, prediction, confidence, payload=None):
+        """Ghi dự đoán của một model; payload dùng để dựng lý do khi cần"""
+        idx = self.slot(name)
+        sign = prediction_sign(prediction)
+        self.signs[idx] = sign
+        self.active[idx] = 1.0 if sign else 0.0
+        self.confidences[idx] = confidence or 0.0
+        self.payloads[idx] = payload
+
+    def load(self, predictions):
+        """Nạp dict {tên: dự đoán} hoặc list dự đoán (dạng dict của các model).
+
+        Mục trong list được đặt tên theo "source" (không có thì "#vị trí");
+        hai mục trùng tên sẽ đè nhau nên bị từ chối bằng ValueError.
+        """
+        self.clear()
+        if isinstance(predictions, dict):
+            items = predictions.items()
+        else:
+            items = [(p.get("source") or f"#{i}", p) for i, p in enumerate(predictions) if p]
+            seen = set()
+            for name, _ in items:
+                if name in seen:
+                    raise ValueError(f"Trùng nguồn dự đoán '{name}' trong danh sách kết hợp")
+                seen.add(name)
+        for name, pred in items:
+            if pred and pred.get("prediction"):
+                self.set(name, pred["prediction"], pred.get("confidence", 0.0), pred)
+        return self
+
+    def combine(self, top_k=2, tie=None, reason_format=default_reason):
+        """Tính điểm Tài/Xỉu bằng một tích vô hướng và trả về kết quả tổng hợp"""
+        scores = array("d", map(mul, self.confidences, self.weights))
+        signed = sum(map(mul, self.signs, scores))
+        total = sum(map(mul, self.active, scores))
+        total_weight = sum(map(mul, self.active, self.weights))
+
+        t_score = (total + signed) / 2
+        x_score = (total - signed) / 2
+
+        if signed > 0:
+            prediction = self.labels[0]
+        elif signed < 0:
+            prediction = self.labels[1]
+        else:
+            prediction = tie
+
+        confidence = max(t_score, x_score) / total if total > 0 else 0.0
+
+        return {
+            "prediction": prediction,
+            "confidence": confidence,
+            "t_score": t_score,
+            "x_score": x_score,
+            "total_score": total,
+            "total_weight": total_weight,
+            "active_count": int(sum(self.active)),
+            "reasons": self.top_reasons(scores, top_k, reason_format),
+        }
+
+    def top_reasons(self, scores, top_k, reason_format=default_reason):
+        """Chỉ định dạng lý do cho top-k model có điểm đóng góp cao nhất"""
+        if not top_k:
+            return []
+        active = [i for i, a in enumerate(self.active) if a]
+        top = heapq.nlargest(top_k, active, key=scores.__getitem__)
+        return [reason_format(self.names[i], self.payloads[i]) for i in top]
+
+    def contributions(self):
+        """Trả về dict {tên model: điểm có dấu} cho mục đích debug/thống kê"""
+        return {
+            name: self.signs[i] * self.confidences[i] * self.weights[i]
+            for i, name in enumerate(self.names) if self.active[i]
+        }
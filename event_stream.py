@@ -0,0 +1,151 @@
+import os
+import json
+import queue
+import threading
+from collections import deque
+
+# ------------------------- EVENT STREAM -------------------------
+# Số sự kiện gần nhất giữ lại để client nối lại bằng Last-Event-ID
+STREAM_BUFFER = int(os.getenv("STREAM_BUFFER", "100"))
+# Số sự kiện tối đa chờ gửi cho mỗi client; đầy thì client bị ngắt thay vì chặn bên phát
+STREAM_CLIENT_QUEUE = int(os.getenv("STREAM_CLIENT_QUEUE", "32"))
+# Khoảng gửi dòng chú thích giữ kết nối (giây)
+STREAM_HEARTBEAT = float(os.getenv("STREAM_HEARTBEAT", "15"))
+# Thời gian trình duyệt chờ trước khi tự nối lại (ms)
+STREAM_RETRY_MS = int(os.getenv("STREAM_RETRY_MS", "3000"))
+
+
+def sse_frame(event_id, event, data):
+    """Một sự kiện SSE dạng bytes (JSON gọn nên luôn nằm trên một dòng data:)"""
+    payload = json.dumps(data, sort_keys=True, separators=(",", ":"))
+    return f"id: {event_id}\nevent: {event}\ndata: {payload}\n\n".encode()
+
+
+def parse_event_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def session_backfill(state_store):
+    """Lấy các phiên (since_id, until_id) từ bản chụp trạng thái; chỉ có kết quả, không có dự đoán"""
+    def backfill(since_id, until_id):
+        details = state_store.current.session_details  # Mới nhất trước
+        return [
+            (detail["sid"], {
+                "current_session": detail["sid"],
+                "current_result": detail["result"],
+                "total": detail.get("total"),
+            })
+            for detail in reversed(details)
+            if detail["sid"] > since_id and (until_id is None or detail["sid"] < until_id)
+        ]
+    return backfill
+
+
+class Subscriber:
+    """Một client SSE: các sự kiện phát lại khi nối lại + hàng đợi sự kiện mới có giới hạn"""
+
+    def __init__(self, replay, maxsize):
+        self.replay = replay
+        self.queue = queue.Queue(maxsize)
+        self.dropped = False
+
+
+class EventStream:
+    """Phát mỗi phiên một sự kiện SSE tới mọi client đang nghe.
+
+    Sự kiện được serialize một lần rồi đẩy cùng bytes vào hàng đợi của từng
+    client bằng put_nowait, nên bên phát (poller) không bao giờ bị chặn: client
+    nào để hàng đợi đầy sẽ bị ngắt và tự nối lại bằng Last-Event-ID. Client nối
+    lại được phát lại từ bộ đệm sự kiện gần nhất; phần cũ hơn bộ đệm lấy từ
+    `backfill` (kho phiên) với sự kiện "backfill" chỉ có kết quả. Các hàm
+    đăng ký qua `add_listener` (ví dụ hub WebSocket) được gọi với
+    (event_id, event, data) sau mỗi lần phát, ngoài khóa.
+    """
+
+    def __init__(self, backfill=None, buffer_size=STREAM_BUFFER, client_queue=STREAM_CLIENT_QUEUE,
+                 heartbeat=STREAM_HEARTBEAT):
+        self.backfill = backfill
+        self.client_queue = client_queue
+        self.heartbeat = heartbeat
+        self.buffer = deque(maxlen=buffer_size)
+        self.subscribers = set()
+        self.listeners = []
+        self.last_id = None
+        self.lock = threading.Lock()
+        self.stats = {"published": 0, "connected": 0, "resumed": 0, "replayed": 0, "dropped": 0}
+
+    def publish(self, event_id, data, event="session"):
+        """Phát sự kiện `event_id`; id không lớn hơn id đã phát thì bỏ qua (mỗi phiên một sự kiện)"""
+        with self.lock:
+            if self.last_id is not None and event_id <= self.last_id:
+                return False
+            frame = sse_frame(event_id, event, data)
+            self.last_id = event_id
+            self.buffer.append((event_id, frame))
+            self.stats["published"] += 1
+            for subscriber in list(self.subscribers):
+                try:
+                    subscriber.queue.put_nowait(frame)
+                except queue.Full:
+                    subscriber.dropped = True
+                    self.subscribers.discard(subscriber)
+                    self.stats["dropped"] += 1
+        for listener in self.listeners:
+            listener(event_id, event, data)
+        return True
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def subscribe(self, last_event_id=None):
+        """Đăng ký client mới; `last_event_id` (nếu có) là id cuối client đã nhận"""
+        last_event_id = parse_event_id(last_event_id)
+        with self.lock:
+            replay = []
+            if last_event_id is not None:
+                oldest = self.buffer[0][0] if self.buffer else None
+                if self.backfill is not None and (oldest is None or oldest > last_event_id + 1):
+                    replay.extend(sse_frame(event_id, "backfill", data)
+                                  for event_id, data in self.backfill(last_event_id, oldest))
+                replay.extend(frame for event_id, frame in self.buffer if event_id > last_event_id)
+                self.stats["resumed"] += 1
+                self.stats["replayed"] += len(replay)
+            # Đăng ký trong cùng khóa với phần phát lại nên không mất hay trùng sự kiện
+            subscriber = Subscriber(replay, self.client_queue)
+            self.subscribers.add(subscriber)
+            self.stats["connected"] += 1
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            self.subscribers.discard(subscriber)
+
+    def iter_events(self, subscriber):
+        """Generator bytes cho Response của Flask; dừng khi client bị ngắt vì chậm"""
+        try:
+            yield f"retry: {STREAM_RETRY_MS}\n\n".encode()
+            for frame in subscriber.replay:
+                yield frame
+            subscriber.replay = None
+            while not subscriber.dropped:
+                try:
+                    frame = subscriber.queue.get(timeout=self.heartbeat)
+                except queue.Empty:
+                    yield b": keepalive\n\n"
+                    continue
+                yield frame
+        finally:
+            self.unsubscribe(subscriber)
+
+    def status(self):
+        """Thông tin cho endpoint health/debug"""
+        with self.lock:
+            return {
+                "clients": len(self.subscribers),
+                "last_id": self.last_id,
+                "buffered": len(self.buffer),
+                **self.stats,
+            }
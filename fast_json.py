@@ -0,0 +1,77 @@
+import json
+import time
+import uuid
+import decimal
+import dataclasses
+from datetime import date, datetime
+from flask import Response
+from werkzeug.http import http_date
+
+try:
+    import orjson
+except ImportError:  # Gói tùy chọn: thiếu thì dùng json chuẩn với cùng định dạng như jsonify
+    orjson = None
+
+# ------------------------- FAST JSON -------------------------
+JSON_MIMETYPE = "application/json"
+# Định dạng current_time/timestamp dùng chung của các endpoint
+TIME_FORMAT = "%d/%m/%Y %H:%M:%S"
+
+
+def default(o):
+    """Kiểu không phải JSON thuần, đổi giống DefaultJSONProvider.default của Flask (thêm set)"""
+    if isinstance(o, date):
+        return http_date(o)
+    if isinstance(o, (decimal.Decimal, uuid.UUID)):
+        return str(o)
+    if dataclasses.is_dataclass(o) and not isinstance(o, type):
+        return dataclasses.asdict(o)
+    if hasattr(o, "__html__"):
+        return str(o.__html__())
+    if isinstance(o, (set, frozenset)):
+        return list(o)
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+if orjson is not None:
+    # orjson tự viết datetime theo ISO 8601; chuyển cho `default` để ra HTTP date như jsonify
+    _OPTIONS = (orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_APPEND_NEWLINE
+                | orjson.OPT_PASSTHROUGH_DATETIME)
+
+    def dumps(data):
+        """Serialize sang bytes: khóa sắp xếp, gọn, kết thúc bằng xuống dòng như jsonify"""
+        return orjson.dumps(data, default=default, option=_OPTIONS)
+else:
+    def dumps(data):
+        """Serialize sang bytes: khóa sắp xếp, gọn, kết thúc bằng xuống dòng như jsonify"""
+        return (json.dumps(data, default=default, sort_keys=True, separators=(",", ":")) + "\n").encode()
+
+
+def json_response(data, status=200, headers=None):
+    """Thay cho jsonify: cùng mimetype, serialize bằng `dumps`"""
+    return Response(dumps(data), status=status, headers=headers, mimetype=JSON_MIMETYPE)
+
+
+class StaticJSON:
+    """Phản hồi JSON không đổi trong suốt vòng đời tiến trình, serialize một lần khi khởi động"""
+
+    def __init__(self, data):
+        self.body = dumps(data)
+
+    def response(self):
+        # Response mới mỗi request (after_request/CORS có thể sửa header), bytes dùng chung
+        return Response(self.body, mimetype=JSON_MIMETYPE)
+
+
+_clock = (None, None)
+
+
+def format_now():
+    """datetime.now().strftime(TIME_FORMAT), chỉ định dạng lại khi sang giây mới"""
+    global _clock
+    second = int(time.time())
+    cached_second, text = _clock
+    if cached_second != second:
+        text = datetime.fromtimestamp(second).strftime(TIME_FORMAT)
+        _clock = (second, text)
+    return text
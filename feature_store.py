@@ -0,0 +1,75 @@
+import threading
+from collections import deque
+
+# ------------------------- FEATURE STORE -------------------------
+class FeatureStore:
+    """Đặc trưng dựng prompt LLM, cập nhật đúng một lần cho mỗi phiên mới.
+
+    Đếm Tài/Xỉu trên toàn bộ lịch sử được cộng/trừ dần khi phiên vào/ra khỏi
+    cửa sổ `max_len`, các đặc trưng còn lại chỉ cần `window` phiên gần nhất.
+    compute(cửa sổ, tai_count, xiu_count, total) tính bộ đặc trưng khi có
+    phiên mới; render(đặc trưng, prompt_type) dựng prompt và được nhớ lại theo
+    phiên, nên mỗi lần hỏi LLM chỉ còn là một lần tra dict.
+    """
+
+    def __init__(self, compute, render, max_len=500, window=30):
+        self.compute = compute
+        self.render = render
+        self.lock = threading.Lock()
+        self.results = deque(maxlen=max_len)  # mới nhất trước
+        self.window = deque(maxlen=window)
+        self.tai_count = 0
+        self.xiu_count = 0
+        self.sid = None
+        self.features = None
+        self.prompts = {}
+        self.stats = {"updates": 0, "prompt_hits": 0, "prompt_misses": 0}
+
+    def _push(self, session):
+        if len(self.results) == self.results.maxlen:
+            self._count(self.results[-1], -1)
+        self.results.appendleft(session["result"])
+        self.window.appendleft(session)
+        self._count(session["result"], 1)
+        self.sid = session["sid"]
+
+    def _count(self, result, delta):
+        if result == "Tài":
+            self.tai_count += delta
+        elif result == "Xỉu":
+            self.xiu_count += delta
+
+    def _refresh(self):
+        self.features = self.compute(list(self.window), self.tai_count, self.xiu_count, len(self.results))
+        self.prompts = {}
+
+    def push(self, session):
+        """Thêm phiên mới nhất và tính lại đặc trưng"""
+        with self.lock:
+            self._push(session)
+            self._refresh()
+            self.stats["updates"] += 1
+
+    def prompt(self, sid, prompt_type):
+        """Prompt đã dựng cho phiên `sid` (None nếu store không ở đúng phiên này)"""
+        with self.lock:
+            if self.features is None or sid != self.sid:
+                return None
+            prompt = self.prompts.get(prompt_type)
+            if prompt is not None:
+                self.stats["prompt_hits"] += 1
+                return prompt
+            self.stats["prompt_misses"] += 1
+            prompt = self.prompts[prompt_type] = self.render(self.features, prompt_type)
+            return prompt
+
+    def status(self):
+        """Thông tin cho endpoint health/debug"""
+        with self.lock:
+            return {
+                "sid": self.sid,
+                "sessions": len(self.results),
+                "tai_count": self.tai_count,
+                "xiu_count": self.xiu_count,
+                **self.stats,
+            }
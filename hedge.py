@@ -0,0 +1,92 @@
+import os
+import math
+import logging
+from array import array
+from operator import mul
+
+# ------------------------- HEDGE WEIGHTS -------------------------
+# Tốc độ học và hệ số quên (1.0 = không quên) có thể chỉnh qua biến môi trường
+DEFAULT_ETA = float(os.getenv("HEDGE_ETA", "0.3"))
+DEFAULT_DISCOUNT = float(os.getenv("HEDGE_DISCOUNT", "0.98"))
+_SIGNS = {"T": 1.0, "Tài": 1.0, "X": -1.0, "Xỉu": -1.0}
+
+logger = logging.getLogger(__name__)
+
+
+class HedgeWeights:
+    """Học trọng số model theo Hedge (multiplicative weights) mỗi phiên.
+
+    Trọng số được giữ ở dạng log trong array('d'): mỗi phiên model đoán sai bị
+    trừ `eta`, model không dự đoán giữ nguyên. Hệ số `discount` kéo log-trọng
+    số dần về giá trị ban đầu để thích nghi nhanh khi cầu đổi trạng thái.
+    Trọng số xuất ra được chuẩn hóa để tổng bằng tổng trọng số ban đầu và
+    không nhỏ hơn `floor`.
+    """
+
+    def __init__(self, names, initial=None, eta=DEFAULT_ETA, discount=DEFAULT_DISCOUNT, floor=0.1):
+        initial = initial or {}
+        self.names = list(names)
+        self.index = {name: i for i, name in enumerate(self.names)}
+        self.eta = eta
+        self.discount = discount
+        self.floor = floor
+        self.prior = array("d", (math.log(initial.get(name, 1.0)) for name in self.names))
+        self.log_weights = array("d", self.prior)
+        self.scale = sum(initial.get(name, 1.0) for name in self.names)
+        self.updates = 0
+        # Số lần nhận dự đoán mà không tên model nào khớp `names` (trọng số sẽ không học được)
+        self.unmatched = 0
+        self.weights = array("d", (initial.get(name, 1.0) for name in self.names))
+
+    def update(self, signs, active, outcome):
+        """Cập nhật một bước từ mảng dấu dự đoán (+1/-1) và mảng model có dự đoán.
+
+        signs/active cùng thứ tự với `names` (ví dụ lấy từ EnsembleCombiner);
+        outcome là +1 (Tài) hoặc -1 (Xỉu). Trả về mảng trọng số mới.
+        """
+        eta, discount = self.eta, self.discount
+        # loss = 0 nếu đoán đúng, 1 nếu đoán sai, 0 nếu không dự đoán
+        losses = map(lambda s, a: a * (1.0 - s * outcome) * 0.5, signs, active)
+        self.log_weights = array("d", map(
+            lambda lw, p, loss: p + discount * (lw - p) - eta * loss,
+            self.log_weights, self.prior, losses
+        ))
+
+        top = max(self.log_weights)
+        exps = array("d", (math.exp(lw - top) for lw in self.log_weights))
+        norm = self.scale / sum(exps)
+        floor = self.floor
+        self.weights = array("d", (max(floor, e * norm) for e in exps))
+        self.updates += 1
+        return self.weights
+
+    def update_outcomes(self, predictions, actual):
+        """Cập nhật từ dict {tên: dự đoán} và kết quả thực tế ('T'/'X'/'Tài'/'Xỉu')"""
+        outcome = _SIGNS.get(actual)
+        if not outcome:
+            return self.weights
+        signs = array("d", bytes(8 * len(self.names)))
+        matched = 0
+        for name, pred in predictions.items():
+            i = self.index.get(name)
+            if i is not None and pred:
+                signs[i] = _SIGNS.get(pred.get("prediction"), 0.0)
+                matched += 1
+        if predictions and not matched:
+            self.unmatched += 1
+            if self.unmatched == 1:
+                logger.warning(f"⚠️ Hedge: tên model {sorted(predictions)} không khớp {self.names}")
+        active = array("d", map(mul, signs, signs))
+        return self.update(signs, active, outcome)
+
+    def as_dict(self):
+        return dict(zip(self.names, self.weights))
+
+    def status(self):
+        return {
+            "eta": self.eta,
+            "discount": self.discount,
+            "updates": self.updates,
+            "unmatched": self.unmatched,
+            "weights": self.as_dict(),
+        }
@@ -0,0 +1,86 @@
+import os
+from bisect import bisect_left, bisect_right
+from response_fields import parse_fields
+
+# ------------------------- HISTORY QUERY -------------------------
+# Phân trang /api/history theo mã phiên:
+#   ?since_sid=N   -> các phiên mới hơn N (cũ nhất trước), dùng để lấy phần chênh lệch
+#   ?before_sid=N  -> các phiên cũ hơn N (trang gần N nhất), dùng để lùi về quá khứ
+#   ?limit=K       -> số phiên mỗi trang (mặc định HISTORY_LIMIT, tối đa HISTORY_MAX_LIMIT)
+#   ?fields=sid,result      -> chỉ trả các cột được liệt kê
+#   ?format=columnar        -> mỗi cột là một danh sách thay vì mỗi phiên là một dict
+HISTORY_LIMIT = int(os.getenv("HISTORY_LIMIT", "100"))
+HISTORY_MAX_LIMIT = int(os.getenv("HISTORY_MAX_LIMIT", "500"))
+QUERY_KEYS = ("since_sid", "before_sid", "limit", "fields", "format")
+FORMATS = ("rows", "columnar")
+
+
+def paginated(args):
+    """True nếu request dùng tham số truy vấn mới (không thì endpoint giữ định dạng cũ)"""
+    return any(key in args for key in QUERY_KEYS)
+
+
+def _int_arg(args, name):
+    raw = args.get(name)
+    if raw is None or raw == "":
+        return None
+    try:
+        return int(raw)
+    except ValueError:
+        raise ValueError(f"{name} phải là số nguyên")
+
+
+def query_history(session_ids, session_details, args, extras=None):
+    """Một trang lịch sử theo tham số request `args`.
+
+    `session_ids` tăng dần (cũ nhất trước), `session_details` mới nhất trước
+    như trong app; vị trí trang được tìm bằng bisect nên không quét cả lịch
+    sử. `extras` là các khối phụ (ví dụ thống kê hệ thống) chỉ trả khi được
+    nêu tên trong ?fields=. Tham số sai -> ValueError.
+    """
+    since_sid = _int_arg(args, "since_sid")
+    before_sid = _int_arg(args, "before_sid")
+    limit = _int_arg(args, "limit")
+    limit = HISTORY_LIMIT if limit is None else limit
+    if limit < 1:
+        raise ValueError("limit phải lớn hơn 0")
+    limit = min(limit, HISTORY_MAX_LIMIT)
+    layout = args.get("format") or "rows"
+    if layout not in FORMATS:
+        raise ValueError(f"format phải là một trong {', '.join(FORMATS)}")
+
+    count = len(session_details)
+    ids = session_ids if len(session_ids) == count else [detail["sid"] for detail in reversed(session_details)]
+    low = bisect_right(ids, since_sid) if since_sid is not None else 0
+    high = bisect_left(ids, before_sid) if before_sid is not None else count
+    if since_sid is not None:
+        # Đọc tiếp về phía phiên mới: trang bắt đầu ngay sau since_sid
+        start, end = low, min(high, low + limit)
+        has_more = end < high
+    else:
+        # Trang mới nhất (hoặc gần before_sid nhất), còn trang cũ hơn nếu start > low
+        start, end = max(low, high - limit), high
+        has_more = start > low
+    rows = [session_details[count - 1 - i] for i in range(start, max(start, end))]
+
+    columns = list(rows[0]) if rows else []
+    fields = parse_fields(args)
+    if fields:
+        columns = [name for name in columns if name in fields] or columns
+
+    data = {
+        "count": len(rows),
+        "length": count,
+        "has_more": has_more,
+        # Con trỏ cho trang kế: ?since_sid=newest_sid lấy phần mới, ?before_sid=oldest_sid lùi tiếp
+        "newest_sid": rows[-1]["sid"] if rows else since_sid,
+        "oldest_sid": rows[0]["sid"] if rows else None,
+    }
+    if layout == "columnar":
+        data["columns"] = {name: [row.get(name) for row in rows] for name in columns}
+    else:
+        data["items"] = [{name: row.get(name) for name in columns} for row in rows]
+    for name, value in (extras or {}).items():
+        if fields and name in fields:
+            data[name] = value
+    return data
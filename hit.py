@@ -5,9 +5,11 @@ import logging
 import threading
 import requests
 from collections import Counter
-from flask import Flask, jsonify
+from flask import Flask
 from flask_cors import CORS
-from datetime import datetime
+from fast_json import json_response, format_now
+from rate_limit import LoadShedder
+from state_store import StateStore
 from UltraDicePredictionSystem import UltraDicePredictionSystem
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
@@ -18,14 +20,21 @@ MAX_HISTORY_LEN = 500
 
 app = Flask(__name__)
 CORS(app)
+# Hạn mức request theo client và giới hạn đồng thời: trả 429 trước mọi khóa và model
+rate_limiter = LoadShedder().install(app)
 app.history = []
 app.session_ids = []
 app.session_details = []
 app.lock = threading.Lock()
+# Bản chụp trạng thái copy-on-write cho các endpoint đọc (không cần app.lock)
+app.state = StateStore()
 
 # Khởi tạo hệ thống dự đoán
 app.prediction_system = UltraDicePredictionSystem()
 
+# Khóa riêng của engine cho poller và các endpoint dùng engine (luôn lấy sau app.lock)
+engine_lock = threading.RLock()
+
 # ------------------------- PATTERN DATA (giữ nguyên) -------------------------
 PATTERN_DATA = {
     # ... (giữ nguyên pattern data từ file cũ)
@@ -66,6 +75,10 @@ def ultra_system_predict(session_details):
         logging.error(f"Lỗi hệ thống dự đoán: {e}")
         return "Tài", f"[Ultra System] Lỗi: {str(e)}"
 
+def publish_state():
+    """Công bố bản chụp trạng thái mới cho các endpoint đọc (gọi khi đang giữ app.lock)"""
+    app.state.publish(app.history, app.session_ids, app.session_details)
+
 # ------------------------- POLL API -------------------------
 def poll_api():
     while True:
@@ -86,7 +99,7 @@ def poll_api():
                 time.sleep(POLL_INTERVAL)
                 continue
 
-            with app.lock:
+            with app.lock, engine_lock:
                 if not app.session_ids or sid > app.session_ids[-1]:
                     app.session_ids.append(sid)
                     app.history.append(result)
@@ -94,6 +107,7 @@ def poll_api():
                     
                     # Cập nhật hệ thống dự đoán
                     result_char = 'T' if result == "Tài" else 'X'
+                    app.prediction_system.update_performance(result_char)
                     app.prediction_system.add_result(result_char)
                     
                     if len(app.history) > MAX_HISTORY_LEN:
@@ -102,6 +116,9 @@ def poll_api():
                         app.session_details.pop()
                     logging.info(f"✅ Phiên mới #{sid}: {result} ({total})")
 
+                    # Công bố bản chụp trạng thái mới cho các endpoint đọc
+                    publish_state()
+
         except Exception as e:
             logging.error(f"❌ Lỗi API: {e}")
         time.sleep(POLL_INTERVAL)
@@ -110,48 +127,49 @@ def poll_api():
 @app.route("/api/hitclub", methods=["GET"])
 def get_prediction():
     try:
-        with app.lock:
-            if not app.history or not app.session_ids or not app.session_details:
-                return jsonify({"error": "Chưa có dữ liệu"}), 500
-
-            current_sid = app.session_ids[-1]
-            current_result = app.history[-1]
-
-            # Sử dụng hệ thống dự đoán mới
-            prediction, reason = ultra_system_predict(app.session_details)
-
-            now_str = datetime.now().strftime("%d/%m/%Y %H:%M:%S")
-
-            return jsonify({
-                "api": "taixiu_anhbaocx_ultra",
-                "current_time": now_str,
-                "current_session": current_sid,
-                "current_result": current_result,
-                "next_session": current_sid + 1,
-                "prediction": prediction,
-                "reason": reason,
-                "system_version": "Ultra AI Prediction System"
-            })
+        state = app.state.current
+        if not state.history or not state.session_ids or not state.session_details:
+            return json_response({"error": "Chưa có dữ liệu"}), 500
+
+        current_sid = state.session_ids[-1]
+        current_result = state.history[-1]
+
+        # Sử dụng hệ thống dự đoán mới (chỉ khóa engine, không chờ poller giữ app.lock)
+        with engine_lock:
+            prediction, reason = ultra_system_predict(state.session_details)
+
+        now_str = format_now()
+
+        return json_response({
+            "api": "taixiu_anhbaocx_ultra",
+            "current_time": now_str,
+            "current_session": current_sid,
+            "current_result": current_result,
+            "next_session": current_sid + 1,
+            "prediction": prediction,
+            "reason": reason,
+            "system_version": "Ultra AI Prediction System"
+        })
     except Exception as e:
         logging.error(f"❌ Lỗi trong get_prediction: {e}")
-        return jsonify({"error": f"Lỗi máy chủ nội bộ: {str(e)}"}), 500
+        return json_response({"error": f"Lỗi máy chủ nội bộ: {str(e)}"}), 500
 
 @app.route("/api/history", methods=["GET"])
 def get_history():
-    with app.lock:
-        return jsonify({
-            "history": app.history,
-            "session_ids": app.session_ids,
-            "details": app.session_details,
-            "length": len(app.history)
-        })
+    state = app.state.current
+    return json_response({
+        "history": state.history,
+        "session_ids": state.session_ids,
+        "details": state.session_details,
+        "length": len(state.history)
+    })
 
 @app.route("/api/system_stats", methods=["GET"])
 def get_system_stats():
     try:
-        with app.lock:
+        with engine_lock:
             prediction_data = app.prediction_system.get_final_prediction()
-            return jsonify({
+            return json_response({
                 "market_state": app.prediction_system.market_state,
                 "session_stats": app.prediction_system.session_stats,
                 "performance": app.prediction_system.performance,
@@ -159,7 +177,7 @@ def get_system_stats():
                 "pattern_count": len(app.prediction_system.pattern_database)
             })
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return json_response({"error": str(e)}), 500
 
 if __name__ == "__main__":
     threading.Thread(target=poll_api, daemon=True).start()
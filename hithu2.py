@@ -5,25 +5,43 @@ import logging
 import threading
 import requests
 from collections import Counter, deque
-from flask import Flask, jsonify
+from flask import Flask
 from flask_cors import CORS
+from fast_json import StaticJSON, json_response, format_now
+from rate_limit import LoadShedder, expensive_budget
 from datetime import datetime
+from llm_prefetch import LLMPrefetcher, PENDING, READY
+from llm_cache import LLMCache
+from circuit_breaker import LLMUnavailable
+from feature_store import FeatureStore
+from state_store import StateStore
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
 API_URL = "https://hithu-ddo6.onrender.com/api/hit"
-OPENROUTER_API_URL = "https://openrouter.ai/api/v1/chat/completions"
+OPENROUTER_API_URL = os.getenv("OPENROUTER_URL", "https://openrouter.ai/api/v1/chat/completions")
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY", "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")
 POLL_INTERVAL = 5
 MAX_HISTORY_LEN = 500
 
 app = Flask(__name__)
 CORS(app)
+# Hạn mức request theo client và giới hạn đồng thời: trả 429 trước mọi khóa và model
+# Endpoint gọi DeepSeek có hạn mức riêng chặt hơn để không đốt quota OpenRouter
+rate_limiter = LoadShedder(routes={
+    "/api/deepseek_predict": expensive_budget(),
+    "/api/deepseek_technical": expensive_budget(),
+}).install(app)
 app.history = []
 app.session_ids = []
 app.session_details = []
 app.ai_training_data = deque(maxlen=1000)
 app.lock = threading.Lock()
+# Bản chụp trạng thái copy-on-write cho các endpoint đọc (không cần app.lock)
+app.state = StateStore()
+
+# Cache phản hồi OpenRouter theo nội dung yêu cầu (model + prompt + tham số)
+llm_cache = LLMCache()
 
 # ------------------------- AI PREDICTION SYSTEM -------------------------
 class AIPredictionSystem:
@@ -74,45 +92,13 @@ PHÂN TÍCH VÀ DỰ ĐOÁN:
             return "Tài", "[DeepSeek] Không có dữ liệu"
 
         try:
-            # Chuẩn bị dữ liệu
-            history = [s['result'] for s in session_details[:30]]
-            recent_10 = [s['result'] for s in session_details[:10]]
-            
-            # Tính toán thống kê
-            tai_count = sum(1 for s in session_details if s['result'] == 'Tài')
-            xiu_count = sum(1 for s in session_details if s['result'] == 'Xỉu')
-            total_sessions = len(session_details)
-            tai_ratio = tai_count / total_sessions if total_sessions > 0 else 0.5
-            xiu_ratio = xiu_count / total_sessions if total_sessions > 0 else 0.5
-            
-            current_streak = self.calculate_current_streak(session_details)
-            volatility = self.calculate_volatility(session_details[:10])
-            common_patterns = self.find_common_patterns(history[:15])
-            
-            # Tính chỉ báo kỹ thuật
-            ma5 = self.calculate_moving_average(session_details[:5])
-            ma10 = self.calculate_moving_average(session_details[:10])
-            rsi = self.calculate_rsi(session_details[:14])
-
-            # Chọn prompt template
-            if prompt_type == 'technical_analysis':
-                prompt = self.prompt_templates['technical_analysis'].format(
-                    recent_10=", ".join(recent_10),
-                    ma5=ma5,
-                    ma10=ma10,
-                    rsi=rsi,
-                    trend=self.analyze_trend(session_details[:10])
-                )
-            else:
-                prompt = self.prompt_templates['deepseek_analysis'].format(
-                    history=", ".join(history),
-                    total_sessions=total_sessions,
-                    tai_ratio=tai_ratio,
-                    xiu_ratio=xiu_ratio,
-                    current_streak=current_streak,
-                    volatility=volatility,
-                    common_patterns=common_patterns
-                )
+            # Prompt dựng sẵn từ feature store; nếu store đã sang phiên khác thì tính từ bản chụp
+            prompt = app.feature_store.prompt(session_details[0]['sid'], prompt_type)
+            if prompt is None:
+                tai_count = sum(1 for s in session_details if s['result'] == 'Tài')
+                xiu_count = sum(1 for s in session_details if s['result'] == 'Xỉu')
+                features = self.compute_features(session_details[:30], tai_count, xiu_count, len(session_details))
+                prompt = self.render_prompt(features, prompt_type)
 
             # Gọi API OpenRouter với DeepSeek
             headers = {
@@ -139,7 +125,7 @@ PHÂN TÍCH VÀ DỰ ĐOÁN:
                 "top_p": 0.9
             }
 
-            response = requests.post(OPENROUTER_API_URL, json=payload, headers=headers, timeout=30)
+            response = llm_cache.post(OPENROUTER_API_URL, json=payload, headers=headers, timeout=30)
             
             if response.status_code == 200:
                 result = response.json()
@@ -169,6 +155,11 @@ PHÂN TÍCH VÀ DỰ ĐOÁN:
                 prediction, reason = self.deepseek_fallback_analysis(session_details)
                 return prediction, f"[DeepSeek API Error] {reason}"
 
+        except LLMUnavailable as e:
+            # Mạch ngắt đang mở: dùng ngay phân tích cục bộ, không chờ OpenRouter
+            logging.info(f"⏭️ Bỏ qua DeepSeek: {e}")
+            prediction, reason = self.deepseek_fallback_analysis(session_details)
+            return prediction, f"[DeepSeek Circuit] {reason}"
         except requests.exceptions.Timeout:
             logging.error("DeepSeek API timeout")
             prediction, reason = self.deepseek_fallback_analysis(session_details)
@@ -178,6 +169,32 @@ PHÂN TÍCH VÀ DỰ ĐOÁN:
             prediction, reason = self.deepseek_fallback_analysis(session_details)
             return prediction, f"[DeepSeek Error] {reason}"
 
+    def compute_features(self, window, tai_count, xiu_count, total_sessions):
+        """Tính các đặc trưng cho prompt từ cửa sổ phiên gần nhất và số đếm toàn lịch sử"""
+        history = [s['result'] for s in window[:30]]
+        return {
+            # deepseek_analysis
+            "history": ", ".join(history),
+            "total_sessions": total_sessions,
+            "tai_ratio": tai_count / total_sessions if total_sessions > 0 else 0.5,
+            "xiu_ratio": xiu_count / total_sessions if total_sessions > 0 else 0.5,
+            "current_streak": self.calculate_current_streak(window),
+            "volatility": self.calculate_volatility(window[:10]),
+            "common_patterns": self.find_common_patterns(history[:15]),
+            # technical_analysis
+            "recent_10": ", ".join(history[:10]),
+            "ma5": self.calculate_moving_average(window[:5]),
+            "ma10": self.calculate_moving_average(window[:10]),
+            "rsi": self.calculate_rsi(window[:14]),
+            "trend": self.analyze_trend(window[:10])
+        }
+
+    def render_prompt(self, features, prompt_type):
+        """Dựng prompt theo template đã chọn"""
+        if prompt_type != 'technical_analysis':
+            prompt_type = 'deepseek_analysis'
+        return self.prompt_templates[prompt_type].format(**features)
+
     def calculate_current_streak(self, session_details):
         """Tính chuỗi kết quả liên tiếp hiện tại"""
         if not session_details:
@@ -366,6 +383,24 @@ PHÂN TÍCH VÀ DỰ ĐOÁN:
 # Khởi tạo hệ thống AI
 app.ai_system = AIPredictionSystem()
 
+# Đặc trưng prompt cập nhật một lần mỗi phiên, dùng chung cho mọi loại prompt
+app.feature_store = FeatureStore(
+    app.ai_system.compute_features, app.ai_system.render_prompt, max_len=MAX_HISTORY_LEN
+)
+
+# Mỗi loại prompt có một bộ gọi DeepSeek nền theo phiên, tách khỏi app.lock
+app.ai_prefetch = {
+    prompt_type: LLMPrefetcher(
+        lambda details, prompt_type=prompt_type: app.ai_system.analyze_with_ai(details, prompt_type),
+        name=f"deepseek-{prompt_type}"
+    )
+    for prompt_type in app.ai_system.prompt_templates
+}
+
+def ai_slot(session_details, prompt_type='deepseek_analysis'):
+    """Ô DeepSeek của phiên mới nhất (đặt lịch nếu chưa có, không chờ kết quả)"""
+    return app.ai_prefetch[prompt_type].schedule(session_details[0]["sid"], list(session_details))
+
 # ------------------------- PATTERN DATA -------------------------
 PATTERN_DATA = {
     "ttt": {"tai": 70, "xiu": 30}, "xxx": {"tai": 30, "xiu": 70},
@@ -375,17 +410,22 @@ PATTERN_DATA = {
 }
 
 # ------------------------- HYBRID PREDICTION SYSTEM -------------------------
-def hybrid_predict(session_details):
-    """Kết hợp AI và phương pháp truyền thống"""
+def hybrid_predict(session_details, slot=None):
+    """Kết hợp AI và phương pháp truyền thống (AI lấy từ ô gọi nền, không chờ)"""
     if not session_details:
         return "Tài", "[Hybrid] Không có dữ liệu"
 
     try:
-        # Sử dụng DeepSeek làm phương pháp chính
-        ai_prediction, ai_reason = app.ai_system.analyze_with_ai(session_details, 'deepseek_analysis')
-        
         # Kết hợp với pattern matching truyền thống
         pattern_prediction, pattern_reason = pattern_predict(session_details)
+
+        # DeepSeek chưa trả về cho phiên này: tạm dùng pattern
+        if not slot or slot["status"] != READY:
+            status = slot["status"] if slot else PENDING
+            return pattern_prediction, f"[Hybrid] DeepSeek {status}, dùng Pattern: {pattern_reason}"
+
+        # Sử dụng DeepSeek làm phương pháp chính
+        ai_prediction, ai_reason = slot["result"]
         
         # Nếu cả hai phương pháp cùng kết quả
         if ai_prediction == pattern_prediction:
@@ -423,6 +463,10 @@ def pattern_predict(session_details):
         logging.error(f"Pattern prediction error: {e}")
         return "Tài", "[Pattern] Lỗi phân tích"
 
+def publish_state():
+    """Công bố bản chụp trạng thái mới cho các endpoint đọc (gọi khi đang giữ app.lock)"""
+    app.state.publish(app.history, app.session_ids, app.session_details)
+
 # ------------------------- POLL API -------------------------
 def poll_api():
     while True:
@@ -458,6 +502,13 @@ def poll_api():
                         app.session_details.pop()
                     
                     logging.info(f"✅ Phiên mới #{sid}: {result} ({total})")
+                    app.feature_store.push(app.session_details[0])
+
+                    # Công bố bản chụp trạng thái mới cho các endpoint đọc
+                    publish_state()
+
+                    # Gọi DeepSeek nền cho phiên kế tiếp với bản chụp lịch sử
+                    ai_slot(app.session_details)
 
         except Exception as e:
             logging.error(f"❌ Lỗi API: {e}")
@@ -467,84 +518,91 @@ def poll_api():
 @app.route("/api/hitclub", methods=["GET"])
 def get_prediction():
     try:
-        with app.lock:
-            if not app.history or not app.session_ids or not app.session_details:
-                return jsonify({"error": "Chưa có dữ liệu"}), 500
-
-            current_sid = app.session_ids[-1]
-            current_result = app.history[-1]
-
-            # Sử dụng hệ thống hybrid prediction
-            prediction, reason = hybrid_predict(app.session_details)
-
-            now_str = datetime.now().strftime("%d/%m/%Y %H:%M:%S")
-
-            return jsonify({
-                "api": "taixiu_deepseek_ai",
-                "current_time": now_str,
-                "current_session": current_sid,
-                "current_result": current_result,
-                "next_session": current_sid + 1,
-                "prediction": prediction,
-                "reason": reason,
-                "ai_model": "DeepSeek V3.1 Free",
-                "system_version": "DeepSeek AI Hybrid System"
-            })
+        state = app.state.current
+        if not state.history or not state.session_ids or not state.session_details:
+            return json_response({"error": "Chưa có dữ liệu"}), 500
+
+        current_sid = state.session_ids[-1]
+        current_result = state.history[-1]
+
+        # Sử dụng hệ thống hybrid prediction
+        slot = ai_slot(state.session_details)
+        prediction, reason = hybrid_predict(state.session_details, slot)
+
+        now_str = format_now()
+
+        return json_response({
+            "api": "taixiu_deepseek_ai",
+            "current_time": now_str,
+            "current_session": current_sid,
+            "current_result": current_result,
+            "next_session": current_sid + 1,
+            "prediction": prediction,
+            "reason": reason,
+            "ai_model": "DeepSeek V3.1 Free",
+            "ai_status": slot["status"],
+            "system_version": "DeepSeek AI Hybrid System"
+        })
     except Exception as e:
         logging.error(f"❌ Lỗi trong get_prediction: {e}")
-        return jsonify({"error": f"Lỗi máy chủ nội bộ: {str(e)}"}), 500
+        return json_response({"error": f"Lỗi máy chủ nội bộ: {str(e)}"}), 500
 
 @app.route("/api/deepseek_predict", methods=["GET"])
 def get_deepseek_prediction():
     """Endpoint riêng cho DeepSeek prediction"""
     try:
-        with app.lock:
-            if not app.session_details:
-                return jsonify({"error": "Chưa có dữ liệu"}), 500
+        state = app.state.current
+        if not state.session_details:
+            return json_response({"error": "Chưa có dữ liệu"}), 500
 
-            prediction, reason = app.ai_system.analyze_with_ai(app.session_details, 'deepseek_analysis')
+        slot = ai_slot(state.session_details)
+        prediction, reason = slot["result"] if slot["status"] == READY else (PENDING, f"[DeepSeek] {slot['status']}")
             
-            return jsonify({
-                "prediction": prediction,
-                "reason": reason,
-                "performance": app.ai_system.get_performance_stats(),
-                "model": "DeepSeek V3.1 Free"
-            })
+        return json_response({
+            "prediction": prediction,
+            "reason": reason,
+            "ai_status": slot["status"],
+            "performance": app.ai_system.get_performance_stats(),
+            "model": "DeepSeek V3.1 Free"
+        })
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return json_response({"error": str(e)}), 500
 
 @app.route("/api/deepseek_technical", methods=["GET"])
 def get_deepseek_technical():
     """Endpoint phân tích kỹ thuật với DeepSeek"""
     try:
-        with app.lock:
-            if not app.session_details:
-                return jsonify({"error": "Chưa có dữ liệu"}), 500
+        state = app.state.current
+        if not state.session_details:
+            return json_response({"error": "Chưa có dữ liệu"}), 500
 
-            prediction, reason = app.ai_system.analyze_with_ai(app.session_details, 'technical_analysis')
+        # Phân tích kỹ thuật chỉ gọi khi có người hỏi; lần đầu mỗi phiên trả "pending"
+        slot = ai_slot(state.session_details, 'technical_analysis')
+        prediction, reason = slot["result"] if slot["status"] == READY else (PENDING, f"[DeepSeek] {slot['status']}")
             
-            return jsonify({
-                "prediction": prediction,
-                "reason": reason,
-                "method": "deepseek_technical_analysis"
-            })
+        return json_response({
+            "prediction": prediction,
+            "reason": reason,
+            "ai_status": slot["status"],
+            "method": "deepseek_technical_analysis"
+        })
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return json_response({"error": str(e)}), 500
 
 @app.route("/api/history", methods=["GET"])
 def get_history():
-    with app.lock:
-        return jsonify({
-            "history": app.history[-50:],  # Chỉ trả về 50 phiên gần nhất
-            "session_ids": app.session_ids[-50:],
-            "details": app.session_details[:50],  # Đã được insert ngược nên lấy 50 đầu
-            "total_length": len(app.history)
-        })
+    state = app.state.current
+    return json_response({
+        "history": state.history[-50:],  # Chỉ trả về 50 phiên gần nhất
+        "session_ids": state.session_ids[-50:],
+        "details": state.session_details[:50],  # Đã được insert ngược nên lấy 50 đầu
+        "total_length": len(state.history)
+    })
 
 @app.route("/api/ai_stats", methods=["GET"])
 def get_ai_stats():
     """Thống kê hiệu suất AI"""
-    return jsonify({
+    return json_response({
         "ai_performance": app.ai_system.get_performance_stats(),
         "training_data_size": len(app.ai_system.ai_training_data),
         "model": app.ai_system.model
@@ -554,47 +612,55 @@ def get_ai_stats():
 def get_pattern_prediction():
     """Endpoint cho pattern prediction thuần túy"""
     try:
-        with app.lock:
-            if not app.session_details:
-                return jsonify({"error": "Chưa có dữ liệu"}), 500
+        state = app.state.current
+        if not state.session_details:
+            return json_response({"error": "Chưa có dữ liệu"}), 500
 
-            prediction, reason = pattern_predict(app.session_details)
+        prediction, reason = pattern_predict(state.session_details)
             
-            return jsonify({
-                "prediction": prediction,
-                "reason": reason,
-                "method": "pattern_matching"
-            })
+        return json_response({
+            "prediction": prediction,
+            "reason": reason,
+            "method": "pattern_matching"
+        })
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return json_response({"error": str(e)}), 500
 
 @app.route("/api/health", methods=["GET"])
 def health_check():
     """Health check endpoint"""
-    return jsonify({
+    return json_response({
         "status": "healthy",
         "timestamp": datetime.now().isoformat(),
-        "data_points": len(app.session_details),
+        "data_points": len(app.state.current.session_details),
         "system": "DeepSeek Tài Xỉu Prediction System",
-        "model": "DeepSeek V3.1 Free"
+        "model": "DeepSeek V3.1 Free",
+        "ai_prefetch": {name: p.status() for name, p in app.ai_prefetch.items()},
+        "feature_store": app.feature_store.status(),
+        "llm_cache": llm_cache.status(),
+        "rate_limit": rate_limiter.status(),
+        "llm_breaker": llm_cache.guard.status()
     })
 
+# Trang chủ chỉ gồm thông tin cố định nên serialize một lần
+HOME_INFO = StaticJSON({
+    "message": "DeepSeek Tài Xỉu AI Prediction System",
+    "version": "2.0",
+    "model": "DeepSeek V3.1 Free",
+    "endpoints": {
+        "/api/hitclub": "Dự đoán chính (Hybrid)",
+        "/api/deepseek_predict": "Dự đoán DeepSeek thuần túy",
+        "/api/deepseek_technical": "Phân tích kỹ thuật",
+        "/api/pattern_predict": "Dự đoán pattern",
+        "/api/ai_stats": "Thống kê AI",
+        "/api/health": "Health check"
+    }
+})
+
 @app.route("/", methods=["GET"])
 def home():
     """Home page"""
-    return jsonify({
-        "message": "DeepSeek Tài Xỉu AI Prediction System",
-        "version": "2.0",
-        "model": "DeepSeek V3.1 Free",
-        "endpoints": {
-            "/api/hitclub": "Dự đoán chính (Hybrid)",
-            "/api/deepseek_predict": "Dự đoán DeepSeek thuần túy",
-            "/api/deepseek_technical": "Phân tích kỹ thuật",
-            "/api/pattern_predict": "Dự đoán pattern",
-            "/api/ai_stats": "Thống kê AI",
-            "/api/health": "Health check"
-        }
-    })
+    return HOME_INFO.response()
 
 if __name__ == "__main__":
     # Khởi chạy thread poll API
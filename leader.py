@@ -0,0 +1,228 @@
+import os
+import json
+import stat
+import time
+import fcntl
+import logging
+import tempfile
+import threading
+from fast_json import dumps
+from snapshot import Snapshot
+from state_store import AppState
+
+logger = logging.getLogger(__name__)
+
+# ------------------------- LEADER ELECTION -------------------------
+# Khoảng thử lại khóa leader và khoảng kiểm tra file trạng thái của worker theo sau (giây)
+LEADER_RETRY = float(os.getenv("LEADER_RETRY", "1"))
+MIRROR_POLL = float(os.getenv("MIRROR_POLL", "0.25"))
+# Ưu tiên /dev/shm (tmpfs) để file trạng thái nằm trong bộ nhớ chung
+RUNTIME_DIR = os.getenv("RUNTIME_DIR") or ("/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir())
+
+
+def private_dir(name, base=RUNTIME_DIR):
+    """Thư mục riêng (0700) của dịch vụ `name` trong `base` cho file khóa và file trạng thái.
+
+    /dev/shm và /tmp ai cũng ghi được: thư mục phải do chính người dùng này tạo
+    và không ai khác đọc/ghi được, nếu không (kể cả khi là symlink) thì từ chối
+    chạy thay vì dùng file do người khác đặt sẵn.
+    """
+    path = os.path.join(base, f"taixiu-{os.getuid()}-{name}")
+    try:
+        os.mkdir(path, 0o700)
+    except FileExistsError:
+        pass
+    info = os.lstat(path)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o077:
+        raise RuntimeError(f"Thư mục runtime {path} không thuộc riêng người dùng hiện tại (cần thư mục 0700 đúng chủ)")
+    return path
+
+
+class LeaderElection:
+    """Bầu một tiến trình nạp dữ liệu bằng fcntl.flock trên một file khóa.
+
+    Mỗi worker chạy một luồng thử lấy khóa độc quyền không chặn; worker lấy
+    được giữ file mở suốt đời tiến trình và gọi `on_elected` một lần. Khi
+    leader chết (kể cả bị kill -9), hệ điều hành tự nhả khóa và worker kế tiếp
+    thử lại sẽ lên thay sau tối đa `interval` giây.
+    """
+
+    def __init__(self, path, on_elected, interval=LEADER_RETRY):
+        self.path = path
+        self.on_elected = on_elected
+        self.interval = interval
+        self.fd = None
+        self.elected_at = None
+        self.attempts = 0
+
+    @property
+    def is_leader(self):
+        return self.fd is not None
+
+    def try_acquire(self):
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT | os.O_NOFOLLOW, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        # Ghi pid để các worker khác biết ai đang là leader
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self.fd = fd
+        self.elected_at = time.time()
+        return True
+
+    def start(self):
+        threading.Thread(target=self._run, name="leader-election", daemon=True).start()
+
+    def _run(self):
+        while True:
+            self.attempts += 1
+            if self.try_acquire():
+                logger.info(f"👑 Tiến trình {os.getpid()} trở thành leader nạp dữ liệu")
+                self.on_elected()
+                return
+            time.sleep(self.interval)
+
+    def leader_pid(self):
+        try:
+            with open(os.open(self.path, os.O_RDONLY | os.O_NOFOLLOW)) as f:
+                return int(f.read().strip() or 0) or None
+        except (OSError, ValueError):
+            return None
+
+    def status(self):
+        """Thông tin cho endpoint health/debug"""
+        return {
+            "role": "leader" if self.is_leader else "follower",
+            "pid": os.getpid(),
+            "leader_pid": os.getpid() if self.is_leader else self.leader_pid(),
+            "elected_at": self.elected_at,
+            "attempts": self.attempts,
+        }
+
+
+def encode_state(state, snapshot):
+    """JSON của cặp (AppState, Snapshot) để sao sang worker theo sau"""
+    return dumps({
+        "state": {
+            "version": state.version,
+            "published_at": state.published_at,
+            "history": state.history,
+            "session_ids": state.session_ids,
+            "session_details": state.session_details,
+            "views": state.views,
+        },
+        "snapshot": None if snapshot is None else {
+            "sid": snapshot.sid,
+            "data": snapshot.data,
+            "detail_keys": snapshot.detail_keys,
+            "revision": snapshot.revision,
+            "published_at": snapshot.published_at,
+        },
+    })
+
+
+def decode_state(payload):
+    """Dựng lại (AppState, Snapshot) từ JSON do `encode_state` ghi"""
+    data = json.loads(payload)
+    raw = data["state"]
+    state = AppState(raw["version"], tuple(raw["history"]), tuple(raw["session_ids"]),
+                     tuple(raw["session_details"]), raw["views"])
+    state.published_at = raw["published_at"]
+    raw = data["snapshot"]
+    snapshot = None
+    if raw is not None:
+        snapshot = Snapshot(raw["sid"], raw["data"], raw["detail_keys"], raw["revision"])
+        snapshot.published_at = raw["published_at"]
+    return state, snapshot
+
+
+class StateMirror:
+    """Sao trạng thái đã công bố (AppState + bản chụp dự đoán) từ leader sang các worker.
+
+    Leader gọi `export()` sau mỗi lần công bố: cặp (state, snapshot) được ghi
+    dạng JSON (không dùng pickle: đọc file không bao giờ chạy mã) một cách
+    nguyên tử (file tạm + os.replace) nên bên đọc không bao giờ thấy file ghi dở.
+    Worker theo sau kiểm tra stat của file định kỳ và chỉ đọc lại khi file đổi. Trạng thái chỉ được áp khi bản chụp dự đoán đã bắt kịp
+    phiên mới nhất, để /api/hitclub trên worker không phải tự tính dự đoán (worker
+    theo sau không chạy model). `on_load(state, snapshot)` được gọi sau mỗi lần áp.
+    """
+
+    def __init__(self, path, state_store, snapshots, on_load=None, interval=MIRROR_POLL):
+        self.path = path
+        self.state_store = state_store
+        self.snapshots = snapshots
+        self.on_load = on_load
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.seen = None
+        self.stats = {"exported": 0, "loaded": 0, "waiting": 0, "errors": 0}
+
+    def export(self, *_):
+        """Ghi trạng thái hiện tại ra file (gọi từ listener của StateStore/SnapshotPublisher)"""
+        with self.lock:
+            try:
+                payload = encode_state(self.state_store.current, self.snapshots.current)
+                tmp = f"{self.path}.{os.getpid()}.tmp"
+                with open(os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_NOFOLLOW, 0o600), "wb") as f:
+                    f.write(payload)
+                os.replace(tmp, self.path)
+            except (OSError, TypeError, ValueError) as e:
+                # Lỗi ghi không được làm hỏng lượt công bố của poller
+                self.stats["errors"] += 1
+                logger.warning(f"⚠️ Không ghi được trạng thái cho worker theo sau: {e}")
+                return
+            self.stats["exported"] += 1
+
+    def load(self):
+        """Đọc lại file nếu đã đổi; True khi đã áp trạng thái mới"""
+        with self.lock:
+            try:
+                fd = os.open(self.path, os.O_RDONLY | os.O_NOFOLLOW)
+            except FileNotFoundError:
+                return False
+            with open(fd, "rb") as f:
+                info = os.fstat(fd)
+                key = (info.st_ino, info.st_mtime_ns, info.st_size)
+                if key == self.seen:
+                    return False
+                try:
+                    state, snapshot = decode_state(f.read())
+                except (OSError, ValueError, KeyError, TypeError) as e:
+                    self.stats["errors"] += 1
+                    logger.warning(f"⚠️ Không đọc được trạng thái của leader: {e}")
+                    return False
+            self.seen = key
+            if state.session_ids and (snapshot is None or snapshot.sid != state.session_ids[-1]):
+                # Leader vừa nạp phiên mới nhưng chưa công bố dự đoán: đợi lần ghi kế tiếp
+                self.stats["waiting"] += 1
+                return False
+            self.state_store.current = state
+            if snapshot is not None:
+                self.snapshots.current = snapshot
+            self.stats["loaded"] += 1
+        if self.on_load is not None:
+            self.on_load(state, snapshot)
+        return True
+
+    def follow(self):
+        threading.Thread(target=self._run, name="state-mirror", daemon=True).start()
+
+    def _run(self):
+        while not self.stopped.is_set():
+            try:
+                self.load()
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.error(f"❌ Lỗi đồng bộ trạng thái: {e}")
+            self.stopped.wait(self.interval)
+
+    def stop(self):
+        self.stopped.set()
+
+    def status(self):
+        """Thông tin cho endpoint health/debug"""
+        return {"path": self.path, **self.stats}
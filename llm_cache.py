@@ -0,0 +1,218 @@
+import os
+import json
+import time
+import atexit
+import hashlib
+import logging
+import threading
+import requests
+from urllib.parse import urlparse
+from collections import OrderedDict
+from single_flight import SingleFlight
+from llm_stream import StreamResult, stream_completion
+from circuit_breaker import LLMGuard
+
+logger = logging.getLogger(__name__)
+
+# ------------------------- LLM CACHE -------------------------
+# Số phản hồi giữ lại, thời gian sống (giây) và file lưu trữ (trống = chỉ trong bộ nhớ)
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "256"))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "900"))
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "")
+# Chu kỳ ghi cache xuống đĩa ở nền (giây); chỉ ghi khi có mục mới
+LLM_CACHE_FLUSH = float(os.getenv("LLM_CACHE_FLUSH", "5"))
+
+
+def cache_key(payload):
+    """Khóa nội dung của một yêu cầu completion: model, prompt (template + cửa sổ lịch sử) và tham số"""
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def guard_key(url, payload):
+    """Khóa mạch ngắt: nhà cung cấp (host) và model"""
+    return f"{urlparse(url).netloc}:{(payload or {}).get('model', '')}"
+
+
+def provider_failed(response):
+    """Bị giới hạn tốc độ hoặc lỗi phía nhà cung cấp thì tính là lỗi cho mạch ngắt"""
+    return response.status_code == 429 or response.status_code >= 500
+
+
+class CachedResponse:
+    """Phản hồi lấy từ cache, cùng giao diện tối thiểu với requests.Response"""
+
+    status_code = 200
+
+    def __init__(self, body):
+        self._body = body
+
+    def json(self):
+        return self._body
+
+    @property
+    def text(self):
+        return json.dumps(self._body, ensure_ascii=False)
+
+
+class LLMCache:
+    """Cache LRU + TTL cho phản hồi OpenRouter, đánh địa chỉ theo nội dung yêu cầu.
+
+    Prompt chỉ đổi khi có phiên mới, nên cùng một cửa sổ lịch sử sẽ không bao
+    giờ phải gọi OpenRouter lần thứ hai. Chỉ phản hồi 200 được lưu. Nếu có
+    `path`, cache được nạp lại khi khởi động; mục mới chỉ đánh dấu cache bẩn,
+    một luồng nền ghi xuống đĩa mỗi `flush_interval` giây (và khi thoát) ngoài
+    khóa cache, nên `get` không bao giờ phải chờ I/O đĩa.
+    Các lời gọi đồng thời cùng nội dung khi cache chưa có chỉ tạo một request,
+    và mọi request thật đều đi qua mạch ngắt + giới hạn đồng thời của `guard`.
+    """
+
+    def __init__(self, max_entries=LLM_CACHE_SIZE, ttl=LLM_CACHE_TTL, path=LLM_CACHE_PATH, guard=None,
+                 flush_interval=LLM_CACHE_FLUSH):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()  # Chỉ một lần ghi file tại một thời điểm
+        self.dirty = False
+        self.entries = OrderedDict()  # key -> (thời điểm lưu, body)
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "expired": 0, "saves": 0}
+        self.flight = SingleFlight()
+        self.guard = guard if guard is not None else LLMGuard()
+        if path:
+            self._load()
+            threading.Thread(target=self._flush_loop, name="llm-cache-flush", daemon=True).start()
+            atexit.register(self.flush)
+
+    def get(self, key):
+        """Body đã lưu của khóa (None nếu chưa có hoặc đã hết hạn)"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            stored_at, body = entry
+            if time.time() - stored_at > self.ttl:
+                del self.entries[key]
+                self.stats["expired"] += 1
+                self.stats["misses"] += 1
+                return None
+            self.entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return body
+
+    def set(self, key, body):
+        with self.lock:
+            self.entries[key] = (time.time(), body)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.stats["evictions"] += 1
+            self.dirty = True
+
+    def post(self, url, json=None, headers=None, timeout=None):
+        """Thay thế requests.post cho API chat completions, đi qua cache"""
+        key = cache_key(json)
+        body = self.get(key)
+        if body is not None:
+            return CachedResponse(body)
+
+        # Người gọi đồng thời cùng nội dung chờ chung một request tới OpenRouter
+        return self.flight.do(key, lambda: self._fetch(key, url, json, headers, timeout))
+
+    def _fetch(self, key, url, payload, headers, timeout):
+        response = self.guard.call(
+            guard_key(url, payload),
+            lambda: requests.post(url, json=payload, headers=headers, timeout=timeout),
+            failed=provider_failed
+        )
+        if response.status_code == 200:
+            self.set(key, response.json())
+        return response
+
+    def stream(self, url, json=None, headers=None, timeout=None, parser_class=None, cancel=None):
+        """Gọi completion dạng stream qua cache, dừng sớm theo parser_class.
+
+        Cache lưu phần văn bản đã nhận; khi trúng cache parser được chạy lại
+        trên văn bản đó. Khóa gồm cả tên parser vì điểm dừng sớm phụ thuộc parser.
+        Bật `cancel` để đóng stream giữa chừng; kết quả bị hủy không được lưu cache.
+        """
+        key = cache_key(dict(json, stream=True, parser=parser_class.__name__ if parser_class else None))
+        body = self.get(key)
+        if body is not None:
+            text = body["choices"][0]["message"]["content"]
+            parser = parser_class() if parser_class else None
+            if parser is not None:
+                parser.feed(text)
+            return StreamResult(200, text, parser.result() if parser else None)
+
+        return self.flight.do(key, lambda: self._fetch_stream(key, url, json, headers, timeout, parser_class, cancel))
+
+    def _fetch_stream(self, key, url, payload, headers, timeout, parser_class, cancel=None):
+        parser = parser_class() if parser_class else None
+        result = self.guard.call(
+            guard_key(url, payload),
+            lambda: stream_completion(url, payload, headers=headers, timeout=timeout, parser=parser, cancel=cancel),
+            failed=provider_failed
+        )
+        if result.status_code == 200 and not result.cancelled:
+            self.set(key, {"choices": [{"message": {"content": result.text}}]})
+        return result
+
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                saved = json.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            logger.warning(f"⚠️ Không đọc được cache LLM {self.path}: {e}")
+            return
+        now = time.time()
+        for key, stored_at, body in saved:
+            if now - stored_at <= self.ttl:
+                self.entries[key] = (stored_at, body)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def flush(self):
+        """Ghi cache xuống đĩa nếu có mục mới; khóa cache chỉ giữ lúc chụp danh sách mục"""
+        if not self.path:
+            return
+        with self.save_lock:
+            with self.lock:
+                if not self.dirty:
+                    return
+                saved = [[key, stored_at, body] for key, (stored_at, body) in self.entries.items()]
+                self.dirty = False
+            tmp_path = f"{self.path}.tmp"
+            try:
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(saved, f, ensure_ascii=False)
+                os.replace(tmp_path, self.path)
+                self.stats["saves"] += 1
+            except Exception as e:
+                # Giữ cờ bẩn để lần sau ghi lại
+                self.dirty = True
+                logger.warning(f"⚠️ Không ghi được cache LLM {self.path}: {e}")
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def status(self):
+        """Thông tin cho endpoint health/debug"""
+        with self.lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {
+                "entries": len(self.entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "persistent": bool(self.path),
+                "dirty": self.dirty,
+                "hit_rate": round(self.stats["hits"] / lookups, 4) if lookups else 0,
+                "coalesced": self.flight.stats["shared"],
+                **self.stats,
+            }
@@ -0,0 +1,140 @@
+import os
+import time
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+logger = logging.getLogger(__name__)
+
+# ------------------------- HEDGED LLM FAN-OUT -------------------------
+# Tổng thời gian cho một lần hỏi nhiều model và độ trễ dự phòng khi chưa đủ số liệu (giây)
+LLM_BUDGET = float(os.getenv("LLM_BUDGET", "25"))
+HEDGE_DEFAULT_DELAY = float(os.getenv("HEDGE_DEFAULT_DELAY", "3"))
+HEDGE_MIN_DELAY = 0.5
+LATENCY_SAMPLES = 50
+
+
+class HedgedFanout:
+    """Hỏi nhiều model LLM theo kiểu hedging trong một ngân sách thời gian.
+
+    Model chính được gọi trước; nếu sau p95 độ trễ của nó vẫn chưa có kết
+    quả hợp lệ thì gọi thêm model dự phòng kế tiếp (model lỗi thì gọi ngay
+    model kế tiếp). Kết quả hợp lệ đầu tiên thắng.
+
+    Khi có kết quả (hoặc hết ngân sách), lời gọi chưa chạy bị hủy và sự kiện
+    `cancel` truyền cho call(model, timeout, cancel) được bật. Future.cancel()
+    không dừng được lời gọi HTTP đang chạy: call phải tự theo dõi `cancel`
+    (ví dụ LLMCache.stream đóng kết nối ở dòng SSE kế tiếp, trả lượt LLMGuard
+    và thôi tốn quota). Lời gọi không theo dõi `cancel` vẫn chạy tới khi xong
+    hoặc hết timeout, giữ lượt LLMGuard trong suốt thời gian đó.
+
+    parse(content) trả về (kết quả, chắc_chắn): kết quả chắc chắn (JSON hợp
+    lệ) thắng ngay; kết quả suy từ từ khóa chỉ dùng khi không model nào trả
+    về JSON hợp lệ.
+    """
+
+    def __init__(self, budget=LLM_BUDGET, default_delay=HEDGE_DEFAULT_DELAY, max_workers=6, name="llm-fanout"):
+        self.budget = budget
+        self.default_delay = default_delay
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.stats = {"runs": 0, "hedged": 0, "wins": {}, "failed": 0, "cancelled": 0}
+
+    def hedge_delay(self, model):
+        """Độ trễ trước khi gọi model dự phòng: p95 độ trễ gần đây của model đang chờ"""
+        with self.lock:
+            samples = sorted(self.latencies.get(model, ()))
+        if len(samples) < 5:
+            return self.default_delay
+        p95 = samples[min(len(samples) - 1, int(0.95 * len(samples)))]
+        return min(max(HEDGE_MIN_DELAY, p95), self.budget / 2)
+
+    def _record(self, model, elapsed):
+        with self.lock:
+            self.latencies.setdefault(model, deque(maxlen=LATENCY_SAMPLES)).append(elapsed)
+
+    def _attempt(self, call, parse, model, timeout, cancel):
+        # Pool đã nhận lời gọi nhưng model khác vừa thắng: không gọi mạng nữa
+        if cancel.is_set():
+            return None, False
+        start = time.monotonic()
+        content = call(model, timeout, cancel)
+        if cancel.is_set():
+            # Lời gọi bị cắt giữa chừng: độ trễ không đại diện cho model
+            return None, False
+        self._record(model, time.monotonic() - start)
+        return parse(content) if content is not None else (None, False)
+
+    def run(self, models, call, parse):
+        """models: danh sách model theo thứ tự ưu tiên; call(model, timeout, cancel) -> nội dung trả lời.
+
+        Trả về (kết quả, model) hoặc (None, None) nếu hết ngân sách mà không có kết quả.
+        """
+        start = time.monotonic()
+        deadline = start + self.budget
+        queue = list(models)
+        futures = {}
+        weak = None
+        cancel = threading.Event()
+        self.stats["runs"] += 1
+
+        def launch():
+            model = queue.pop(0)
+            timeout = max(0.1, deadline - time.monotonic())
+            futures[self.executor.submit(self._attempt, call, parse, model, timeout, cancel)] = model
+            return model
+
+        waiting_on = launch()
+        next_hedge = time.monotonic() + self.hedge_delay(waiting_on)
+        try:
+            while futures or queue:
+                now = time.monotonic()
+                if now >= deadline:
+                    break
+                if not futures or (queue and now >= next_hedge):
+                    if futures:
+                        self.stats["hedged"] += 1
+                    waiting_on = launch()
+                    next_hedge = time.monotonic() + self.hedge_delay(waiting_on)
+                    continue
+
+                timeout = (next_hedge if queue else deadline) - now
+                done, _ = wait(futures, timeout=max(0, min(timeout, deadline - now)), return_when=FIRST_COMPLETED)
+                for future in done:
+                    model = futures.pop(future)
+                    try:
+                        result, certain = future.result()
+                    except Exception as e:
+                        logger.warning(f"⚠️ Model {model} lỗi: {e}")
+                        continue
+                    if result is None:
+                        continue
+                    if certain:
+                        self.stats["wins"][model] = self.stats["wins"].get(model, 0) + 1
+                        return result, model
+                    if weak is None:
+                        weak = (result, model)
+        finally:
+            # Báo dừng các lời gọi thua cuộc: chưa chạy thì hủy, đang chạy thì call tự đóng kết nối
+            if futures:
+                cancel.set()
+                self.stats["cancelled"] += len(futures)
+            for future in futures:
+                future.cancel()
+
+        if weak is not None:
+            self.stats["wins"][weak[1]] = self.stats["wins"].get(weak[1], 0) + 1
+            return weak
+        self.stats["failed"] += 1
+        logger.warning(f"⏱️ Không model nào trả lời hợp lệ trong {self.budget}s")
+        return None, None
+
+    def status(self):
+        """Thông tin cho endpoint health/debug"""
+        return {
+            "budget": self.budget,
+            "hedge_delay": {model: round(self.hedge_delay(model), 3) for model in list(self.latencies)},
+            **self.stats,
+        }
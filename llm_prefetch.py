@@ -0,0 +1,102 @@
+import time
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# ------------------------- LLM PREFETCH -------------------------
+# Trạng thái của một ô dự đoán LLM theo phiên
+PENDING = "pending"
+READY = "ready"
+ERROR = "error"
+STALE = "stale"
+
+
+class LLMPrefetcher:
+    """Gọi LLM ở nền cho phiên kế tiếp, tách hoàn toàn khỏi app.lock.
+
+    Poller gọi `schedule(sid, snapshot)` ngay sau khi nạp phiên `sid`; lời gọi
+    OpenRouter chạy trên luồng riêng với bản chụp lịch sử nên không giữ khóa
+    nào của ứng dụng. Request chỉ đọc ô của phiên hiện tại qua `get(sid)`:
+    chưa có kết quả thì trả về trạng thái "pending" thay vì chờ. Việc còn
+    trong hàng đợi mà đã có phiên mới hơn thì bị bỏ qua (stale). Nếu có
+    `on_done`, hàm này được gọi với (sid, bản sao ô) khi lời gọi kết thúc.
+    """
+
+    def __init__(self, fetch, max_slots=8, max_workers=1, name="llm-prefetch", on_done=None):
+        self.fetch = fetch
+        self.on_done = on_done
+        self.max_slots = max_slots
+        self.name = name
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self.lock = threading.Lock()
+        self.slots = OrderedDict()
+        self.latest = None
+        self.stats = {"scheduled": 0, "ready": 0, "errors": 0, "stale": 0}
+
+    def schedule(self, sid, snapshot):
+        """Đặt lịch gọi LLM cho phiên `sid` (không chặn, gọi lại nhiều lần vô hại).
+
+        snapshot là bản chụp dữ liệu đầu vào của fetch (ví dụ list session_details).
+        Trả về bản sao ô hiện tại của phiên.
+        """
+        with self.lock:
+            slot = self.slots.get(sid)
+            if slot is None:
+                slot = {"status": PENDING, "result": None, "error": None,
+                        "scheduled_at": time.time(), "elapsed_ms": None}
+                self.slots[sid] = slot
+                while len(self.slots) > self.max_slots:
+                    self.slots.popitem(last=False)
+                if self.latest is None or sid > self.latest:
+                    self.latest = sid
+                self.stats["scheduled"] += 1
+                self.executor.submit(self._run, sid, slot, snapshot)
+            return dict(slot)
+
+    def _run(self, sid, slot, snapshot):
+        with self.lock:
+            if sid != self.latest:
+                # Đã có phiên mới hơn: bỏ qua, không tốn một lời gọi OpenRouter
+                slot["status"] = STALE
+                self.stats["stale"] += 1
+                return
+
+        start = time.monotonic()
+        try:
+            result = self.fetch(snapshot)
+            status, error = READY, None
+        except Exception as e:
+            logger.error(f"❌ {self.name} lỗi ở phiên #{sid}: {e}")
+            result, status, error = None, ERROR, str(e)
+
+        with self.lock:
+            slot["result"] = result
+            slot["status"] = status
+            slot["error"] = error
+            slot["elapsed_ms"] = round((time.monotonic() - start) * 1000, 2)
+            self.stats["ready" if status == READY else "errors"] += 1
+            done = dict(slot)
+
+        if self.on_done is not None:
+            try:
+                self.on_done(sid, done)
+            except Exception as e:
+                logger.error(f"❌ {self.name} on_done lỗi ở phiên #{sid}: {e}")
+
+    def get(self, sid):
+        """Đọc ô của phiên `sid` không chặn (None nếu chưa từng đặt lịch)"""
+        with self.lock:
+            slot = self.slots.get(sid)
+            return dict(slot) if slot is not None else None
+
+    def status(self):
+        """Thông tin cho endpoint health/debug"""
+        with self.lock:
+            return {
+                "latest": self.latest,
+                "slots": {str(sid): slot["status"] for sid, slot in self.slots.items()},
+                **self.stats,
+            }
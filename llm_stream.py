@@ -0,0 +1,149 @@
+import re
+import json
+import requests
+
+# ------------------------- LLM STREAMING -------------------------
+class FieldParser:
+    """Bộ phân tích tăng dần cho câu trả lời LLM đang stream.
+
+    Mỗi trường có một regex; trường được chốt khi regex khớp trọn vẹn trên
+    phần văn bản đã nhận. Khi đủ các trường bắt buộc thì `feed` trả về True
+    để đóng stream sớm, không chờ (và không trả tiền cho) phần còn lại.
+    """
+
+    patterns = {}
+    required = ()
+
+    def __init__(self):
+        self.buffer = ""
+        self.fields = {}
+
+    def convert(self, name, value):
+        return value
+
+    def feed(self, chunk):
+        """Nhận thêm một đoạn văn bản; trả về True khi đã đủ trường bắt buộc"""
+        self.buffer += chunk
+        for name, pattern in self.patterns.items():
+            if name not in self.fields:
+                match = pattern.search(self.buffer)
+                if match:
+                    self.fields[name] = self.convert(name, match.group(1))
+        return self.done
+
+    @property
+    def done(self):
+        return all(name in self.fields for name in self.required)
+
+    def result(self):
+        return dict(self.fields) if self.done else None
+
+
+class JSONFieldParser(FieldParser):
+    """Lấy prediction/confidence (và reason nếu kịp) từ JSON đang stream"""
+
+    patterns = {
+        "prediction": re.compile(r'"prediction"\s*:\s*"(Tài|Xỉu)"'),
+        # Số chỉ được chốt khi đã gặp ký tự kết thúc, tránh cắt "0.7" thành "0"
+        "confidence": re.compile(r'"confidence"\s*:\s*"?(\d+(?:\.\d+)?)"?\s*[,}\n]'),
+        "reason": re.compile(r'"reason"\s*:\s*"((?:[^"\\]|\\.)*)"'),
+    }
+    required = ("prediction", "confidence")
+
+    def convert(self, name, value):
+        if name == "confidence":
+            confidence = float(value)
+            return confidence / 100 if confidence > 1 else confidence
+        if name == "reason":
+            try:
+                return json.loads(f'"{value}"')
+            except ValueError:
+                return value
+        return value
+
+
+class VerdictParser(FieldParser):
+    """Lấy kết luận từ dòng "Dự đoán: Tài/Xỉu" ở đầu câu trả lời.
+
+    Chấp nhận markdown và nhãn ngắn giữa "Dự đoán" và kết luận trên cùng một
+    dòng, ví dụ "**Dự đoán:** Tài" hay "Dự đoán cuối cùng: Xỉu".
+    """
+
+    patterns = {"prediction": re.compile(r"Dự đoán[^\n]{0,20}?(Tài|Xỉu)", re.IGNORECASE)}
+    required = ("prediction",)
+
+    def convert(self, name, value):
+        return value.capitalize()
+
+
+class StreamResult:
+    """Kết quả một lần gọi stream: mã HTTP, văn bản đã nhận và các trường đã chốt.
+
+    `cancelled` là True khi người gọi đã báo dừng giữa chừng: văn bản chỉ là
+    phần đã nhận được và không nên dùng hay lưu cache.
+    """
+
+    def __init__(self, status_code, text, fields=None, early=False, cancelled=False):
+        self.status_code = status_code
+        self.text = text
+        self.fields = fields
+        self.early = early
+        self.cancelled = cancelled
+
+
+def parse_events(lines):
+    """Sinh ra các đoạn nội dung (delta) từ các dòng SSE của API chat completions"""
+    for line in lines:
+        # Dòng trống và dòng chú thích (": OPENROUTER PROCESSING") là keep-alive
+        if not line or line.startswith(":") or not line.startswith("data:"):
+            continue
+        data = line[5:].strip()
+        if data == "[DONE]":
+            return
+        try:
+            event = json.loads(data)
+        except ValueError:
+            continue
+        for choice in event.get("choices") or ():
+            content = (choice.get("delta") or {}).get("content")
+            if content:
+                yield content
+
+
+def _until(lines, cancel):
+    """Dừng đọc khi `cancel` được bật; kiểm tra ở mọi dòng, kể cả dòng keep-alive"""
+    for line in lines:
+        if cancel.is_set():
+            return
+        yield line
+
+
+def stream_completion(url, payload, headers=None, timeout=None, parser=None, cancel=None):
+    """Gọi completion ở chế độ stream (SSE), đóng kết nối ngay khi parser đã đủ trường.
+
+    `cancel` (threading.Event, tùy chọn) cho phép luồng khác hủy lời gọi: kết
+    nối được đóng ở dòng SSE kế tiếp. Lúc còn chờ header phản hồi thì chưa
+    hủy được, lời gọi chỉ dừng khi có header hoặc hết `timeout`.
+    """
+    response = requests.post(url, json=dict(payload, stream=True), headers=headers,
+                             timeout=timeout, stream=True)
+    try:
+        if response.status_code != 200:
+            return StreamResult(response.status_code, response.text)
+
+        # SSE thường không khai báo charset; nội dung luôn là UTF-8
+        response.encoding = "utf-8"
+        lines = response.iter_lines(decode_unicode=True)
+        if cancel is not None:
+            lines = _until(lines, cancel)
+        chunks = []
+        early = False
+        for content in parse_events(lines):
+            chunks.append(content)
+            if parser is not None and parser.feed(content):
+                early = True
+                break
+        cancelled = not early and cancel is not None and cancel.is_set()
+        return StreamResult(200, "".join(chunks), parser.result() if parser else None, early, cancelled)
+    finally:
+        response.close()
@@ -0,0 +1,168 @@
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# ------------------------- MODEL REGISTRY -------------------------
+# Thứ tự chạy theo lớp chi phí: model rẻ trước, model tốn kém sau, meta-model cuối cùng
+COST_ORDER = {"cheap": 0, "medium": 1, "expensive": 2, "meta": 3}
+
+
+class ModelSpec:
+    """Khai báo của một model: lookback, đặc trưng sử dụng và lớp chi phí"""
+
+    __slots__ = ("name", "func", "min_lookback", "max_lookback", "features", "cost", "alias_of", "order")
+
+    def __init__(self, name, func, min_lookback=0, max_lookback=None, features=(),
+                 cost="cheap", alias_of=None, order=0):
+        if cost not in COST_ORDER:
+            raise ValueError(f"Lớp chi phí không hợp lệ: {cost}")
+        self.name = name
+        self.func = func
+        self.min_lookback = min_lookback
+        self.max_lookback = max_lookback
+        self.features = tuple(features)
+        self.cost = cost
+        self.alias_of = alias_of
+        self.order = order
+
+    def to_dict(self):
+        return {
+            "min_lookback": self.min_lookback,
+            "max_lookback": self.max_lookback,
+            "features": list(self.features),
+            "cost": self.cost,
+            "alias_of": self.alias_of,
+        }
+
+
+class ModelRegistry:
+    """Sổ đăng ký model cho một engine.
+
+    Model được gắn bằng decorator `register`; engine chỉ cần gọi `run(self)`
+    để có dict {tên model: dự đoán}. Registry cắt lát lịch sử dùng chung một
+    lần, bỏ qua model chưa đủ dữ liệu mà không gọi tới, chạy model tốn kém
+    sau cùng và nhớ kết quả để model alias/meta không tính lại.
+
+    Lượt chạy được giữ theo từng luồng (threading.local, theo engine), nên
+    hai luồng cùng chạy trên một engine không dùng lẫn kết quả của nhau.
+    """
+
+    def __init__(self):
+        self.specs = {}
+        self._schedule = None
+        self._local = threading.local()
+
+    def register(self, name, min_lookback=0, max_lookback=None, features=(), cost="cheap", alias_of=None):
+        """Decorator đăng ký một phương thức model của engine"""
+        def decorator(func):
+            self.specs[name] = ModelSpec(name, func, min_lookback, max_lookback, features,
+                                         cost, alias_of, order=len(self.specs))
+            self._schedule = None
+            return func
+        return decorator
+
+    def names(self):
+        return list(self.specs)
+
+    def resolve(self, name):
+        """Đi theo chuỗi alias tới model thực sự được tính"""
+        spec = self.specs[name]
+        while spec.alias_of:
+            spec = self.specs[spec.alias_of]
+        return spec
+
+    def is_meta(self, name):
+        return self.resolve(name).cost == "meta"
+
+    def schedule(self):
+        """Danh sách model theo thứ tự chạy (chi phí tăng dần, giữ thứ tự đăng ký)"""
+        if self._schedule is None:
+            self._schedule = sorted(
+                self.specs.values(),
+                key=lambda s: (COST_ORDER[self.resolve(s.name).cost], s.order)
+            )
+        return self._schedule
+
+    def lookback(self, size):
+        """Độ dài lát lịch sử nhỏ nhất đủ cho mọi model đủ điều kiện (None = toàn bộ)"""
+        longest = 0
+        for spec in self.specs.values():
+            if spec.alias_of or size < spec.min_lookback:
+                continue
+            if spec.max_lookback is None:
+                return None
+            longest = max(longest, spec.max_lookback)
+        return longest
+
+    def context(self, engine):
+        """Lượt chạy đang diễn ra trên `engine` trong luồng hiện tại (None nếu không có)"""
+        contexts = getattr(self._local, "contexts", None)
+        return contexts.get(id(engine)) if contexts else None
+
+    def run(self, engine, names=None):
+        """Chạy các model đã đăng ký trên engine, trả về dict theo thứ tự đăng ký"""
+        contexts = self._local.__dict__.setdefault("contexts", {})
+        ctx = contexts.get(id(engine))
+        if ctx is not None:
+            # Đang ở trong một lượt chạy (ví dụ meta-model gọi model khác): dùng lại kết quả
+            return {name: ctx.get(name) for name in (names or self.specs)}
+
+        ctx = ModelContext(self, engine)
+        contexts[id(engine)] = ctx
+        try:
+            if names is None:
+                for spec in self.schedule():
+                    ctx.get(spec.name)
+                names = self.specs
+            return {name: ctx.get(name) for name in names}
+        finally:
+            del contexts[id(engine)]
+
+    def predict(self, engine, name):
+        """Dự đoán của một model (dùng lại kết quả nếu đang trong lượt chạy)"""
+        return self.run(engine, (name,))[name]
+
+    def base_predictions(self, engine):
+        """Dự đoán của mọi model không phải meta (đầu vào cho meta-model)"""
+        return self.run(engine, [name for name in self.specs if not self.is_meta(name)])
+
+
+class ModelContext:
+    """Trạng thái của một lượt chạy: lát lịch sử dùng chung và kết quả đã tính"""
+
+    def __init__(self, registry, engine):
+        self.registry = registry
+        self.engine = engine
+        history = engine.history
+        self.size = len(history)
+        lookback = registry.lookback(self.size)
+        if lookback is None:
+            self.window = history[:]
+        else:
+            self.window = history[-lookback:] if lookback else []
+        self.results = {}
+        self.skipped = []
+
+    def get(self, name):
+        """Dự đoán của một model (tính một lần, các lần sau dùng lại)"""
+        if name in self.results:
+            return self.results[name]
+
+        spec = self.registry.specs[name]
+        if spec.alias_of:
+            result = self.get(spec.alias_of)
+        elif self.size < spec.min_lookback:
+            self.skipped.append(name)
+            result = None
+        else:
+            # Đặt trước None để chặn vòng lặp khi meta-model gọi ngược lại chính nó
+            self.results[name] = None
+            try:
+                result = spec.func(self.engine)
+            except Exception as e:
+                logger.error(f"Lỗi trong model {name}: {e}")
+                result = None
+
+        self.results[name] = result
+        return result
@@ -0,0 +1,94 @@
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+logger = logging.getLogger(__name__)
+
+# ------------------------- DEADLINE EVALUATOR -------------------------
+def serialized(lock, fn):
+    """Bọc nhóm `fn` để chạy khi giữ `lock` (khóa riêng của engine mà nhóm dùng).
+
+    Bên nạp dữ liệu giữ cùng khóa khi sửa engine, nên nhóm không bao giờ thấy
+    engine đang cập nhật dở, kể cả khi nhóm trễ hạn chạy nốt ở nền.
+    """
+    def run():
+        with lock:
+            return fn()
+    return run
+
+
+class DeadlineEvaluator:
+    """Chạy song song các nhóm model độc lập với hạn chót cho mỗi phiên.
+
+    Nhóm nào xong trước hạn chót thì kết quả được dùng để kết hợp; nhóm trễ
+    hạn được báo lại trong `missed` và vẫn chạy nốt ở nền. Một nhóm còn đang
+    chạy dở từ phiên trước sẽ không bị gửi lại (tránh dồn ứ luồng).
+
+    Nhóm chạy trong luồng của pool, không giữ khóa nào của bên gọi (app.lock
+    có thể đã nhả khi nhóm trễ hạn còn chạy). Nhóm đọc/ghi một engine dùng
+    chung phải tự giữ khóa riêng của engine đó, xem `serialized`.
+    """
+
+    def __init__(self, deadline=2.0, max_workers=4, name="model-eval"):
+        self.deadline = deadline
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self.inflight = {}
+        self.lock = threading.Lock()
+        self.last_missed = []
+        self.last_elapsed = 0.0
+        self.stats = {"runs": 0, "missed": 0, "errors": 0}
+
+    def run(self, groups, deadline=None):
+        """groups: dict {tên nhóm: hàm không tham số}.
+
+        Trả về (results, missed): results là dict {tên nhóm: kết quả} theo
+        đúng thứ tự của groups, missed là danh sách nhóm trễ hạn hoặc bận.
+        """
+        deadline = self.deadline if deadline is None else deadline
+        start = time.monotonic()
+        futures = {}
+        busy = []
+
+        with self.lock:
+            for name, fn in groups.items():
+                previous = self.inflight.get(name)
+                if previous is not None and not previous.done():
+                    busy.append(name)
+                    continue
+                future = self.executor.submit(fn)
+                self.inflight[name] = future
+                futures[future] = name
+
+        done, _ = wait(futures, timeout=deadline)
+
+        finished = {}
+        for future in done:
+            name = futures[future]
+            try:
+                finished[name] = future.result()
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.error(f"❌ Nhóm model {name} lỗi: {e}")
+
+        results = {name: finished[name] for name in groups if name in finished}
+        late = {name for future, name in futures.items() if future not in done}
+        missed = [name for name in groups if name in late or name in busy]
+
+        self.stats["runs"] += 1
+        self.stats["missed"] += len(missed)
+        self.last_missed = missed
+        self.last_elapsed = time.monotonic() - start
+        if missed:
+            logger.warning(f"⏱️ Trễ hạn {deadline}s: {', '.join(missed)}")
+        return results, missed
+
+    def status(self):
+        """Thông tin cho endpoint health/debug"""
+        return {
+            "deadline": self.deadline,
+            "last_missed": self.last_missed,
+            "last_elapsed_ms": round(self.last_elapsed * 1000, 2),
+            "inflight": [name for name, f in self.inflight.items() if not f.done()],
+            **self.stats,
+        }
@@ -0,0 +1,171 @@
+import os
+import math
+import time
+import threading
+from collections import Counter, OrderedDict
+from flask import g, request
+from werkzeug.middleware.proxy_fix import ProxyFix
+from fast_json import json_response
+
+# ------------------------- RATE LIMIT -------------------------
+# Mọi hạn mức tính theo từng tiến trình: chạy N worker qua serve.py thì hạn mức
+# thực tế của một client gấp N lần giá trị cấu hình.
+# Hạn mức chung mỗi client: RATE token/giây, dồn tối đa BURST token (mặc định tắt; ví dụ RATE=5, BURST=20)
+RATE_LIMIT_RATE = float(os.getenv("RATE_LIMIT_RATE", "0"))
+RATE_LIMIT_BURST = float(os.getenv("RATE_LIMIT_BURST", "20"))
+# Hạn mức riêng, chặt hơn, cho endpoint tốn kém (gọi AI, batch); mặc định tắt (0.1 = 6 request/phút)
+EXPENSIVE_RATE = float(os.getenv("RATE_LIMIT_EXPENSIVE_RATE", "0"))
+EXPENSIVE_BURST = float(os.getenv("RATE_LIMIT_EXPENSIVE_BURST", "3"))
+# Số request xử lý đồng thời tối đa của tiến trình (0 = không giới hạn)
+RATE_LIMIT_CONCURRENCY = int(os.getenv("RATE_LIMIT_CONCURRENCY", "32"))
+# Số client được nhớ bucket (client lâu không gọi bị bỏ trước)
+RATE_LIMIT_CLIENTS = int(os.getenv("RATE_LIMIT_CLIENTS", "10000"))
+# Số reverse proxy tin cậy đứng trước app: lấy địa chỉ client từ X-Forwarded-For qua ProxyFix.
+# Sau proxy mà để 0 thì mọi client dùng chung một bucket (địa chỉ của proxy).
+# RATE_LIMIT_TRUST_PROXY=1 cũ tương đương 1 proxy.
+RATE_LIMIT_PROXY_HOPS = int(os.getenv("RATE_LIMIT_PROXY_HOPS") or os.getenv("RATE_LIMIT_TRUST_PROXY", "0"))
+# Health check của load balancer không tính hạn mức; luồng SSE không giữ chỗ đồng thời
+EXEMPT_PATHS = ("/api/health",)
+STREAM_PATHS = ("/api/stream",)
+
+
+def client_id():
+    """Khóa client của request hiện tại (remote_addr đã qua ProxyFix nếu có proxy tin cậy)"""
+    return request.remote_addr or "-"
+
+
+class TokenBuckets:
+    """Token bucket theo client: nạp `rate` token/giây, chứa tối đa `burst` token.
+
+    Mỗi client chỉ giữ cặp (số token, thời điểm cập nhật); token được nạp bù
+    lười khi client gọi tới nên không cần luồng nền. Bảng client là LRU có
+    giới hạn để client giả mạo địa chỉ không làm phình bộ nhớ.
+    """
+
+    def __init__(self, rate, burst, max_clients=RATE_LIMIT_CLIENTS):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self.buckets = OrderedDict()
+        self.lock = threading.Lock()
+
+    def take(self, client, cost=1.0):
+        """(True, 0) nếu còn token; (False, số giây cần chờ) nếu hết"""
+        now = time.monotonic()
+        with self.lock:
+            tokens, stamp = self.buckets.pop(client, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - stamp) * self.rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self.buckets[client] = (tokens, now)
+            if len(self.buckets) > self.max_clients:
+                self.buckets.popitem(last=False)
+        if allowed:
+            return True, 0
+        return False, (cost - tokens) / self.rate if self.rate > 0 else 60
+
+    def refund(self, client, cost=1.0):
+        """Trả lại token đã lấy cho request bị từ chối ở bước sau"""
+        with self.lock:
+            entry = self.buckets.get(client)
+            if entry is not None:
+                self.buckets[client] = (min(self.burst, entry[0] + cost), entry[1])
+
+    def status(self):
+        return {"rate": self.rate, "burst": self.burst, "clients": len(self.buckets)}
+
+
+def expensive_budget():
+    """Bucket chặt hơn cho một endpoint tốn kém (mỗi endpoint một bucket riêng; None khi tắt)"""
+    return TokenBuckets(EXPENSIVE_RATE, EXPENSIVE_BURST) if EXPENSIVE_RATE > 0 else None
+
+
+class LoadShedder:
+    """Từ chối sớm bằng 429 trong before_request, trước mọi khóa và model.
+
+    Mỗi request phải qua lần lượt: bucket chung của client, bucket riêng của
+    endpoint (nếu có trong `routes`) và giới hạn số request đồng thời của
+    tiến trình. Request bị bucket chung từ chối không tốn token của endpoint;
+    bị từ chối vì hết chỗ đồng thời thì token của endpoint được trả lại. Chỗ
+    đồng thời được trả lại trong teardown_request.
+
+    Hạn mức theo client mặc định tắt, chỉ bật khi cấu hình RATE_LIMIT_*; sau
+    reverse proxy cần đặt RATE_LIMIT_PROXY_HOPS để mỗi client có bucket riêng.
+    Bucket và chỗ đồng thời nằm trong bộ nhớ của từng worker, không chia sẻ.
+    """
+
+    def __init__(self, routes=None, rate=RATE_LIMIT_RATE, burst=RATE_LIMIT_BURST,
+                 concurrency=RATE_LIMIT_CONCURRENCY, exempt=EXEMPT_PATHS, streams=STREAM_PATHS,
+                 proxy_hops=RATE_LIMIT_PROXY_HOPS):
+        self.buckets = TokenBuckets(rate, burst) if rate > 0 else None
+        self.routes = {path: buckets for path, buckets in (routes or {}).items() if buckets is not None}
+        self.proxy_hops = proxy_hops
+        self.concurrency = concurrency
+        self.slots = threading.BoundedSemaphore(concurrency) if concurrency > 0 else None
+        self.inflight = 0
+        self.lock = threading.Lock()
+        self.exempt = exempt
+        self.streams = streams
+        self.rejected = Counter()
+        self.rejected_paths = Counter()
+        self.stats = {"admitted": 0}
+
+    def install(self, app):
+        if self.proxy_hops > 0:
+            # remote_addr lấy từ X-Forwarded-For do đúng `proxy_hops` proxy tin cậy thêm vào
+            app.wsgi_app = ProxyFix(app.wsgi_app, x_for=self.proxy_hops)
+        app.before_request(self.before_request)
+        app.teardown_request(self.teardown_request)
+        return self
+
+    def before_request(self):
+        path = request.path
+        if request.method == "OPTIONS" or path in self.exempt:
+            return None
+        client = client_id()
+
+        if self.buckets is not None:
+            allowed, wait = self.buckets.take(client)
+            if not allowed:
+                return self.reject("client", path, wait)
+        route = self.routes.get(path)
+        if route is not None:
+            allowed, wait = route.take(client)
+            if not allowed:
+                return self.reject("route", path, wait)
+        if self.slots is not None and path not in self.streams:
+            if not self.slots.acquire(blocking=False):
+                if route is not None:
+                    route.refund(client)
+                return self.reject("concurrency", path, 1)
+            g.rate_limit_slot = True
+            with self.lock:
+                self.inflight += 1
+        self.stats["admitted"] += 1
+        return None
+
+    def teardown_request(self, exc=None):
+        if g.pop("rate_limit_slot", False):
+            with self.lock:
+                self.inflight -= 1
+            self.slots.release()
+
+    def reject(self, reason, path, wait):
+        self.rejected[reason] += 1
+        self.rejected_paths[path] += 1
+        return json_response({"error": "Quá nhiều request, thử lại sau", "reason": reason}, status=429,
+                             headers={"Retry-After": str(max(1, math.ceil(wait)))})
+
+    def status(self):
+        """Thông tin cho endpoint health/debug"""
+        return {
+            "client_budget": self.buckets.status() if self.buckets is not None else None,
+            "route_budgets": {path: buckets.status() for path, buckets in self.routes.items()},
+            "concurrency": self.concurrency,
+            "proxy_hops": self.proxy_hops,
+            "inflight": self.inflight,
+            "rejected": dict(self.rejected),
+            "rejected_paths": dict(self.rejected_paths),
+            **self.stats,
+        }
@@ -0,0 +1,27 @@
+# ------------------------- RESPONSE FIELDS -------------------------
+# Chọn trường trả về cho các endpoint dự đoán:
+#   ?fields=prediction,confidence  -> chỉ trả các khóa được liệt kê
+#   ?detail=full                   -> kèm phần chi tiết từng model (nặng)
+
+
+def parse_fields(args):
+    """Đọc ?fields= thành tập tên khóa (None nếu không chỉ định)"""
+    raw = args.get("fields", "")
+    fields = {name.strip() for name in raw.split(",") if name.strip()}
+    return fields or None
+
+
+def detail_requested(args, *detail_keys):
+    """Chi tiết chỉ được dựng khi ?detail=full hoặc ?fields= có khóa chi tiết"""
+    if args.get("detail", "").lower() == "full":
+        return True
+    fields = parse_fields(args)
+    return bool(fields and fields.intersection(detail_keys))
+
+
+def select_fields(data, args):
+    """Lọc dict phản hồi theo ?fields= (giữ nguyên nếu không chỉ định)"""
+    fields = parse_fields(args)
+    if not fields:
+        return data
+    return {key: value for key, value in data.items() if key in fields}
@@ -0,0 +1,96 @@
+"""Chế độ chạy production nhiều worker cho các server 1.py..9.py.
+
+    APP_SCRIPT=7.py gunicorn -w 4 -b 0.0.0.0:9099 serve:app
+    APP_SCRIPT=7.py uvicorn serve:asgi_app --workers 4 --port 9099   (cần asgiref)
+
+Mỗi worker nạp script riêng (không dùng --preload: khóa leader và luồng nền
+phải được tạo trong từng worker). Đúng một worker giữ khóa file và làm leader:
+chạy poller, model và hub WebSocket như khi chạy `python 7.py`, rồi ghi trạng
+thái đã công bố (JSON) vào thư mục riêng 0700 của dịch vụ trong /dev/shm sau
+mỗi phiên. Các worker còn lại chỉ phục vụ đọc từ trạng thái đó. Leader chết thì
+worker kế tiếp lấy được khóa sẽ nạp lịch sử đã sao, dựng lại model và tiếp tục
+nạp dữ liệu.
+
+Hạn mức của rate_limit (RATE_LIMIT_*) tính riêng trong từng worker: với N worker
+một client được tối đa N lần hạn mức cấu hình. Chạy sau reverse proxy thì đặt
+RATE_LIMIT_PROXY_HOPS để phân biệt client theo X-Forwarded-For.
+"""
+import os
+import logging
+import importlib.util
+
+from leader import LeaderElection, StateMirror, private_dir
+
+APP_SCRIPT = os.getenv("APP_SCRIPT", "7.py")
+SCRIPT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), APP_SCRIPT)
+SCRIPT_NAME = os.path.splitext(os.path.basename(SCRIPT_PATH))[0]
+# File khóa và file trạng thái nằm trong thư mục riêng của dịch vụ, không ở thẳng /dev/shm
+SERVICE_DIR = private_dir(SCRIPT_NAME)
+LEADER_LOCK = os.getenv("LEADER_LOCK") or os.path.join(SERVICE_DIR, "leader.lock")
+STATE_FILE = os.getenv("STATE_FILE") or os.path.join(SERVICE_DIR, "state.json")
+
+# ETag phải giống nhau giữa các worker: mặc định lấy theo thời điểm sửa script thay vì lúc khởi động
+os.environ.setdefault("ENGINE_VERSION", format(int(os.stat(SCRIPT_PATH).st_mtime), "x"))
+
+spec = importlib.util.spec_from_file_location(f"taixiu_{SCRIPT_NAME}", SCRIPT_PATH)
+script = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(script)
+if not hasattr(script, "start_ingestion"):
+    raise RuntimeError(f"{APP_SCRIPT} không hỗ trợ chế độ nhiều worker (thiếu start_ingestion)")
+
+app = script.app
+
+try:
+    from asgiref.wsgi import WsgiToAsgi
+except ImportError:  # Gói tùy chọn: chỉ cần khi chạy bằng server ASGI
+    WsgiToAsgi = None
+asgi_app = WsgiToAsgi(app) if WsgiToAsgi is not None else None
+
+
+# ---------- FOLLOWER ----------
+def on_mirror_load(state, snapshot):
+    """Worker theo sau: phát sự kiện SSE và cập nhật ETag như khi tự nạp phiên"""
+    if snapshot is not None:
+        script.session_events.publish(snapshot.sid, snapshot.compact())
+    if state.session_ids:
+        script.conditional.clock.tick(state.session_ids[-1])
+
+
+mirror = StateMirror(STATE_FILE, app.state, script.prediction_snapshots, on_load=on_mirror_load)
+
+
+# ---------- LEADER ----------
+def on_elected():
+    """Nhận quyền nạp dữ liệu: nối tiếp từ trạng thái đã sao rồi chạy poller"""
+    mirror.stop()
+    mirror.load()
+    state = app.state.current
+    with app.lock:
+        app.history = list(state.history)
+        app.session_ids = list(state.session_ids)
+        app.session_details = [dict(detail) for detail in state.session_details]
+    snapshots = script.prediction_snapshots
+    if snapshots.current is not None:
+        snapshots.revision = snapshots.current.revision
+    app.state.add_listener(mirror.export)
+    snapshots.add_listener(mirror.export)
+    mirror.export()
+    logging.info(f"👑 Worker {os.getpid()} nạp dữ liệu từ {len(state.session_ids)} phiên đã sao")
+    script.start_ingestion()
+
+
+election = LeaderElection(LEADER_LOCK, on_elected)
+mirror.follow()
+election.start()
+
+
+@app.route("/api/cluster", methods=["GET"])
+def cluster_status():
+    """Vai trò của worker trả lời request và trạng thái đồng bộ"""
+    return script.json_response({
+        "script": APP_SCRIPT,
+        "election": election.status(),
+        "mirror": mirror.status(),
+        "app_state": app.state.status(),
+        "prediction_snapshot": script.prediction_snapshots.status(),
+    })
@@ -0,0 +1,35 @@
+import hashlib
+
+# ------------------------- SESSION RNG -------------------------
+_SCALE = float(1 << 64)
+
+
+def session_seed(table, sid, tag=""):
+    """Sinh số nguyên 64-bit ổn định từ (bàn, phiên, nhãn)"""
+    key = f"{table}|{sid}|{tag}".encode("utf-8")
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "big")
+
+
+class SessionRNG:
+    """Nguồn ngẫu nhiên tất định cho từng engine.
+
+    Mỗi lần rút là hàm thuần của (bàn, phiên hiện tại, nhãn của model), nên
+    cùng một trạng thái phiên luôn cho cùng một dự đoán — giữa các request,
+    giữa các worker và khi chạy backtest — bất kể thứ tự gọi các model.
+    """
+
+    def __init__(self, table, sid=None):
+        self.table = table
+        self.sid = sid
+
+    def set_session(self, sid):
+        """Chuyển sang phiên mới; các lần rút sau phụ thuộc sid này"""
+        self.sid = sid
+
+    def random(self, tag=""):
+        """Số thực trong [0, 1) cố định theo (bàn, phiên, nhãn)"""
+        return session_seed(self.table, self.sid, tag) / _SCALE
+
+    def choice(self, options, tag=""):
+        """Chọn một phần tử cố định theo (bàn, phiên, nhãn)"""
+        return options[session_seed(self.table, self.sid, tag) % len(options)]
@@ -0,0 +1,50 @@
+import threading
+from concurrent.futures import Future
+
+# ------------------------- SINGLE FLIGHT -------------------------
+class SingleFlight:
+    """Gộp các lời gọi đồng thời có cùng khóa thành một lần tính.
+
+    Người gọi đầu tiên cho một khóa (ví dụ phiên + prompt) thực hiện hàm;
+    những người gọi tới trong lúc đó chờ cùng một Future và nhận chung kết quả
+    (hoặc chung lỗi). Khi lời gọi kết thúc khóa được giải phóng, lần gọi sau
+    sẽ tính lại - việc giữ kết quả lâu hơn là nhiệm vụ của cache.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.stats = {"calls": 0, "shared": 0, "errors": 0}
+
+    def do(self, key, fn):
+        """Chạy fn() một lần cho mọi người gọi đồng thời cùng `key`"""
+        with self.lock:
+            future = self.calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self.calls[key] = future
+                self.stats["calls"] += 1
+            else:
+                self.stats["shared"] += 1
+
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            self.stats["errors"] += 1
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self.lock:
+                del self.calls[key]
+
+    def status(self):
+        """Thông tin cho endpoint health/debug"""
+        with self.lock:
+            return {"inflight": len(self.calls), **self.stats}
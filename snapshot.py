@@ -0,0 +1,104 @@
+import json
+import time
+import threading
+from fast_json import dumps
+from response_fields import detail_requested, parse_fields, select_fields
+
+# ------------------------- PREDICTION SNAPSHOT -------------------------
+# Giá trị giữ chỗ cho current_time trong bản JSON dựng sẵn
+TIME_PLACEHOLDER = "\x00"
+TIME_TOKEN = dumps(TIME_PLACEHOLDER).strip()
+
+
+class Snapshot:
+    """Phản hồi /api/hitclub của một phiên, dựng một lần và không đổi sau đó.
+
+    Bản gọn (không có phần chi tiết) được serialize sẵn thành hai nửa bytes
+    quanh current_time; mỗi request chỉ ghép thêm chuỗi thời gian. Yêu cầu
+    ?fields= hoặc ?detail=full được dựng từ `data` đã lưu, không tính lại.
+    `revision` tăng mỗi lần công bố (kể cả dựng lại trong cùng phiên);
+    `provisional` là True khi còn trường *_status đang "pending".
+    """
+
+    __slots__ = ("sid", "data", "detail_keys", "revision", "published_at", "provisional",
+                 "head", "tail", "rendered")
+
+    def __init__(self, sid, data, detail_keys=(), revision=0):
+        self.sid = sid
+        self.data = data
+        self.detail_keys = tuple(detail_keys)
+        self.revision = revision
+        self.published_at = time.time()
+        self.provisional = any(key.endswith("_status") and value == "pending" for key, value in data.items())
+        compact = self.compact()
+        compact["current_time"] = TIME_PLACEHOLDER
+        self.head, self.tail = dumps(compact).split(TIME_TOKEN, 1)
+        self.rendered = (None, None)
+
+    def render(self, now_str):
+        """Bytes của bản gọn với current_time = now_str (nhớ lại trong cùng một giây)"""
+        cached_time, body = self.rendered
+        if cached_time != now_str:
+            body = self.head + json.dumps(now_str).encode() + self.tail
+            self.rendered = (now_str, body)
+        return body
+
+    def compact(self):
+        """Bản sao dữ liệu không có phần chi tiết (và không có current_time)"""
+        return {key: value for key, value in self.data.items() if key not in self.detail_keys}
+
+    def body(self, args, now_str):
+        """Bytes phản hồi cho tham số request `args`"""
+        if not parse_fields(args) and not detail_requested(args, *self.detail_keys):
+            return self.render(now_str)
+        data = self.compact()
+        if detail_requested(args, *self.detail_keys):
+            data.update((key, self.data[key]) for key in self.detail_keys if key in self.data)
+        data["current_time"] = now_str
+        return dumps(select_fields(data, args))
+
+
+class SnapshotPublisher:
+    """Giữ bản chụp mới nhất; ghi bằng một phép gán tham chiếu nên đọc không cần khóa.
+
+    Hàm đăng ký qua `add_listener` được gọi với bản chụp mới sau mỗi lần công bố.
+    """
+
+    def __init__(self, detail_keys=()):
+        self.detail_keys = tuple(detail_keys)
+        self.current = None
+        self.listeners = []
+        self.revision = 0
+        self.lock = threading.Lock()
+        self.stats = {"published": 0, "republished": 0}
+
+    def publish(self, sid, data):
+        with self.lock:
+            previous = self.current
+            # Không để bản của phiên cũ (tính xong muộn) đè lên phiên mới hơn
+            if previous is not None and previous.sid > sid:
+                return previous
+            self.revision += 1
+            snapshot = Snapshot(sid, data, self.detail_keys, self.revision)
+            self.current = snapshot
+            self.stats["republished" if previous is not None and previous.sid == sid else "published"] += 1
+        for listener in self.listeners:
+            listener(snapshot)
+        return snapshot
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def get(self, sid):
+        """Bản chụp của phiên `sid` (None nếu chưa công bố)"""
+        snapshot = self.current
+        return snapshot if snapshot is not None and snapshot.sid == sid else None
+
+    def status(self):
+        """Thông tin cho endpoint health/debug"""
+        snapshot = self.current
+        return {
+            "sid": snapshot.sid if snapshot is not None else None,
+            "bytes": len(snapshot.head) + len(snapshot.tail) if snapshot is not None else 0,
+            **self.stats,
+        }
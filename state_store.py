@@ -0,0 +1,130 @@
+import os
+import copy
+import time
+import threading
+from collections import deque
+
+# ------------------------- STATE STORE -------------------------
+# Số mẫu thời gian chờ khóa giữ lại để tính p95
+LOCK_WAIT_SAMPLES = int(os.getenv("LOCK_WAIT_SAMPLES", "1000"))
+
+
+class AppState:
+    """Bản chụp bất biến của dữ liệu ứng dụng tại một phiên.
+
+    history/session_ids là tuple (cũ nhất trước), session_details là tuple
+    các dict đã sao chép (mới nhất trước). `views` chứa dữ liệu dựng sẵn cho
+    các endpoint thống kê, đã sao chép sâu nên không đổi theo hệ thống gốc.
+    """
+
+    __slots__ = ("version", "published_at", "history", "session_ids", "session_details", "views")
+
+    def __init__(self, version=0, history=(), session_ids=(), session_details=(), views=None):
+        self.version = version
+        self.published_at = time.time()
+        self.history = history
+        self.session_ids = session_ids
+        self.session_details = session_details
+        self.views = views or {}
+
+    def view(self, name, default=None):
+        return self.views.get(name, default)
+
+
+class StateStore:
+    """Công bố trạng thái kiểu copy-on-write cho các endpoint đọc.
+
+    Bên ghi (poller, đang giữ app.lock) dựng một AppState mới sau mỗi phiên
+    rồi thay tham chiếu `current` bằng một phép gán; bên đọc chỉ lấy
+    `app.state.current` một lần rồi dùng, không cần khóa và không bao giờ
+    thấy trạng thái ghi dở. Hàm đăng ký qua `add_listener` được gọi với
+    AppState mới sau mỗi lần công bố (ví dụ để sao trạng thái sang worker khác).
+    """
+
+    def __init__(self):
+        self.current = AppState()
+        self.lock = threading.Lock()
+        self.listeners = []
+
+    def publish(self, history, session_ids, session_details, **views):
+        with self.lock:
+            state = AppState(
+                self.current.version + 1,
+                tuple(history),
+                tuple(session_ids),
+                tuple(dict(detail) for detail in session_details),
+                copy.deepcopy(views)
+            )
+            self.current = state
+        for listener in self.listeners:
+            listener(state)
+        return state
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def status(self):
+        """Thông tin cho endpoint health/debug"""
+        state = self.current
+        return {
+            "version": state.version,
+            "sessions": len(state.session_ids),
+            "age": round(time.time() - state.published_at, 3),
+        }
+
+
+class TimedLock:
+    """threading.Lock có đo thời gian chờ để so sánh tranh chấp khóa trước/sau"""
+
+    def __init__(self, samples=LOCK_WAIT_SAMPLES):
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.waits = deque(maxlen=samples)
+        self.acquired = 0
+        self.contended = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def acquire(self, blocking=True, timeout=-1):
+        if self._lock.acquire(False):
+            wait = 0.0
+        else:
+            if not blocking:
+                return False
+            start = time.perf_counter()
+            if not self._lock.acquire(True, timeout):
+                return False
+            wait = time.perf_counter() - start
+        with self._stats_lock:
+            self.acquired += 1
+            if wait:
+                self.contended += 1
+                self.total_wait += wait
+                self.max_wait = max(self.max_wait, wait)
+            self.waits.append(wait)
+        return True
+
+    def release(self):
+        self._lock.release()
+
+    def locked(self):
+        return self._lock.locked()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+    def status(self):
+        """Thông tin cho endpoint health/debug (thời gian tính bằng ms)"""
+        with self._stats_lock:
+            waits = sorted(self.waits)
+            return {
+                "acquired": self.acquired,
+                "contended": self.contended,
+                "total_wait_ms": round(self.total_wait * 1000, 3),
+                "max_wait_ms": round(self.max_wait * 1000, 3),
+                "p95_wait_ms": round(waits[int(0.95 * (len(waits) - 1))] * 1000, 3) if waits else 0,
+            }
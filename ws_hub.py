@@ -0,0 +1,181 @@
+import os
+import json
+import asyncio
+import logging
+import threading
+
+try:
+    import websockets
+except ImportError:  # Gói tùy chọn: thiếu thì hub không khởi động, phần còn lại vẫn chạy
+    websockets = None
+
+logger = logging.getLogger(__name__)
+
+# ------------------------- WEBSOCKET HUB -------------------------
+# Cổng WebSocket (0 = tắt hub)
+WS_HOST = os.getenv("WS_HOST", "0.0.0.0")
+WS_PORT = int(os.getenv("WS_PORT", "0"))
+# Số khung tối đa chờ gửi cho mỗi client; đầy thì client bị ngắt (mã 1013)
+WS_CLIENT_QUEUE = int(os.getenv("WS_CLIENT_QUEUE", "16"))
+# Số kết nối tối đa; vượt quá thì từ chối ngay khi bắt tay xong
+WS_MAX_CLIENTS = int(os.getenv("WS_MAX_CLIENTS", "10000"))
+
+
+def ws_frame(event_id, event, table, engine, data):
+    """Khung văn bản gửi cho client (JSON ensure_ascii nên mã hóa UTF-8 chỉ là sao chép)"""
+    return json.dumps({"type": event, "id": event_id, "table": table, "engine": engine, "data": data},
+                      sort_keys=True, separators=(",", ":"))
+
+
+class Subscription:
+    """Một kết nối WebSocket: bộ lọc bàn/engine và hàng đợi khung có giới hạn"""
+
+    __slots__ = ("connection", "queue", "tables", "engines", "dropped")
+
+    def __init__(self, connection, maxsize):
+        self.connection = connection
+        self.queue = asyncio.Queue(maxsize)
+        self.tables = None  # None = nhận tất cả
+        self.engines = None
+        self.dropped = False
+
+    def wants(self, table, engine):
+        return ((self.tables is None or table in self.tables)
+                and (self.engines is None or engine in self.engines))
+
+    def update(self, request):
+        """Thay bộ lọc theo yêu cầu {"action": "subscribe", "tables": [...], "engines": [...]}"""
+        tables = request.get("tables")
+        engines = request.get("engines")
+        self.tables = set(tables) if tables else None
+        self.engines = set(engines) if engines else None
+
+    def describe(self):
+        return {
+            "type": "subscribed",
+            "tables": sorted(self.tables) if self.tables is not None else None,
+            "engines": sorted(self.engines) if self.engines is not None else None,
+        }
+
+
+class WebSocketHub:
+    """Phát sự kiện phiên qua WebSocket cho nhiều client, có bộ lọc theo bàn/engine.
+
+    Server chạy trên event loop asyncio riêng trong một luồng nền. `publish`
+    được gọi từ luồng của poller: sự kiện được serialize một lần thành một
+    chuỗi rồi chuyển sang event loop, chuỗi đó được đưa nguyên vào hàng đợi
+    của mọi client khớp bộ lọc. Mỗi client có một coroutine ghi riêng nên
+    client chậm chỉ làm đầy hàng đợi của chính nó; đầy thì bị ngắt với mã 1013
+    thay vì làm chậm bên phát hay các client khác.
+    """
+
+    def __init__(self, table, engine, host=WS_HOST, port=WS_PORT, client_queue=WS_CLIENT_QUEUE,
+                 max_clients=WS_MAX_CLIENTS):
+        self.table = table
+        self.engine = engine
+        self.host = host
+        self.port = port
+        self.client_queue = client_queue
+        self.max_clients = max_clients
+        self.loop = None
+        self.subscriptions = set()
+        self.stats = {"published": 0, "sent": 0, "filtered": 0, "connected": 0, "dropped": 0, "rejected": 0}
+
+    def start(self):
+        """Chạy server trong luồng nền; trả về False nếu hub tắt hoặc thiếu gói websockets"""
+        if not self.port:
+            return False
+        if websockets is None:
+            logger.warning("⚠️ Đã đặt WS_PORT nhưng chưa cài gói websockets, bỏ qua WebSocket hub")
+            return False
+        ready = threading.Event()
+        threading.Thread(target=self._run, args=(ready,), name="ws-hub", daemon=True).start()
+        ready.wait(10)
+        return True
+
+    def _run(self, ready):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_until_complete(self._serve(ready))
+
+    async def _serve(self, ready):
+        async with websockets.serve(self._handle, self.host, self.port):
+            logger.info(f"🔌 WebSocket hub: ws://{self.host}:{self.port}")
+            ready.set()
+            await asyncio.Future()
+
+    def publish(self, event_id, event, data, table=None, engine=None):
+        """Gọi từ luồng bất kỳ (không chặn); bỏ qua khi hub chưa chạy"""
+        loop = self.loop
+        if loop is None:
+            return
+        table = table or self.table
+        engine = engine or self.engine
+        frame = ws_frame(event_id, event, table, engine, data)
+        loop.call_soon_threadsafe(self._broadcast, frame, table, engine)
+
+    def _broadcast(self, frame, table, engine):
+        self.stats["published"] += 1
+        for subscription in list(self.subscriptions):
+            if not subscription.wants(table, engine):
+                self.stats["filtered"] += 1
+                continue
+            try:
+                subscription.queue.put_nowait(frame)
+            except asyncio.QueueFull:
+                self._drop(subscription)
+
+    def _drop(self, subscription):
+        subscription.dropped = True
+        self.subscriptions.discard(subscription)
+        self.stats["dropped"] += 1
+        self.loop.create_task(subscription.connection.close(1013, "client quá chậm"))
+
+    async def _handle(self, connection):
+        if len(self.subscriptions) >= self.max_clients:
+            self.stats["rejected"] += 1
+            await connection.close(1013, "hub đã đầy")
+            return
+        subscription = Subscription(connection, self.client_queue)
+        self.subscriptions.add(subscription)
+        self.stats["connected"] += 1
+        writer = asyncio.ensure_future(self._write(subscription))
+        try:
+            async for message in connection:
+                try:
+                    request = json.loads(message)
+                except ValueError:
+                    request = None
+                if not isinstance(request, dict) or request.get("action") != "subscribe":
+                    reply = {"type": "error", "error": "Yêu cầu không hợp lệ"}
+                else:
+                    subscription.update(request)
+                    reply = subscription.describe()
+                # Trả lời đi cùng hàng đợi với sự kiện để mỗi kết nối chỉ có một bên ghi
+                try:
+                    subscription.queue.put_nowait(json.dumps(reply))
+                except asyncio.QueueFull:
+                    pass
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            self.subscriptions.discard(subscription)
+            writer.cancel()
+
+    async def _write(self, subscription):
+        try:
+            while not subscription.dropped:
+                frame = await subscription.queue.get()
+                await subscription.connection.send(frame)
+                self.stats["sent"] += 1
+        except websockets.ConnectionClosed:
+            pass
+
+    def status(self):
+        """Thông tin cho endpoint health/debug"""
+        return {
+            "enabled": self.loop is not None,
+            "port": self.port or None,
+            "clients": len(self.subscriptions),
+            **self.stats,
+        }